@@ -0,0 +1,6 @@
+""" Benchmarks of validation and packaging on synthetic multitracks.
+
+Usage:
+    python -m benchmarks.run --stems 8 --raws-per-stem 2 --duration 60
+    python -m benchmarks.compare benchmarks/results.jsonl
+"""
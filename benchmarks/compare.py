@@ -0,0 +1,111 @@
+""" Compare benchmark results recorded at two commits.
+
+Usage:
+    python -m benchmarks.compare [RESULTS] [--base COMMIT] [--head COMMIT]
+
+Only records with the same session parameters are compared. By default the
+two most recently recorded commits are compared.
+"""
+import sys
+import json
+import argparse
+from benchmarks.run import RESULTS_PATH
+
+
+def load_records(results_path):
+    """Read every record from a results file, oldest first.
+    """
+    with open(results_path, 'r') as fhandle:
+        return [json.loads(line) for line in fhandle if line.strip()]
+
+
+def latest_by_commit(records, params=None):
+    """Keep the latest record of each commit, optionally only those with
+    the given params.
+
+    Returns
+    -------
+    commits : list
+        Commits in the order they were first recorded.
+    latest : dict
+        commit -> its latest record.
+    """
+    commits = []
+    latest = {}
+    for record in records:
+        if params is not None and record['params'] != params:
+            continue
+        commit = record['commit']
+        if commit not in latest:
+            commits.append(commit)
+        latest[commit] = record
+    return commits, latest
+
+
+def compare(base, head):
+    """Tabulate the wall time of each benchmark in two records.
+
+    Returns
+    -------
+    rows : list
+        (name, base wall, head wall, head / base) for each benchmark in
+        both records, slowest first.
+    """
+    rows = []
+    for name in set(base['results']) & set(head['results']):
+        before = base['results'][name]['wall']
+        after = head['results'][name]['wall']
+        ratio = after / before if before > 0 else float('inf')
+        rows.append((name, before, after, ratio))
+    return sorted(rows, key=lambda row: -row[2])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Compare benchmark results of two commits."
+    )
+    parser.add_argument('results', nargs='?', default=RESULTS_PATH)
+    parser.add_argument('--base', default=None)
+    parser.add_argument('--head', default=None)
+    args = parser.parse_args(args)
+
+    records = load_records(args.results)
+    if not records:
+        sys.stderr.write("No results in {}.\n".format(args.results))
+        return 1
+
+    params = records[-1]['params']
+    if args.head is not None:
+        heads = [r for r in records if r['commit'] == args.head]
+        if not heads:
+            sys.stderr.write("No results for {}.\n".format(args.head))
+            return 1
+        params = heads[-1]['params']
+    commits, latest = latest_by_commit(records, params)
+
+    head = args.head or commits[-1]
+    base = args.base
+    if base is None:
+        earlier = [c for c in commits if c != head]
+        if not earlier:
+            sys.stderr.write("Only one commit has results for {}.\n".format(
+                json.dumps(params, sort_keys=True)
+            ))
+            return 1
+        base = earlier[-1]
+    if base not in latest:
+        sys.stderr.write("No comparable results for {}.\n".format(base))
+        return 1
+
+    sys.stdout.write("{} -> {} on {}\n".format(
+        base, head, json.dumps(params, sort_keys=True)
+    ))
+    for name, before, after, ratio in compare(latest[base], latest[head]):
+        sys.stdout.write("{:<18} {:>9.3f}s {:>9.3f}s {:>7.2f}x\n".format(
+            name, before, after, ratio
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+""" Time validation and packaging on a synthetic session and append the
+results, tagged with the current commit, to a JSON lines file.
+
+Usage:
+    python -m benchmarks.run [--stems N] [--raws-per-stem N] [--duration S]
+                             [--faults misaligned,silent] [--repeat N]
+                             [--output benchmarks/results.jsonl]
+"""
+import os
+import sys
+import gc
+import time
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from functools import partial
+from new_multitrack import audio_io, batch, validation
+from new_multitrack.multitrack_utils import process_data
+from benchmarks import synth
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+cpu_time = getattr(time, 'process_time', None) or time.clock
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'results.jsonl')
+
+
+def current_commit():
+    """Get the commit the working tree is at, or None outside git.
+    """
+    try:
+        out = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode('utf-8').strip()
+
+
+def measure(func):
+    """Run func once from cold caches.
+
+    Returns
+    -------
+    record : dict
+        'wall' : float, seconds elapsed.
+        'cpu' : float, CPU seconds used by this process.
+        'peak_bytes' : int or None, peak Python and NumPy allocation, None
+        where tracemalloc is unavailable.
+    """
+    audio_io.clear_cache()
+    audio_io.clear_pyramids()
+    gc.collect()
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+    wall = time.time()
+    cpu = cpu_time()
+    try:
+        func()
+    finally:
+        wall = time.time() - wall
+        cpu = cpu_time() - cpu
+        peak = None
+        if tracemalloc is not None:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return {'wall': wall, 'cpu': cpu, 'peak_bytes': peak}
+
+
+def benchmarks(session, save_path):
+    """The benchmarked calls on a session as returned by
+    batch.load_manifest, as (name, function) pairs.
+    """
+    stem_files = sorted(i['path'] for i in session['stem_info'].values())
+    raw_files = sorted(i['path'] for i in session['raw_info'].values())
+    mix_path = session['mix_path']
+    raw_info = session['raw_info']
+    stem_path = session['stem_path']
+    raw_path = session['raw_path']
+
+    def check_audio():
+        file_status = validation.check_audio(raw_path, stem_path, mix_path)
+        validation.create_problems(file_status)
+
+    def check_multitrack():
+        file_status = validation.check_multitrack(
+            raw_files, stem_files, mix_path, raw_info,
+            stem_info=session['stem_info']
+        )
+        validation.create_problems(file_status)
+
+    def package():
+        process_data(
+            save_path, session['metadata'], mix_path, session['stem_info'],
+            raw_info, session['ranking']
+        )
+
+    return [
+        ('check_audio', check_audio),
+        ('check_multitrack', check_multitrack),
+        ('find_silence', partial(validation.find_silence, mix_path)),
+        ('is_aligned', partial(
+            validation.is_aligned, raw_files, stem_files, raw_path,
+            stem_path, mix_path, raw_info
+        )),
+        ('is_included', partial(
+            validation.is_included, stem_files, raw_files, stem_path,
+            mix_path, raw_info
+        )),
+        ('alignment_table', partial(
+            validation.alignment_table, stem_files, mix_path, raw_info
+        )),
+        ('get_coeffs', partial(
+            validation.get_coeffs, stem_files, mix_path, False
+        )),
+        ('label_check', partial(
+            validation.label_check, session['stem_info'], raw_info
+        )),
+        ('process_data', package),
+    ]
+
+
+def run(n_stems=4, raws_per_stem=2, duration=30.0, faults=(), repeat=1,
+        only=None, workdir=None):
+    """Synthesise a session and benchmark every call on it.
+
+    Parameters
+    ----------
+    n_stems, raws_per_stem, duration, faults
+        See synth.make_session.
+    repeat : int
+        Number of runs per benchmark. The fastest is kept.
+    only : list or None
+        Names of the benchmarks to run. None runs all of them.
+    workdir : str or None
+        Folder to synthesise the session in, kept afterwards. None uses a
+        temporary folder.
+
+    Returns
+    -------
+    record : dict
+        'commit', 'timestamp', 'python', 'platform', 'params' and
+        'results' (benchmark name -> measure's record).
+    """
+    tmpdir = workdir or tempfile.mkdtemp()
+    try:
+        manifest = synth.make_session(
+            os.path.join(tmpdir, 'session'), n_stems, raws_per_stem,
+            duration, faults
+        )
+        session = batch.load_manifest(manifest)
+        save_path = os.path.join(tmpdir, 'out')
+        results = {}
+        for name, func in benchmarks(session, save_path):
+            if only is not None and name not in only:
+                continue
+            runs = []
+            for _ in range(repeat):
+                # packaging needs an empty folder to write to
+                if os.path.exists(save_path):
+                    shutil.rmtree(save_path)
+                os.mkdir(save_path)
+                runs.append(measure(func))
+            results[name] = min(runs, key=lambda r: r['wall'])
+    finally:
+        if workdir is None:
+            shutil.rmtree(tmpdir)
+
+    return {
+        'commit': current_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            'n_stems': n_stems,
+            'raws_per_stem': raws_per_stem,
+            'duration': duration,
+            'faults': sorted(faults),
+        },
+        'results': results,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark validation on a synthetic multitrack."
+    )
+    parser.add_argument('--stems', type=int, default=4, dest='n_stems')
+    parser.add_argument('--raws-per-stem', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help="Length of every file in seconds.")
+    parser.add_argument('--faults', default='',
+                        help="Comma separated faults to inject, from: "
+                             "{}.".format(', '.join(synth.FAULTS)))
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--only', default=None,
+                        help="Comma separated benchmarks to run.")
+    parser.add_argument('--workdir', default=None,
+                        help="Folder to keep the synthetic session in.")
+    parser.add_argument('--output', default=RESULTS_PATH,
+                        help="JSON lines file to append results to.")
+    args = parser.parse_args(args)
+
+    faults = [f for f in args.faults.split(',') if f]
+    only = args.only.split(',') if args.only else None
+    record = run(args.n_stems, args.raws_per_stem, args.duration, faults,
+                 args.repeat, only, args.workdir)
+
+    with open(args.output, 'a') as fhandle:
+        fhandle.write(json.dumps(record, sort_keys=True) + '\n')
+
+    for name in sorted(record['results']):
+        result = record['results'][name]
+        peak = result['peak_bytes']
+        sys.stdout.write("{:<18} {:>9.3f}s wall {:>9.3f}s cpu {:>10}\n".format(
+            name, result['wall'], result['cpu'],
+            '-' if peak is None else "{:.1f}MB".format(peak / 2.0 ** 20)
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+""" Synthetic multitrack sessions of any size, with optional faults.
+
+Every raw is a mono 44.1k/16 bit tone with a noise burst envelope, every
+stem is the stereo sum of its raws and the mix is the sum of the stems, so
+a fault-free session passes validation.
+"""
+import os
+import json
+import numpy as np
+from scipy.io import wavfile
+
+
+SR = 44100
+
+# Faults make_session can inject, each into the first stem or raw:
+#   misaligned:     the first stem is delayed by MISALIGNMENT seconds.
+#   silent:         the first raw is digital silence.
+#   silent_section: the mix (and the sources under it) drop out for
+#                   SILENT_SECTION seconds in the middle.
+#   wrong_format:   the first raw is written at 22.05k.
+#   duplicate:      a copy of the first stem is added under another name.
+FAULTS = ['misaligned', 'silent', 'silent_section', 'wrong_format',
+          'duplicate']
+MISALIGNMENT = 0.5
+SILENT_SECTION = 6.0
+
+INSTRUMENTS = [
+    ('electric bass', 'bass'),
+    ('distorted electric guitar', 'melody'),
+    ('piano', 'melody'),
+    ('drum set', ''),
+    ('violin', 'melody'),
+    ('male singer', 'melody'),
+]
+
+
+def synth_raw(n_frames, seed):
+    """A tone whose pitch and envelope depend on seed, in [-1, 1].
+    """
+    rng = np.random.RandomState(seed)
+    t = np.arange(n_frames) / float(SR)
+    freq = 55.0 * 2 ** (rng.randint(0, 48) / 12.0)
+    tone = np.sin(2 * np.pi * freq * t + rng.uniform(0, 2 * np.pi))
+    tone += 0.3 * rng.randn(n_frames)
+    # a burst every 0.25 to 1 second keeps alignment well defined
+    period = int(SR * rng.uniform(0.25, 1.0))
+    envelope = np.exp(-(np.arange(n_frames) % period) / (0.1 * SR))
+    return 0.5 * tone * envelope
+
+
+def to_int16(audio, peak):
+    return np.round(audio / peak * 0.9 * 32767).astype(np.int16)
+
+
+def make_session(out_dir, n_stems=4, raws_per_stem=2, duration=30.0,
+                 faults=(), seed=0):
+    """Write a session folder with Mix.wav, Stems/, Raw/ and a
+    manifest.json that batch.load_manifest can read.
+
+    Parameters
+    ----------
+    out_dir : str
+        Folder to write the session to. Created if missing.
+    n_stems : int
+        Number of stems.
+    raws_per_stem : int
+        Number of raws summed into each stem.
+    duration : float
+        Length of every file in seconds.
+    faults : list
+        Names from FAULTS to inject.
+    seed : int
+        Seed of the random audio.
+
+    Returns
+    -------
+    manifest_path : str
+        Path to the session's manifest.
+    """
+    for fault in faults:
+        if fault not in FAULTS:
+            raise ValueError("Unknown fault '{}'.".format(fault))
+
+    stem_dir = os.path.join(out_dir, 'Stems')
+    raw_dir = os.path.join(out_dir, 'Raw')
+    for folder in [stem_dir, raw_dir]:
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    n_frames = int(duration * SR)
+    gate = np.ones(n_frames)
+    if 'silent_section' in faults:
+        start = (n_frames - int(SILENT_SECTION * SR)) // 2
+        gate[start:start + int(SILENT_SECTION * SR)] = 0.0
+
+    raws = {}
+    stems = {}
+    stem_audio = []
+    for i in range(n_stems):
+        inst, component = INSTRUMENTS[i % len(INSTRUMENTS)]
+        stem = 'Stem{}.wav'.format(i + 1)
+        stems[stem] = {'inst': inst, 'component': component}
+        audio = np.zeros(n_frames)
+        for j in range(raws_per_stem):
+            raw = 'Raw{}_{}.wav'.format(i + 1, j + 1)
+            raws[raw] = {'inst': inst, 'stem': stem}
+            signal = synth_raw(n_frames, seed * 1000 + i * 100 + j) * gate
+            if 'silent' in faults and i == 0 and j == 0:
+                signal = np.zeros(n_frames)
+            raws[raw]['audio'] = signal
+            audio += signal
+        stem_audio.append(audio)
+
+    mix = np.sum(stem_audio, axis=0) if stem_audio else np.zeros(n_frames)
+    peak = max(np.max(np.abs(mix)), 1e-9)
+    for audio in stem_audio:
+        peak = max(peak, np.max(np.abs(audio)))
+
+    wavfile.write(
+        os.path.join(out_dir, 'Mix.wav'), SR,
+        to_int16(np.column_stack((mix, mix)), peak)
+    )
+    for i, audio in enumerate(stem_audio):
+        if 'misaligned' in faults and i == 0:
+            shift = int(MISALIGNMENT * SR)
+            audio = np.concatenate((np.zeros(shift), audio[:-shift]))
+        wavfile.write(
+            os.path.join(stem_dir, 'Stem{}.wav'.format(i + 1)), SR,
+            to_int16(np.column_stack((audio, audio)), peak)
+        )
+    for k, raw in enumerate(sorted(raws)):
+        audio = raws[raw].pop('audio')
+        sr = SR
+        if 'wrong_format' in faults and k == 0:
+            sr = SR // 2
+            audio = audio[::2]
+        wavfile.write(os.path.join(raw_dir, raw), sr, to_int16(audio, peak))
+
+    if 'duplicate' in faults and n_stems:
+        with open(os.path.join(stem_dir, 'Stem1.wav'), 'rb') as src:
+            with open(os.path.join(stem_dir, 'Stem1_copy.wav'), 'wb') as dst:
+                dst.write(src.read())
+        stems['Stem1_copy.wav'] = dict(stems['Stem1.wav'])
+
+    manifest = {
+        'mix': 'Mix.wav',
+        'stem_dir': 'Stems',
+        'raw_dir': 'Raw',
+        'metadata': {
+            'artist': 'Synthetic', 'title': 'Session {}'.format(seed),
+            'genre': 'Rock', 'origin': 'Independent Artist',
+            'instrumental': 'yes', 'excerpt': 'no', 'has_bleed': 'no',
+        },
+        'stems': stems,
+        'raws': raws,
+        'ranking': [[s, r + 1] for r, s in enumerate(
+            sorted(s for s in stems if stems[s]['component'] == 'melody')
+        )],
+    }
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    with open(manifest_path, 'w') as fhandle:
+        json.dump(manifest, fhandle, indent=2, sort_keys=True)
+    return manifest_path
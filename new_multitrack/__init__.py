@@ -1,3 +1,5 @@
 from . import multitrack_utils 
-from . import new_multitrack
 from . import validation
+
+# The GUI module needs PyQt4, so it is not imported with the package; use
+# "from new_multitrack import new_multitrack" where it is wanted.
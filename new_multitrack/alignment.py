@@ -0,0 +1,233 @@
+import numpy as np
+
+
+# Lag windows at most this wide are correlated directly, wider ones via FFT.
+DIRECT_MAX_LAGS = 32
+
+
+def _fft_size(n):
+    """Smallest power of two that is at least n.
+    """
+    return 1 << int(np.ceil(np.log2(max(n, 1))))
+
+
+def lag_range(len_x, len_y, max_lag):
+    """Get the lags that cross_correlation evaluates.
+
+    Parameters
+    ----------
+    len_x : int
+        Number of samples of the signal being aligned.
+    len_y : int
+        Number of samples of the reference signal.
+    max_lag : int
+        Largest absolute lag to evaluate. Lags without any overlap are left
+        out.
+
+    Returns
+    -------
+    lags : np.array
+        Lags in samples, in increasing order.
+    """
+    lo = max(-(len_y - 1), -max_lag)
+    hi = min(len_x - 1, max_lag)
+    return np.arange(lo, hi + 1)
+
+
+def cross_correlation(x, y, max_lag):
+    """Cross-correlate x against y. A positive lag means x is late
+    relative to y, i.e. correlation[lag] = sum_n x[n + lag] * y[n].
+
+    Narrow lag windows are computed directly in O(N * lags), everything
+    else with a single zero-padded real FFT in O(N log N).
+
+    Parameters
+    ----------
+    x : np.array
+        Signal being aligned.
+    y : np.array
+        Reference signal.
+    max_lag : int
+        Largest absolute lag to evaluate.
+
+    Returns
+    -------
+    lags : np.array
+        Lags in samples.
+    correlation : np.array
+        Cross-correlation value at each lag.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    lags = lag_range(len(x), len(y), max_lag)
+
+    if len(lags) <= DIRECT_MAX_LAGS:
+        correlation = np.empty(len(lags))
+        for i, lag in enumerate(lags):
+            start = max(0, -lag)
+            stop = min(len(y), len(x) - lag)
+            correlation[i] = np.dot(x[start + lag:stop + lag], y[start:stop])
+        return lags, correlation
+
+    n_fft = _fft_size(len(x) + len(y) - 1)
+    spectrum = np.fft.rfft(x, n_fft) * np.conj(np.fft.rfft(y, n_fft))
+    full = np.fft.irfft(spectrum, n_fft)
+    # negative lags wrap around to the end of the circular correlation
+    correlation = full[lags % n_fft]
+    return lags, correlation
+
+
+def window_offset(x, y, lead):
+    """Measure the offset of x relative to a window y of the reference,
+    where x extends past the window on either side. Only lags at which
+    the whole window overlaps x are searched, and each is scored by the
+    normalised correlation of the window with the part of x it overlaps.
+
+    Parameters
+    ----------
+    x : np.array
+        Signal being aligned, covering the window plus a margin.
+    y : np.array
+        Window of the reference signal.
+    lead : int
+        Number of samples x starts before the window.
+
+    Returns
+    -------
+    offset : int or None
+        Offset in samples of x relative to y, or None if x is shorter than
+        the window or either is silent.
+    confidence : float
+        Normalised correlation at the offset in [0, 1].
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n == 0 or len(x) < n:
+        return None, 0.0
+
+    lags, correlation = cross_correlation(x, y, max_lag=len(x) - n)
+    keep = lags >= 0
+    lags = lags[keep]
+    correlation = correlation[keep]
+
+    cumulative = np.concatenate(([0.0], np.cumsum(x ** 2)))
+    energy = np.sqrt((cumulative[lags + n] - cumulative[lags]) * np.dot(y, y))
+    score = np.zeros(len(lags))
+    nonzero = energy > 0
+    score[nonzero] = np.abs(correlation[nonzero]) / energy[nonzero]
+
+    peak = int(np.argmax(score))
+    if score[peak] == 0:
+        return None, 0.0
+    return int(lags[peak]) - lead, float(min(score[peak], 1.0))
+
+
+def vote_offset(offsets, confidences, tolerance=1):
+    """Combine per-window offsets into one, by confidence weighted vote.
+    Each window supports every candidate offset within tolerance of its
+    own.
+
+    Parameters
+    ----------
+    offsets : list
+        Offset measured in each window, None for windows without one.
+    confidences : list
+        Confidence of each offset.
+    tolerance : int
+        Largest difference in samples between offsets that agree.
+
+    Returns
+    -------
+    offset : int or None
+        Offset with the most support, or None if no window had one.
+    confidence : float
+        Mean confidence of the windows supporting offset.
+    """
+    votes = [(o, c) for o, c in zip(offsets, confidences) if o is not None]
+    if not votes:
+        return None, 0.0
+
+    best = None
+    for candidate, _ in votes:
+        support = [c for o, c in votes if abs(o - candidate) <= tolerance]
+        key = (sum(support), -abs(candidate))
+        if best is None or key > best[0]:
+            best = (key, candidate, np.mean(support))
+    return best[1], float(best[2])
+
+
+def correlation_size(length, max_lag):
+    """FFT size at which signals of up to length samples can be correlated
+    by batch_offsets at lags up to max_lag without wrapping around.
+    """
+    return _fft_size(length + max_lag)
+
+
+def spectra(signals, n_fft):
+    """Real FFT of each row of signals, zero-padded to n_fft.
+
+    Parameters
+    ----------
+    signals : np.array
+        Signals, shape = (n_signals, n).
+    n_fft : int
+        FFT size, see correlation_size.
+
+    Returns
+    -------
+    spectra : np.array
+        shape = (n_signals, n_fft // 2 + 1).
+    """
+    return np.fft.rfft(np.asarray(signals, dtype=np.float64), n_fft, axis=-1)
+
+
+def batch_offsets(signal_spectra, energies, reference_spectrum,
+                  reference_energy, n_fft, max_lag):
+    """Measure the offsets of many signals relative to one reference from
+    their precomputed spectra, with one batched inverse FFT. A positive
+    offset means the signal is late relative to the reference.
+
+    Parameters
+    ----------
+    signal_spectra : np.array
+        Spectra of the signals being aligned, as returned by spectra.
+    energies : np.array
+        Sum of squares of each signal.
+    reference_spectrum : np.array
+        Spectrum of the reference signal, at the same n_fft.
+    reference_energy : float
+        Sum of squares of the reference signal.
+    n_fft : int
+        FFT size the spectra were computed at.
+    max_lag : int
+        Largest absolute lag to search.
+
+    Returns
+    -------
+    offsets : list
+        Offset of each signal in samples, None if it or the reference is
+        silent.
+    confidences : list
+        Normalised correlation at each offset in [0, 1].
+    """
+    full = np.fft.irfft(
+        signal_spectra * np.conj(reference_spectrum), n_fft, axis=-1
+    )
+    lags = np.arange(-max_lag, max_lag + 1)
+    correlation = np.abs(full[:, lags % n_fft])
+    peaks = np.argmax(correlation, axis=1)
+
+    norms = np.sqrt(np.asarray(energies, dtype=np.float64) * reference_energy)
+    offsets = []
+    confidences = []
+    for row, peak in enumerate(peaks):
+        if norms[row] > 0:
+            offsets.append(int(lags[peak]))
+            confidences.append(
+                float(min(correlation[row, peak] / norms[row], 1.0))
+            )
+        else:
+            offsets.append(None)
+            confidences.append(0.0)
+    return offsets, confidences
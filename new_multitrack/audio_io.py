@@ -0,0 +1,732 @@
+import os
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+import numpy as np
+import scipy.signal
+from . import tracing
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# 24 bit samples have no numpy type; they are mapped as bytes and unpacked
+# to int32 a window at a time.
+PACKED_24 = 'packed24'
+
+# numpy sample type and full scale value for each (format, sample width).
+SAMPLE_TYPES = {
+    (WAVE_FORMAT_PCM, 1): ('u1', 128.0),
+    (WAVE_FORMAT_PCM, 2): ('<i2', 32768.0),
+    (WAVE_FORMAT_PCM, 3): (PACKED_24, 8388608.0),
+    (WAVE_FORMAT_PCM, 4): ('<i4', 2147483648.0),
+    (WAVE_FORMAT_IEEE_FLOAT, 4): ('<f4', 1.0),
+    (WAVE_FORMAT_IEEE_FLOAT, 8): ('<f8', 1.0),
+}
+
+# Half length (in input samples per unit of the larger resampling factor)
+# of the anti-aliasing filter scipy.signal.resample_poly designs.
+RESAMPLE_HALF_LEN = 10
+
+# Probe results and open readers for the current validation run, keyed by
+# absolute path. Each entry stores the (mtime, size) it was computed for so
+# that a file edited between runs is re-read instead of served stale.
+_PROBE_CACHE = {}
+_READER_CACHE = {}
+
+# Rates (Hz) of the mono signals in each file's pyramid, and of its power
+# envelope. Each pyramid is computed in one pass over the file and shared
+# by the silence, alignment and inclusion checks.
+PYRAMID_RATES = (4000, 1000)
+ENVELOPE_RATE = 100
+
+# Bytes of pyramids kept in memory before the least recently used ones are
+# evicted.
+PYRAMID_CACHE_BYTES = 2 ** 28
+
+# Pyramids keyed by (absolute path, mtime, size). Unlike probe results they
+# outlive clear_cache, since the signature already guards against stale
+# entries and the whole point is reuse across validation runs.
+_PYRAMID_CACHE = OrderedDict()
+_PYRAMID_LOCK = threading.Lock()
+_PYRAMID_DIR = None
+
+
+@tracing.traced
+def read_header(fpath):
+    """Parse the RIFF header of a wave file without decoding any audio.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to a wave file.
+
+    Returns
+    -------
+    info : dict
+        Header information. Keys = 'format_tag', 'channels', 'sampwidth',
+        'sample_rate', 'n_frames', 'duration', 'data_offset', 'data_size'.
+    """
+    file_size = os.path.getsize(fpath)
+
+    with open(fpath, 'rb') as fhandle:
+        riff_id, _, wave_id = struct.unpack('<4sI4s', fhandle.read(12))
+        if riff_id != b'RIFF' or wave_id != b'WAVE':
+            raise IOError("{} is not a RIFF/WAVE file.".format(fpath))
+
+        fmt = None
+        data_offset = None
+        data_size = 0
+
+        while True:
+            chunk_header = fhandle.read(8)
+            if len(chunk_header) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+
+            if chunk_id == b'fmt ':
+                fmt = fhandle.read(chunk_size)
+                if chunk_size % 2:
+                    fhandle.seek(1, 1)
+            elif chunk_id == b'data':
+                data_offset = fhandle.tell()
+                # truncated files and streamed headers can overstate the size
+                data_size = min(chunk_size, file_size - data_offset)
+                break
+            else:
+                fhandle.seek(chunk_size + chunk_size % 2, 1)
+
+    if fmt is None or data_offset is None:
+        raise IOError("{} is missing a fmt or data chunk.".format(fpath))
+
+    format_tag, channels, sample_rate, _, _, bits = struct.unpack(
+        '<HHIIHH', fmt[:16]
+    )
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        format_tag = struct.unpack('<H', fmt[24:26])[0]
+
+    sampwidth = (bits + 7) // 8
+    n_frames = data_size // (channels * sampwidth)
+
+    info = {
+        'format_tag': format_tag,
+        'channels': channels,
+        'sampwidth': sampwidth,
+        'sample_rate': sample_rate,
+        'n_frames': n_frames,
+        'duration': n_frames / float(sample_rate),
+        'data_offset': data_offset,
+        'data_size': data_size,
+    }
+    return info
+
+
+def _cached(cache, fpath, build):
+    """Look up fpath in a per-run cache, calling build(path) on a miss or
+    when the file changed on disk since it was cached.
+    """
+    key = os.path.abspath(fpath)
+    stat = os.stat(key)
+    signature = (stat.st_mtime, stat.st_size)
+
+    cached = cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    value = build(key)
+    cache[key] = (signature, value)
+    return value
+
+
+def probe(fpath):
+    """Get the header information of a wave file, reading the file at most
+    once per validation run.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to a wave file.
+
+    Returns
+    -------
+    info : dict
+        Header information, see read_header.
+    """
+    return _cached(_PROBE_CACHE, fpath, read_header)
+
+
+def is_supported(fpath):
+    """Check if WavReader can decode the samples of a wave file.
+    """
+    info = probe(fpath)
+    return (info['format_tag'], info['sampwidth']) in SAMPLE_TYPES
+
+
+def clear_cache():
+    """Forget all cached probe results and readers. Call at the start of a
+    validation run.
+    """
+    _PROBE_CACHE.clear()
+    _READER_CACHE.clear()
+
+
+class WavReader(object):
+    """Zero-copy access to the samples of a wave file, through a
+    numpy.memmap over its data chunk. Views index the map directly; only
+    the mono conversions allocate, and only for the requested window.
+    24 bit files are the exception: their windows are unpacked to int32.
+    """
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self.info = probe(fpath)
+
+        key = (self.info['format_tag'], self.info['sampwidth'])
+        if key not in SAMPLE_TYPES:
+            raise IOError(
+                "{} has an unsupported sample format.".format(fpath)
+            )
+        dtype, self.scale = SAMPLE_TYPES[key]
+        self.zero = self.scale if dtype == 'u1' else 0.0
+
+        self.n_frames = self.info['n_frames']
+        self.n_channels = self.info['channels']
+        shape = (self.n_frames, self.n_channels)
+        self.packed = dtype == PACKED_24
+        if self.packed:
+            dtype = 'u1'
+            shape = shape + (3,)
+        if self.n_frames == 0:
+            self.frames = np.zeros(shape, dtype=dtype)
+        else:
+            self.frames = np.memmap(
+                fpath, dtype=dtype, mode='r',
+                offset=self.info['data_offset'], shape=shape
+            )
+
+    def window(self, start=0, stop=None):
+        """Raw samples of frames [start, stop), shape = (n, n_channels).
+        """
+        window = self.frames[start:stop]
+        tracing.count_bytes(window.nbytes)
+        if self.packed:
+            return unpack_24(window)
+        return window
+
+    def channel(self, index, start=0, stop=None):
+        """Raw samples of one channel for frames [start, stop).
+        """
+        samples = self.frames[start:stop, index]
+        tracing.count_bytes(samples.nbytes)
+        if self.packed:
+            return unpack_24(samples)
+        return samples
+
+    def blocks(self, block_size, start=0, stop=None):
+        """Iterate over consecutive windows of at most block_size frames,
+        yielding (start frame, window).
+        """
+        if stop is None:
+            stop = self.n_frames
+        for block_start in range(start, stop, block_size):
+            yield block_start, self.window(
+                block_start, min(block_start + block_size, stop)
+            )
+
+    def mono_sum(self, start=0, stop=None):
+        """Sum of all channels in raw sample units for frames [start, stop).
+        """
+        window = self.window(start, stop)
+        return window.sum(axis=1, dtype=np.float64) - \
+            self.zero * self.n_channels
+
+    def mono(self, start=0, stop=None):
+        """Mean of all channels scaled to [-1, 1] for frames [start, stop).
+        """
+        return self.mono_sum(start, stop) / (self.scale * self.n_channels)
+
+    def to_float(self, window):
+        """Scale a window of raw samples to [-1, 1].
+        """
+        return (window - self.zero) / self.scale
+
+
+def unpack_24(packed):
+    """Unpack little endian 24 bit samples, the bytes of each in the last
+    axis of packed, to int32.
+    """
+    packed = packed.astype(np.int32)
+    samples = packed[..., 0] | (packed[..., 1] << 8) | (packed[..., 2] << 16)
+    return np.where(samples >= 2 ** 23, samples - 2 ** 24, samples)
+
+
+def open_wav(fpath):
+    """Get the shared reader of a wave file, mapping the file at most once
+    per validation run.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to a wave file.
+
+    Returns
+    -------
+    reader : WavReader
+        Reader over the file's samples.
+    """
+    return _cached(_READER_CACHE, fpath, WavReader)
+
+
+def resample_factors(orig_sr, target_sr):
+    """Get the smallest integer up/down factors converting orig_sr to
+    target_sr.
+
+    Parameters
+    ----------
+    orig_sr : int
+        Original sample rate.
+    target_sr : int
+        Target sample rate.
+
+    Returns
+    -------
+    up : int
+        Upsampling factor.
+    down : int
+        Downsampling factor.
+    """
+    orig_sr = int(orig_sr)
+    target_sr = int(target_sr)
+    divisor = gcd(orig_sr, target_sr)
+    return target_sr // divisor, orig_sr // divisor
+
+
+@tracing.traced
+def window_energy(fpath, starts, length, n_probes=8, probe_len=2048):
+    """Estimate the mean power of windows of a wave file from a few short
+    probes spread over each, reading only the probes from disk.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to a wave file.
+    starts : list
+        First frame of each window.
+    length : int
+        Number of frames in each window.
+    n_probes : int
+        Number of probes per window.
+    probe_len : int
+        Number of frames per probe.
+
+    Returns
+    -------
+    energy : np.array
+        Estimated mean power of the mono signal in each window.
+    """
+    reader = open_wav(fpath)
+    probe_len = min(probe_len, length)
+    step = max((length - probe_len) // max(n_probes - 1, 1), 1)
+    energy = np.zeros(len(starts))
+    for i, start in enumerate(starts):
+        power = [
+            np.mean(reader.mono(p, p + probe_len) ** 2)
+            for p in range(start, start + length - probe_len + 1, step)[:n_probes]
+        ]
+        energy[i] = np.mean(power) if power else 0.0
+    return energy
+
+
+def resample_pad(up, down):
+    """Number of input samples, a multiple of down, to pad a window with on
+    each side so resampling it matches resampling the whole signal.
+    """
+    return -(-RESAMPLE_HALF_LEN * max(up, down) // down) * down
+
+
+class StreamDecimator(object):
+    """Resample a signal that arrives in pieces of any size, producing the
+    same output as scipy.signal.resample_poly on the whole signal. Input is
+    buffered until a chunk plus the filter's padding is available, so only
+    a chunk and the (small) output are held in memory at once.
+    """
+    def __init__(self, orig_sr, sr, chunk_size=2 ** 18):
+        self.up, self.down = resample_factors(orig_sr, sr)
+        self.pad = resample_pad(self.up, self.down)
+        self.chunk_size = max(1, chunk_size // self.down) * self.down
+        self.buffer = np.zeros(0)
+        self.buffer_start = 0
+        self.next_start = 0
+        self.output = []
+
+    def _emit(self, stop):
+        """Resample frames [next_start, stop) using the buffered padding.
+        """
+        start = self.next_start
+        pad_before = min(self.pad, start)
+        buffer_stop = self.buffer_start + len(self.buffer)
+        pad_after = min(self.pad, buffer_stop - stop)
+
+        window = self.buffer[
+            start - pad_before - self.buffer_start:
+            stop + pad_after - self.buffer_start
+        ]
+        if self.up != self.down:
+            window = scipy.signal.resample_poly(window, self.up, self.down)
+        y_start = pad_before * self.up // self.down
+        y_stop = y_start + -(-(stop - start) * self.up // self.down)
+        self.output.append(window[y_start:y_stop])
+
+        self.next_start = stop
+        drop = max(stop - self.pad - self.buffer_start, 0)
+        self.buffer = self.buffer[drop:]
+        self.buffer_start += drop
+
+    def feed(self, samples):
+        """Append the next samples of the signal.
+        """
+        self.buffer = np.concatenate((self.buffer, samples))
+        buffer_stop = self.buffer_start + len(self.buffer)
+        while buffer_stop >= self.next_start + self.chunk_size + self.pad:
+            self._emit(self.next_start + self.chunk_size)
+
+    def finish(self):
+        """Resample what remains and return the whole resampled signal.
+        """
+        buffer_stop = self.buffer_start + len(self.buffer)
+        if buffer_stop > self.next_start:
+            self._emit(buffer_stop)
+        if not self.output:
+            return np.zeros(0)
+        return np.concatenate(self.output)
+
+
+@tracing.traced
+def load_sum(file_list, sr, offset=0.0, duration=None):
+    """Load the mono sum of several wave files at a new sample rate,
+    reading only the requested window from disk.
+
+    Parameters
+    ----------
+    file_list : list
+        List of wave files with equal sample rates.
+    sr : int
+        Sample rate to resample to.
+    offset : float
+        Start of the window in seconds.
+    duration : float or None
+        Length of the window in seconds. None reads to the end of the
+        longest file.
+
+    Returns
+    -------
+    y : np.array
+        Mono sum of the files at sample rate sr.
+    """
+    if sr in PYRAMID_RATES:
+        pyramids = [cached_pyramid(f) for f in file_list]
+        if all(p is not None for p in pyramids):
+            decimated = [p['mono'][sr] for p in pyramids]
+            return slice_sum(file_list, decimated, sr, offset, duration)
+
+    orig_sr = probe(file_list[0])['sample_rate']
+    n_frames = max(probe(f)['n_frames'] for f in file_list)
+    up, down = resample_factors(orig_sr, sr)
+
+    # Start on a multiple of the downsampling factor and pad by whole
+    # multiples of it, so the padding trims off an exact number of output
+    # samples and the window matches resampling the whole file.
+    start = int(round(offset * orig_sr)) // down * down
+    if duration is None:
+        stop = n_frames
+    else:
+        stop = min(n_frames, start + int(round(duration * orig_sr)))
+    pad = resample_pad(up, down)
+    pad_before = min(pad, start)
+    pad_after = min(pad, max(n_frames - stop, 0))
+
+    y = np.zeros(max(stop - start, 0) + pad_before + pad_after)
+    for fpath in file_list:
+        mono = open_wav(fpath).mono(start - pad_before, stop + pad_after)
+        y[:len(mono)] += mono
+
+    if up != down:
+        y = scipy.signal.resample_poly(y, up, down)
+    y_start = pad_before * up // down
+    y_stop = y_start + -(-max(stop - start, 0) * up // down)
+    return y[y_start:y_stop]
+
+
+def slice_sum(file_list, decimated, sr, offset=0.0, duration=None):
+    """load_sum from whole-file signals already resampled to sr, e.g. from
+    their pyramids. Matches load_sum except within a filter length of the
+    end of files shorter than the longest.
+    """
+    orig_sr = probe(file_list[0])['sample_rate']
+    n_frames = max(probe(f)['n_frames'] for f in file_list)
+    up, down = resample_factors(orig_sr, sr)
+
+    start = int(round(offset * orig_sr)) // down * down
+    if duration is None:
+        stop = n_frames
+    else:
+        stop = min(n_frames, start + int(round(duration * orig_sr)))
+
+    y_start = start * up // down
+    y = np.zeros(-(-max(stop - start, 0) * up // down))
+    for signal in decimated:
+        part = signal[y_start:y_start + len(y)]
+        y[:len(part)] += part
+    return y
+
+
+class PyramidBuilder(object):
+    """Compute a file's pyramid from its samples as they stream past: the
+    mono signal at each of PYRAMID_RATES, and the power envelope, i.e. the
+    sum of squared samples over all channels in consecutive hops of
+    sample_rate / ENVELOPE_RATE frames.
+    """
+    def __init__(self, info):
+        sr = info['sample_rate']
+        self.hop = max(sr // ENVELOPE_RATE, 1)
+        self.decimators = dict(
+            (rate, StreamDecimator(sr, rate)) for rate in PYRAMID_RATES
+        )
+        self.carry = np.zeros(0)
+        self.power = []
+
+    def feed(self, samples):
+        """Add the next window of samples, scaled to [-1, 1] with shape
+        (n, channels).
+        """
+        mono = samples.mean(axis=1)
+        for decimator in self.decimators.values():
+            decimator.feed(mono)
+
+        rows = np.concatenate((self.carry, (samples ** 2).sum(axis=1)))
+        n_full = len(rows) // self.hop
+        if n_full:
+            self.power.append(
+                rows[:n_full * self.hop].reshape(n_full, -1).sum(axis=1)
+            )
+        self.carry = rows[n_full * self.hop:]
+
+    def finish(self):
+        """Get the pyramid.
+
+        Returns
+        -------
+        pyramid : dict
+            'mono' : dict, rate -> mono signal at that rate.
+            'power' : np.array, power envelope. The last hop may be partial.
+            'hop' : int, frames per value of the power envelope.
+        """
+        if len(self.carry):
+            self.power.append(np.array([self.carry.sum()]))
+            self.carry = np.zeros(0)
+        power = np.concatenate(self.power) if self.power else np.zeros(0)
+        mono = dict(
+            (rate, decimator.finish())
+            for rate, decimator in self.decimators.items()
+        )
+        return {'mono': mono, 'power': power, 'hop': self.hop}
+
+
+class StreamAnalyzer(object):
+    """Build a wave file's pyramid from its bytes as they are read for
+    another purpose, e.g. copying, so validation need not read the file
+    again. Feed it every byte of the file in order, then call finish.
+    """
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self.info = read_header(fpath)
+        key = (self.info['format_tag'], self.info['sampwidth'])
+        self.supported = key in SAMPLE_TYPES
+        if not self.supported:
+            return
+
+        dtype, self.scale = SAMPLE_TYPES[key]
+        self.packed = dtype == PACKED_24
+        self.dtype = np.dtype('u1' if self.packed else dtype)
+        self.zero = self.scale if dtype == 'u1' else 0.0
+        self.frame_bytes = self.info['channels'] * self.info['sampwidth']
+        self.data_start = self.info['data_offset']
+        self.data_stop = self.data_start + \
+            self.info['n_frames'] * self.frame_bytes
+
+        self.position = 0
+        self.carry = b''
+        self.builder = PyramidBuilder(self.info)
+
+    def feed(self, block):
+        """Add the next block of the file's bytes.
+        """
+        if not self.supported:
+            return
+        start = self.position
+        self.position += len(block)
+
+        lo = max(self.data_start - start, 0)
+        hi = min(self.data_stop - start, len(block))
+        if hi <= lo:
+            return
+        data = self.carry + block[lo:hi]
+        n_bytes = len(data) // self.frame_bytes * self.frame_bytes
+        self.carry = data[n_bytes:]
+
+        samples = np.frombuffer(data[:n_bytes], dtype=self.dtype)
+        if self.packed:
+            samples = unpack_24(
+                samples.reshape(-1, self.info['channels'], 3)
+            )
+        else:
+            samples = samples.reshape(-1, self.info['channels'])
+        self.builder.feed((samples - self.zero) / self.scale)
+
+    def finish(self, fpaths=None):
+        """Store the pyramid for fpath and any other paths holding the same
+        contents (e.g. the copy's destination).
+        """
+        if not self.supported:
+            return
+        levels = self.builder.finish()
+        for fpath in [self.fpath] + list(fpaths or []):
+            store_pyramid(fpath, levels)
+
+
+@tracing.traced
+def compute_pyramid(fpath):
+    """Compute the pyramid of a wave file in one pass over its samples.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to a wave file.
+
+    Returns
+    -------
+    pyramid : dict
+        See PyramidBuilder.finish.
+    """
+    reader = open_wav(fpath)
+    builder = PyramidBuilder(reader.info)
+    for _, window in reader.blocks(2 ** 18):
+        builder.feed(reader.to_float(window))
+    return builder.finish()
+
+
+def set_pyramid_dir(dirpath):
+    """Keep pyramids as .npz sidecar files in dirpath as well as in memory,
+    so other processes and later runs can reuse them. None turns sidecars
+    off.
+    """
+    global _PYRAMID_DIR
+    if dirpath is not None and not os.path.exists(dirpath):
+        os.makedirs(dirpath)
+    _PYRAMID_DIR = dirpath
+
+
+def clear_pyramids():
+    """Forget all pyramids held in memory.
+    """
+    with _PYRAMID_LOCK:
+        _PYRAMID_CACHE.clear()
+
+
+def _pyramid_key(fpath):
+    fpath = os.path.abspath(fpath)
+    stat = os.stat(fpath)
+    return (fpath, stat.st_mtime, stat.st_size)
+
+
+def _sidecar_path(key):
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(_PYRAMID_DIR, digest + '.npz')
+
+
+def _remember(key, levels):
+    size = levels['power'].nbytes + \
+        sum(signal.nbytes for signal in levels['mono'].values())
+    with _PYRAMID_LOCK:
+        _PYRAMID_CACHE.pop(key, None)
+        _PYRAMID_CACHE[key] = (size, levels)
+        total = sum(entry[0] for entry in _PYRAMID_CACHE.values())
+        while total > PYRAMID_CACHE_BYTES and len(_PYRAMID_CACHE) > 1:
+            _, (evicted, _) = _PYRAMID_CACHE.popitem(last=False)
+            total -= evicted
+
+
+def cached_pyramid(fpath):
+    """Get the pyramid of a file if one was already computed for its
+    current contents, from memory or a sidecar, without reading audio.
+
+    Returns
+    -------
+    pyramid : dict or None
+        See PyramidBuilder.finish, or None if there is none.
+    """
+    key = _pyramid_key(fpath)
+    with _PYRAMID_LOCK:
+        entry = _PYRAMID_CACHE.pop(key, None)
+        if entry is not None:
+            _PYRAMID_CACHE[key] = entry
+            return entry[1]
+
+    if _PYRAMID_DIR is None or not os.path.exists(_sidecar_path(key)):
+        return None
+    with np.load(_sidecar_path(key)) as sidecar:
+        levels = {
+            'mono': dict(
+                (rate, sidecar['mono_{}'.format(rate)])
+                for rate in PYRAMID_RATES
+            ),
+            'power': sidecar['power'],
+            'hop': int(sidecar['hop']),
+        }
+    _remember(key, levels)
+    return levels
+
+
+def store_pyramid(fpath, levels):
+    """Remember the pyramid of a file's current contents.
+    """
+    key = _pyramid_key(fpath)
+    _remember(key, levels)
+
+    if _PYRAMID_DIR is not None:
+        arrays = dict(
+            ('mono_{}'.format(rate), signal)
+            for rate, signal in levels['mono'].items()
+        )
+        sidecar = _sidecar_path(key)
+        temp = "{}.{}.{}.tmp.npz".format(
+            sidecar[:-4], os.getpid(), threading.current_thread().ident
+        )
+        np.savez(temp, power=levels['power'], hop=levels['hop'], **arrays)
+        os.rename(temp, sidecar)
+
+
+@tracing.traced
+def pyramid(fpath):
+    """Get the pyramid of a wave file, computing it on first use.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to a wave file.
+
+    Returns
+    -------
+    pyramid : dict
+        See PyramidBuilder.finish.
+    """
+    levels = cached_pyramid(fpath)
+    if levels is None:
+        levels = compute_pyramid(fpath)
+        store_pyramid(fpath, levels)
+    return levels
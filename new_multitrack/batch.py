@@ -0,0 +1,442 @@
+""" Headless validation and packaging of many multitracks.
+
+Each session is described by a manifest (YAML or JSON):
+
+    mix: Mix.wav
+    stem_dir: Stems
+    raw_dir: Raw
+    metadata:
+      artist: ...
+      title: ...
+      album: ...
+      composer: ...
+      producer: ...
+      website: ...
+      instrumental: 'no'
+      excerpt: 'no'
+      has_bleed: 'no'
+      genre: Rock
+      origin: Independent Artist
+    stems:
+      Stem1.wav: {inst: electric bass, component: bass}
+    raws:
+      Raw1.wav: {inst: electric bass, stem: Stem1.wav}
+    ranking:
+      - [Stem1.wav, 1]
+
+Relative paths are resolved against the folder the manifest is in. One
+JSON line describing the outcome is written per session.
+
+Usage:
+    new_multitrack_batch SESSION [SESSION ...] --save-path OUT [--workers N]
+                         [--trace trace.json] [--pyramid-dir DIR] [--verify]
+
+or, without installing the package, python -m new_multitrack.batch ...
+"""
+import os
+import sys
+import glob
+import json
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from . import audio_io
+from . import metadata_io
+from . import taxonomy
+from . import tracing
+from . import validation
+from .multitrack_utils import process_data
+from .result_cache import session_cache
+
+
+MANIFEST_NAMES = ['manifest.yaml', 'manifest.yml', 'manifest.json']
+
+METADATA_KEYS = [
+    'artist', 'title', 'album', 'composer', 'producer', 'website',
+    'instrumental', 'excerpt', 'has_bleed', 'genre', 'origin'
+]
+
+
+def find_manifests(paths):
+    """Expand a list of manifest files and session folders into manifest
+    paths. A folder is either a session folder holding a manifest, or a
+    folder of session folders.
+
+    Parameters
+    ----------
+    paths : list
+        Manifest files and/or folders.
+
+    Returns
+    -------
+    manifests : list
+        Paths to manifest files.
+    """
+    manifests = []
+    for path in paths:
+        if not os.path.isdir(path):
+            manifests.append(path)
+            continue
+
+        found = [os.path.join(path, name) for name in MANIFEST_NAMES
+                 if os.path.exists(os.path.join(path, name))]
+        if not found:
+            for name in MANIFEST_NAMES:
+                found.extend(glob.glob(os.path.join(path, '*', name)))
+        manifests.extend(sorted(found))
+    return manifests
+
+
+def load_manifest(manifest_path):
+    """Load a session manifest and resolve its paths.
+
+    Parameters
+    ----------
+    manifest_path : str
+        Path to a YAML or JSON manifest.
+
+    Returns
+    -------
+    session : dict
+        Keys = 'mix_path', 'stem_path', 'raw_path', 'metadata',
+        'stem_info', 'raw_info', 'ranking', in the form process_data takes.
+    """
+    with open(manifest_path, 'r') as fhandle:
+        manifest = metadata_io.load_yaml(fhandle)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path):
+        return os.path.join(base_dir, os.path.expanduser(path))
+
+    for key in ['mix', 'stem_dir', 'raw_dir']:
+        if key not in manifest:
+            raise ValueError(
+                "{} is missing required key '{}'.".format(manifest_path, key)
+            )
+
+    metadata = dict.fromkeys(METADATA_KEYS, '')
+    metadata.update(manifest.get('metadata') or {})
+
+    stem_path = resolve(manifest['stem_dir'])
+    raw_path = resolve(manifest['raw_dir'])
+
+    index = taxonomy.get_index()
+
+    def instrument(info):
+        # aliases (e.g. 'drums') are written under their taxonomy name;
+        # unknown names are kept so label_check reports them
+        inst = info.get('inst', '')
+        if inst == validation.MAIN_SYSTEM:
+            return inst
+        return taxonomy.canonical_name(inst, index) or inst
+
+    stem_info = {}
+    for stem, info in (manifest.get('stems') or {}).items():
+        stem_info[stem] = {
+            'path': os.path.join(stem_path, stem),
+            'inst': instrument(info),
+            'component': info.get('component', ''),
+        }
+
+    raw_info = {}
+    for raw, info in (manifest.get('raws') or {}).items():
+        raw_info[raw] = {
+            'path': os.path.join(raw_path, raw),
+            'inst': instrument(info),
+            'stem': info.get('stem', ''),
+        }
+
+    session = {
+        'mix_path': resolve(manifest['mix']),
+        'stem_path': stem_path,
+        'raw_path': raw_path,
+        'metadata': metadata,
+        'stem_info': stem_info,
+        'raw_info': raw_info,
+        'ranking': [list(r) for r in manifest.get('ranking') or []],
+    }
+    return session
+
+
+def validate_session(session, n_workers=1, cache=None):
+    """Run check_audio and, if it passes, check_multitrack on a session.
+    Without raws mapped to stems only the checks of the stems against the
+    mix are run.
+
+    Parameters
+    ----------
+    session : dict
+        Session as returned by load_manifest.
+    n_workers : int
+        Number of processes to run the checks in.
+    cache : ResultCache or None
+        Store of results from previous runs.
+
+    Returns
+    -------
+    problems : list
+        Error messages, as returned by create_problems.
+    """
+    file_status = validation.check_audio(
+        session['raw_path'], session['stem_path'], session['mix_path'],
+        n_workers=n_workers, cache=cache
+    )
+    problems = validation.create_problems(file_status)
+    if problems:
+        return problems
+
+    stem_files = sorted(info['path'] for info in session['stem_info'].values())
+    raw_files = sorted(info['path'] for info in session['raw_info'].values())
+    file_status = validation.check_multitrack(
+        raw_files, stem_files, session['mix_path'], session['raw_info'],
+        n_workers=n_workers, cache=cache, stem_info=session['stem_info']
+    )
+    return validation.create_problems(file_status)
+
+
+def run_session(manifest_path, save_path=None, force=False, n_workers=1,
+                use_cache=True, fused=False, pyramid_dir=None, verify=False):
+    """Validate one session and, if it passes, package it.
+
+    Parameters
+    ----------
+    manifest_path : str
+        Path to the session manifest.
+    save_path : str or None
+        Folder to write the packaged multitrack to. None only validates.
+    force : bool
+        Package the session even if validation finds problems.
+    n_workers : int
+        Number of processes to run the checks in.
+    use_cache : bool
+        Keep a result cache next to the manifest, so unchanged sessions are
+        not re-checked.
+    fused : bool
+        Package the session into a staging folder in save_path first,
+        analysing the audio as it is copied, then validate it without
+        reading the audio again for silence and alignment. The staged track
+        replaces any previous one only if validation passes (or force is
+        set), and is deleted otherwise.
+    pyramid_dir : str or None
+        Folder to keep the files' pyramids in (see audio_io.set_pyramid_dir),
+        so later runs do not re-analyse unchanged audio. None keeps them in
+        memory only.
+    verify : bool
+        Check every packaged file against its source with an md5 checksum.
+
+    Returns
+    -------
+    result : dict
+        'manifest' : str, manifest_path.
+        'status' : str, 'ok', 'invalid' or 'error'.
+        'problems' : list, validation error messages.
+        'packaged' : bool, True if the session was written to save_path.
+        'error' : str, the exception message if status is 'error'.
+    """
+    result = {
+        'manifest': manifest_path,
+        'status': 'ok',
+        'problems': [],
+        'packaged': False,
+    }
+    cache = None
+    staging = None
+    try:
+        session = load_manifest(manifest_path)
+        if use_cache:
+            session_dir = os.path.dirname(os.path.abspath(manifest_path))
+            cache = session_cache(session_dir)
+        audio_io.set_pyramid_dir(pyramid_dir)
+
+        fused = fused and save_path is not None
+        if fused:
+            staging = tempfile.mkdtemp(prefix='.staging_', dir=save_path)
+            staged_path = package_session(session, staging, analyze=True,
+                                          verify=verify)
+
+        result['problems'] = validate_session(session, n_workers, cache)
+        if result['problems']:
+            result['status'] = 'invalid'
+
+        if save_path is not None and (force or not result['problems']):
+            if fused:
+                publish_track(staged_path, save_path)
+            else:
+                package_session(session, save_path, verify=verify)
+            result['packaged'] = True
+    except Exception as err:
+        result['status'] = 'error'
+        result['error'] = "{}: {}".format(type(err).__name__, err)
+    finally:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+        if cache is not None:
+            cache.close()
+        audio_io.set_pyramid_dir(None)
+        audio_io.clear_pyramids()
+    return result
+
+
+def package_session(session, save_path, analyze=False, verify=False):
+    """Run process_data on a session as returned by load_manifest.
+    """
+    return process_data(
+        save_path, session['metadata'], session['mix_path'],
+        session['stem_info'], session['raw_info'], session['ranking'],
+        analyze=analyze, verify=verify
+    )
+
+
+def publish_track(staged_path, save_path):
+    """Move a track folder packaged in a staging folder into save_path,
+    replacing any previous version of the track.
+    """
+    track_path = os.path.join(save_path, os.path.basename(staged_path))
+    if os.path.exists(track_path):
+        shutil.rmtree(track_path)
+    os.rename(staged_path, track_path)
+    return track_path
+
+
+def session_job(job):
+    """Run run_session on a (manifest_path, save_path, force, n_workers,
+    use_cache, fused, pyramid_dir, verify) tuple.
+    """
+    return run_session(*job)
+
+
+def run_batch(manifests, save_path=None, force=False, n_sessions=1,
+              n_workers=1, use_cache=True, output=None, fused=False,
+              pyramid_dir=None, verify=False):
+    """Run run_session on every manifest, n_sessions at a time, writing one
+    JSON line per session to output as each one finishes.
+
+    Parameters
+    ----------
+    manifests : list
+        Paths to session manifests.
+    save_path : str or None
+        Folder to write packaged multitracks to. None only validates.
+    force : bool
+        Package sessions even if validation finds problems.
+    n_sessions : int
+        Number of sessions to process concurrently.
+    n_workers : int
+        Number of processes to run each session's checks in.
+    use_cache : bool
+        Keep a result cache next to each manifest.
+    output : file or None
+        Where to write results. Default=sys.stdout.
+    fused : bool
+        Analyse the audio while packaging it, see run_session.
+    pyramid_dir : str or None
+        Folder to keep the files' pyramids in, see run_session.
+    verify : bool
+        Check packaged files against their sources, see run_session.
+
+    Returns
+    -------
+    results : list
+        run_session's result for each session, in the order they finished.
+    """
+    if output is None:
+        output = sys.stdout
+
+    jobs = [(m, save_path, force, n_workers, use_cache, fused, pyramid_dir,
+             verify) for m in manifests]
+    n_sessions = min(n_sessions, len(jobs))
+
+    pool = None
+    if n_sessions > 1:
+        # sessions run in daemonic pool processes, which cannot start pools
+        # of their own, so their checks run serially
+        jobs = [job[:3] + (1,) + job[4:] for job in jobs]
+        pool = multiprocessing.Pool(n_sessions)
+        result_iter = pool.imap_unordered(session_job, jobs)
+    else:
+        result_iter = (session_job(job) for job in jobs)
+
+    results = []
+    try:
+        for result in result_iter:
+            results.append(result)
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Validate and package multitracks without the GUI."
+    )
+    parser.add_argument('sessions', nargs='+',
+                        help="Session manifests, session folders, or folders "
+                             "of session folders.")
+    parser.add_argument('--save-path', default=None,
+                        help="Folder to write packaged multitracks to. If "
+                             "omitted sessions are only validated.")
+    parser.add_argument('--force', action='store_true',
+                        help="Package sessions even if validation fails.")
+    parser.add_argument('--sessions-in-parallel', type=int, default=1,
+                        dest='n_sessions',
+                        help="Number of sessions to process concurrently.")
+    parser.add_argument('--workers', type=int, default=1, dest='n_workers',
+                        help="Number of processes per session's checks, when "
+                             "sessions are processed one at a time.")
+    parser.add_argument('--no-cache', action='store_false', dest='use_cache',
+                        help="Do not keep result caches next to manifests.")
+    parser.add_argument('--fused', action='store_true',
+                        help="Package sessions into a staging folder "
+                             "before validating them, analysing the audio "
+                             "while it is copied so it is read once. Staged "
+                             "sessions that fail validation are deleted "
+                             "unless --force is given.")
+    parser.add_argument('--pyramid-dir', default=None,
+                        help="Folder to keep analysed audio in between runs, "
+                             "e.g. ~/.cache/medleydebugger. Off by default.")
+    parser.add_argument('--verify', action='store_true',
+                        help="Check every packaged file against its source "
+                             "with an md5 checksum.")
+    parser.add_argument('--output', default=None,
+                        help="File to write JSON lines to. Default=stdout.")
+    parser.add_argument('--trace', default=None,
+                        help="Write a Chrome trace of the checks run in "
+                             "this process to this file.")
+    args = parser.parse_args(args)
+
+    manifests = find_manifests(args.sessions)
+    if args.trace is not None:
+        tracing.start_tracing(memory=True)
+
+    pyramid_dir = None
+    if args.pyramid_dir is not None:
+        pyramid_dir = os.path.abspath(os.path.expanduser(args.pyramid_dir))
+
+    output = None
+    if args.output is not None:
+        output = open(args.output, 'w')
+    try:
+        results = run_batch(
+            manifests, args.save_path, args.force, args.n_sessions,
+            args.n_workers, args.use_cache, output, args.fused,
+            pyramid_dir, args.verify
+        )
+    finally:
+        if output is not None:
+            output.close()
+        if args.trace is not None:
+            tracing.stop_tracing().export(args.trace)
+
+    if all(r['status'] == 'ok' for r in results):
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
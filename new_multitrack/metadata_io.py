@@ -0,0 +1,183 @@
+""" Reading and writing of metadata YAML files.
+
+The LibYAML C loader and dumper are used when PyYAML was built with them,
+and the pure Python ones otherwise. Both dumpers share the same representer
+and emit the same bytes for metadata documents (mappings of strings,
+numbers, booleans and None), so files written either way are identical.
+
+load_library reads every *_METADATA.yaml file under a directory, across a
+pool of processes, into an index that can be cached in a JSON file so that
+only new or modified files are parsed again.
+"""
+import os
+import json
+import multiprocessing
+import yaml
+
+
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+Dumper = getattr(yaml, 'CDumper', yaml.Dumper)
+
+METADATA_SUFFIX = '_METADATA.yaml'
+
+# Bumped whenever the layout of the library cache changes, so old cache
+# files are ignored instead of misread.
+LIBRARY_CACHE_VERSION = 1
+
+# Files parsed per task sent to a pool process.
+LOAD_CHUNKSIZE = 64
+
+
+def load_yaml(fhandle):
+    """Parse a YAML document with the fastest available safe loader.
+
+    Parameters
+    ----------
+    fhandle : file or str
+        Open file or YAML text.
+
+    Returns
+    -------
+    data : object
+        The parsed document.
+    """
+    return yaml.load(fhandle, Loader=Loader)
+
+
+def dump_metadata(metadata, fhandle):
+    """Stream a metadata dictionary to an open file, in the layout
+    NewMultitrack has always written.
+    """
+    yaml.dump(metadata, fhandle, Dumper=Dumper,
+              indent=2, default_flow_style=False)
+
+
+def dumps_metadata(metadata):
+    """Get the text dump_metadata writes for a metadata dictionary.
+    """
+    return yaml.dump(metadata, Dumper=Dumper,
+                     indent=2, default_flow_style=False)
+
+
+def read_metadata(metadata_path):
+    """Load a metadata file.
+    """
+    with open(metadata_path, 'r') as fhandle:
+        return load_yaml(fhandle)
+
+
+def write_metadata(metadata, metadata_path):
+    """Write a metadata dictionary to metadata_path.
+    """
+    with open(metadata_path, 'w') as fhandle:
+        dump_metadata(metadata, fhandle)
+
+
+def find_metadata_files(library_dir):
+    """Get the paths of all metadata files under library_dir, sorted.
+    """
+    paths = []
+    for dirpath, _, fnames in os.walk(library_dir):
+        for fname in fnames:
+            if fname.endswith(METADATA_SUFFIX):
+                paths.append(os.path.join(dirpath, fname))
+    return sorted(paths)
+
+
+def _signature(metadata_path):
+    stat = os.stat(metadata_path)
+    return [stat.st_mtime, stat.st_size]
+
+
+def _load_job(metadata_path):
+    return metadata_path, _signature(metadata_path), \
+        read_metadata(metadata_path)
+
+
+def _json_safe(metadata):
+    # dates, non-string keys or tuples would not survive a round trip
+    # through JSON; such files are parsed again on every load instead.
+    try:
+        return json.loads(json.dumps(metadata)) == metadata
+    except (TypeError, ValueError):
+        return False
+
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, 'r') as fhandle:
+            cached = json.load(fhandle)
+    except (IOError, OSError, ValueError):
+        return {}
+    if cached.get('version') != LIBRARY_CACHE_VERSION:
+        return {}
+    return cached['files']
+
+
+def _write_cache(entries, cache_path):
+    temp = "{}.{}.tmp".format(cache_path, os.getpid())
+    with open(temp, 'w') as fhandle:
+        json.dump({'version': LIBRARY_CACHE_VERSION, 'files': entries},
+                  fhandle, sort_keys=True)
+    os.rename(temp, cache_path)
+
+
+def load_library(library_dir, n_workers=1, cache_path=None):
+    """Load every metadata file under library_dir.
+
+    Parameters
+    ----------
+    library_dir : str
+        Directory searched recursively for *_METADATA.yaml files.
+    n_workers : int
+        Number of processes parsing files.
+    cache_path : str or None
+        Path to a JSON cache of the parsed files. Files whose modification
+        time and size match their cache entry are not parsed again, and
+        the cache is rewritten if anything changed.
+
+    Returns
+    -------
+    library : dict
+        Keys = metadata file paths relative to library_dir, values = the
+        loaded metadata dictionaries.
+    """
+    cached = {} if cache_path is None else _read_cache(cache_path)
+
+    library = {}
+    entries = {}
+    to_load = []
+    for metadata_path in find_metadata_files(library_dir):
+        rel_path = os.path.relpath(metadata_path, library_dir)
+        entry = cached.get(rel_path)
+        if entry is not None and \
+                entry['source'] == _signature(metadata_path):
+            library[rel_path] = entry['metadata']
+            entries[rel_path] = entry
+        else:
+            to_load.append(metadata_path)
+
+    n_workers = min(n_workers, len(to_load))
+    if n_workers > 1:
+        pool = multiprocessing.Pool(n_workers)
+        try:
+            loaded = pool.map(_load_job, to_load, LOAD_CHUNKSIZE)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        loaded = [_load_job(metadata_path) for metadata_path in to_load]
+
+    for metadata_path, source, metadata in loaded:
+        rel_path = os.path.relpath(metadata_path, library_dir)
+        library[rel_path] = metadata
+        if _json_safe(metadata):
+            entries[rel_path] = {'source': source, 'metadata': metadata}
+
+    if cache_path is not None and \
+            (loaded or len(entries) != len(cached)):
+        try:
+            _write_cache(entries, cache_path)
+        except (IOError, OSError):
+            pass
+    return library
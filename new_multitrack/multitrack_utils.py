@@ -1,15 +1,34 @@
 
-import yaml
 import os
 import re
 import csv
+import hashlib
 from shutil import copyfile
+from multiprocessing.pool import ThreadPool
+from . import audio_io
+from . import metadata_io
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Number of files NewMultitrack copies concurrently by default.
+COPY_WORKERS = 4
+
+# Bytes read and written at a time when streaming a copy.
+COPY_BUFFER_SIZE = 2 ** 20
+
+# ioctl request that asks Linux copy-on-write filesystems (btrfs, xfs) to
+# share the source's extents with the destination instead of copying.
+FICLONE = 0x40049409
 
 
 class NewMultitrack(object):
     """ Class to populate new Multitrack
     """
-    def __init__(self, save_path):
+    def __init__(self, save_path, n_workers=COPY_WORKERS, verify=False,
+                 link=False, analyze=False, defer_copies=False):
         self.artist = ''
         self.title = ''
         self.album = ''
@@ -67,6 +86,17 @@ class NewMultitrack(object):
 
         self.track_id = ''
 
+        # the add*File methods copy their file straight away unless
+        # defer_copies is set, in which case copies are queued and run
+        # together by copyFiles (or writeMetadataFile)
+        self.defer_copies = defer_copies
+        self.n_workers = n_workers
+        self.verify = verify
+        self.link = link
+        self.analyze = analyze
+        self.pending_copies = []
+        self.checksums = {}
+
     def _init_metadata(self):
         # initialize metadata dictionary
         keys = ['artist', 'title', 'album', 'composer', 'producer',
@@ -181,7 +211,7 @@ class NewMultitrack(object):
         self.metadata_dict['raw_dir'] = self.raw_dir
 
     def addMixFile(self, fpath):
-        copyfile(fpath, self.mix_path)
+        self._queueCopy(fpath, self.mix_path)
 
     def addStemFile(self, fpath, instrument, component):
         stem_idx = int(len(self.metadata_dict['stems'].keys()) + 1)
@@ -189,7 +219,7 @@ class NewMultitrack(object):
         new_fname = self.stem_fmt % ("%02d" % stem_idx)
         new_fpath = os.path.join(self.stem_path, new_fname)
 
-        copyfile(fpath, new_fpath)
+        self._queueCopy(fpath, new_fpath)
         self.stem_fchange_dict[os.path.basename(fpath)] = \
             os.path.basename(new_fpath)
 
@@ -214,25 +244,64 @@ class NewMultitrack(object):
         new_fname = self.raw_fmt % (("%02d" % stem_idx), ("%02d" % raw_idx))
         new_fpath = os.path.join(self.raw_path, new_fname)
 
-        # copy source file to source directory
-        copyfile(fpath, new_fpath)
-
         # add metadata to dictionary
         # Ensure that stem exists
         assert stem_str in self.metadata_dict['stems'].keys(), \
             "Stem index %s does not exist" % stem_str
 
+        # copy source file to source directory
+        self._queueCopy(fpath, new_fpath)
+
         # fill dictionary #
         temp_dict = dict.fromkeys(self.raw_keys)
         temp_dict['filename'] = self.raw_fmt % (("%02d" % stem_idx), ("%02d" % raw_idx))
         temp_dict['instrument'] = instrument
         self.metadata_dict['stems'][stem_str]['raw'][raw_str] = temp_dict
 
+    def _queueCopy(self, src, dst):
+        self.pending_copies.append((src, dst))
+        if not self.defer_copies:
+            self.copyFiles()
+
+    def copyFiles(self):
+        """Run the queued copies, n_workers at a time. Checksums of the
+        verified copies are stored in self.checksums by destination path.
+        If analyze is set, each file's pyramid (see audio_io.pyramid) is
+        computed from the data as it is copied, so validating the source or
+        the copy afterwards does not read the audio again.
+        """
+        copies = self.pending_copies
+        self.pending_copies = []
+
+        def copy(job):
+            src, dst = job
+            analyzer = None
+            if self.analyze:
+                analyzer = audio_io.StreamAnalyzer(src)
+            checksum = copy_file(src, dst, self.verify, self.link, analyzer)
+            if analyzer is not None:
+                analyzer.finish([dst])
+            return dst, checksum
+
+        n_workers = min(self.n_workers, len(copies))
+        if n_workers > 1:
+            pool = ThreadPool(n_workers)
+            try:
+                results = pool.map(copy, copies)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [copy(job) for job in copies]
+
+        for dst, checksum in results:
+            if checksum is not None:
+                self.checksums[dst] = checksum
+
     def writeMetadataFile(self):
-        f_out = open(self.metadata_path, 'w')
-        yaml.dump(self.metadata_dict, f_out,
-                  indent=2, default_flow_style=False)
-        f_out.close()
+        if self.pending_copies:
+            self.copyFiles()
+        metadata_io.write_metadata(self.metadata_dict, self.metadata_path)
 
     def writeRankingFile(self):
         with open(self.ranking_path, 'w') as fhandle:
@@ -240,6 +309,227 @@ class NewMultitrack(object):
             writer.writerows(self.ranking)
 
 
+def process_data(save_path, metadata, mix_path, stem_info, raw_info, ranking,
+                 analyze=False, verify=False):
+    """Copy a validated multitrack into save_path in MedleyDB format and
+    write its metadata and ranking files.
+
+    Parameters
+    ----------
+    save_path : str
+        Folder to create the track folder in.
+    metadata : dict
+        Track metadata, with keys 'artist', 'title', 'album', 'composer',
+        'producer', 'website', 'instrumental', 'excerpt', 'has_bleed',
+        'genre' and 'origin'.
+    mix_path : str
+        Path to mix file.
+    stem_info : dict
+        Keys = stem basename, values = dict with 'path', 'inst' and
+        'component'.
+    raw_info : dict
+        Keys = raw basename, values = dict with 'path', 'inst' and 'stem'.
+    ranking : list
+        [stem basename, rank] pairs of melodic stems.
+    analyze : bool
+        Compute the files' pyramids while copying them.
+    verify : bool
+        Check every copy against its source with an md5 checksum.
+
+    Returns
+    -------
+    track_path : str
+        Path to the new track folder.
+    """
+
+    NM = NewMultitrack(save_path, verify=verify, analyze=analyze,
+                       defer_copies=True)
+
+    NM.setArtist(metadata["artist"])
+    NM.setTitle(metadata["title"])
+    NM.setAlbum(metadata["album"])
+    NM.setComposer(metadata["composer"])
+    NM.setProducer(metadata["producer"])
+    NM.setWebsite(metadata["website"])
+    NM.setInstrumental(metadata["instrumental"])
+    NM.setExcerpt(metadata["excerpt"])
+    NM.setHasBleed(metadata["has_bleed"])
+    NM.setGenre(metadata["genre"])
+    NM.setOrigin(metadata["origin"])
+
+    NM.fillMetadata()
+    NM.makeFileStructure()
+
+    NM.addMixFile(mix_path)
+
+    stem_name_map = dict.fromkeys(stem_info.keys())
+    for stem in stem_info:
+        idx = NM.addStemFile(stem_info[stem]['path'], stem_info[stem]['inst'],
+                             stem_info[stem]['component'])
+        stem_name_map[stem] = idx
+
+    NM.setRanking([[NM.stem_fchange_dict[r[0]], r[1]] for r in ranking])
+
+    for raw in raw_info:
+        stem_idx = stem_name_map[raw_info[raw]['stem']]
+        NM.addRawFile(raw_info[raw]['path'], stem_idx,
+                      raw_info[raw]['inst'])
+
+    NM.copyFiles()
+    NM.writeMetadataFile()
+    NM.writeRankingFile()
+    return NM.track_path
+
+
+def reflink(src, dst):
+    """Clone src to dst on a copy-on-write filesystem without copying data.
+
+    Returns
+    -------
+    success : bool
+        False if the platform or filesystem does not support reflinks, in
+        which case dst is left untouched.
+    """
+    if fcntl is None or not hasattr(fcntl, 'ioctl'):
+        return False
+    with open(src, 'rb') as fsrc:
+        fdst = open(dst, 'wb')
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except (IOError, OSError):
+            fdst.close()
+            os.remove(dst)
+            return False
+        fdst.close()
+    return True
+
+
+def kernel_copy(src, dst):
+    """Copy src to dst inside the kernel with copy_file_range or sendfile.
+
+    Returns
+    -------
+    success : bool
+        False if neither is available, in which case dst is left untouched.
+    """
+    copy_range = getattr(os, 'copy_file_range', None)
+    sendfile = getattr(os, 'sendfile', None)
+    if copy_range is None and sendfile is None:
+        return False
+
+    size = os.path.getsize(src)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        in_fd = fsrc.fileno()
+        out_fd = fdst.fileno()
+        copied = 0
+        while copied < size:
+            count = min(COPY_BUFFER_SIZE * 64, size - copied)
+            try:
+                if copy_range is not None:
+                    sent = copy_range(in_fd, out_fd, count)
+                else:
+                    sent = sendfile(out_fd, in_fd, copied, count)
+            except OSError:
+                # e.g. across filesystems on older kernels, or sendfile
+                # to a regular file on macOS; fall back before any data
+                # has been written
+                if copied == 0:
+                    break
+                raise
+            if sent == 0:
+                break
+            copied += sent
+
+    if copied != size:
+        os.remove(dst)
+        return False
+    return True
+
+
+def file_checksum(fpath):
+    """Streaming md5 hex digest of a file's contents.
+    """
+    md5 = hashlib.md5()
+    with open(fpath, 'rb') as fhandle:
+        for block in iter(lambda: fhandle.read(COPY_BUFFER_SIZE), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def check_size(src, dst):
+    """Raise IOError if dst is not as large as src, i.e. a copy was cut
+    short.
+    """
+    if os.path.getsize(dst) != os.path.getsize(src):
+        raise IOError("Copy of {} to {} is incomplete.".format(src, dst))
+
+
+def copy_file(src, dst, verify=False, link=False, analyzer=None):
+    """Copy src to dst as cheaply as the platform allows.
+
+    A hardlink is tried first if link is True, then a reflink. Unverified
+    copies are made inside the kernel where possible. Verified copies, and
+    copies with an analyzer, are streamed through userspace, analysing and,
+    if verifying, hashing the data as it is written; the checksum is compared against
+    a read back of dst. Unverified copies only have their size checked.
+
+    Parameters
+    ----------
+    src : str
+        Path to source file.
+    dst : str
+        Path to destination file.
+    verify : bool
+        Check that dst has the same contents as src, at the cost of reading
+        it back in full.
+    link : bool
+        Allow dst to be a hardlink to src.
+    analyzer : object or None
+        Object whose feed method is called with each block of src, e.g. an
+        audio_io.StreamAnalyzer.
+
+    Returns
+    -------
+    checksum : str or None
+        md5 hex digest of the copied data if verified, else None.
+    """
+    if analyzer is None:
+        if link:
+            try:
+                os.link(src, dst)
+                return None
+            except (OSError, AttributeError):
+                pass
+
+        # clones and links share the source's blocks, so there is nothing
+        # that could have been corrupted in transit to verify
+        if reflink(src, dst):
+            return None
+
+        if not verify:
+            if not kernel_copy(src, dst):
+                copyfile(src, dst)
+            check_size(src, dst)
+            return None
+
+    md5 = hashlib.md5() if verify else None
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        for block in iter(lambda: fsrc.read(COPY_BUFFER_SIZE), b''):
+            if md5 is not None:
+                md5.update(block)
+            if analyzer is not None:
+                analyzer.feed(block)
+            fdst.write(block)
+
+    if not verify:
+        check_size(src, dst)
+        return None
+    checksum = md5.hexdigest()
+    if file_checksum(dst) != checksum:
+        raise IOError("Copy of {} to {} is corrupt.".format(src, dst))
+    return checksum
+
+
 def get_dict_leaves(dictionary):
     vals = []
     if type(dictionary) == dict:
@@ -1,20 +1,108 @@
 import sys
 import os
 import glob
-import yaml
 from PyQt4 import QtGui, QtCore
 from functools import partial
-import multitrack_utils as mu
-from validation import get_dur
-from validation import check_audio
-from validation import create_problems
-from validation import check_multitrack
+if __name__ == '__main__':
+    # run as a script; the other modules are imported through the package
+    # since they import each other relatively
+    sys.path.insert(
+        0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+from new_multitrack.multitrack_utils import process_data
+from new_multitrack.validation import get_dur
+from new_multitrack.validation import check_audio
+from new_multitrack.validation import create_problems
+from new_multitrack.validation import check_multitrack
+from new_multitrack.validation import ValidationCancelled
+from new_multitrack.result_cache import session_cache
+from new_multitrack import taxonomy
 import sox
 
 INST_TAXONOMY = 'taxonomy.yaml'
 ICON_FILE = 'medley-icon.png'
 
 
+class ValidationWorker(QtCore.QThread):
+    """ Runs check_audio or check_multitrack off the Qt event thread,
+    emitting progress(check, completed, total) as jobs finish. When the
+    thread finishes, file_status holds the result, or None if the run was
+    cancelled or failed (see error).
+    """
+    progress = QtCore.pyqtSignal(str, int, int)
+
+    def __init__(self, check, args, cache_dir=None, parent=None):
+        super(ValidationWorker, self).__init__(parent)
+        self.check = check
+        self.args = args
+        self.cache_dir = cache_dir
+        self.cancelled = False
+        self.file_status = None
+        self.error = None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report(self, check_name, completed, total):
+        if self.cancelled:
+            raise ValidationCancelled()
+        self.progress.emit(check_name, completed, total)
+
+    def run(self):
+        # sqlite connections cannot cross threads, so open the cache here
+        cache = None
+        if self.cache_dir:
+            cache = session_cache(self.cache_dir)
+        try:
+            self.file_status = self.check(
+                *self.args, cache=cache, progress=self.report
+            )
+        except ValidationCancelled:
+            self.file_status = None
+        except Exception as err:
+            self.error = "{}: {}".format(type(err).__name__, err)
+        finally:
+            if cache is not None:
+                cache.close()
+
+
+def run_validation(parent, label, check, args, cache_dir=None):
+    """Run a validation check in a ValidationWorker behind a progress
+    dialog with a cancel button, keeping the UI responsive meanwhile.
+
+    Returns
+    -------
+    file_status : dict or None
+        Result of check, or None if it was cancelled or failed.
+    """
+    dialog = QtGui.QProgressDialog(label, "Cancel", 0, 0, parent)
+    dialog.setWindowTitle("Validating")
+    dialog.setWindowModality(QtCore.Qt.WindowModal)
+    dialog.setMinimumDuration(0)
+
+    worker = ValidationWorker(check, args, cache_dir)
+
+    def show_progress(check_name, completed, total):
+        dialog.setLabelText(
+            "{}\nChecking {}: {} of {}".format(label, check_name, completed, total)
+        )
+        dialog.setMaximum(total)
+        dialog.setValue(completed)
+
+    loop = QtCore.QEventLoop()
+    worker.progress.connect(show_progress)
+    worker.finished.connect(loop.quit)
+    dialog.canceled.connect(worker.cancel)
+
+    worker.start()
+    loop.exec_()
+    dialog.close()
+
+    if worker.error is not None:
+        QtGui.QMessageBox.warning(parent, "Validation failed", worker.error)
+    return worker.file_status
+
+
 class FilePrompt(QtGui.QDialog):
     def __init__(self, parent=None):
 
@@ -115,9 +203,13 @@ class FilePrompt(QtGui.QDialog):
         if self.raw_path and self.stem_path and \
            self.mix_path and self.save_path:
 
-            file_status = check_audio(
-                self.raw_path, self.stem_path, self.mix_path
+            file_status = run_validation(
+                self, "Checking audio files...", check_audio,
+                (self.raw_path, self.stem_path, self.mix_path),
+                cache_dir=self.save_path
             )
+            if file_status is None:
+                return
             problems = create_problems(file_status)
 
             if len(problems) > 0:
@@ -625,14 +717,7 @@ class Stems(QtGui.QDialog):
         self.move(frame_gm.topLeft())
 
     def getInstMap(self):
-        f_handle = open(INST_TAXONOMY)
-        taxonomy = yaml.load(f_handle)
-        f_handle.close()
-        inst_dict = {}
-
-        for k in taxonomy.keys():
-            inst_dict[k] = sorted(list(mu.get_dict_leaves(taxonomy[k])))
-        return inst_dict
+        return taxonomy.get_index(INST_TAXONOMY)['groups']
 
     def loadInstCombobox(self, grp_cb, inst_cb):
 
@@ -693,11 +778,12 @@ class Stems(QtGui.QDialog):
 
 
 class Raw(QtGui.QDialog):
-    def __init__(self, raw_dir, stem_info, stem_dir, mix_path):
+    def __init__(self, raw_dir, stem_info, stem_dir, mix_path, save_path=None):
         super(Raw, self).__init__()
 
         self.stem_dir = stem_dir
         self.mix_path = mix_path
+        self.save_path = save_path
         self.raw_dir = raw_dir
         self.stem_info = stem_info
         print stem_info
@@ -841,14 +927,7 @@ class Raw(QtGui.QDialog):
         self.move(frame_gm.topLeft())
 
     def getInstMap(self):
-        f_handle = open(INST_TAXONOMY)
-        taxonomy = yaml.load(f_handle)
-        f_handle.close()
-        inst_dict = {}
-
-        for k in taxonomy.keys():
-            inst_dict[k] = sorted(list(mu.get_dict_leaves(taxonomy[k])))
-        return inst_dict
+        return taxonomy.get_index(INST_TAXONOMY)['groups']
 
     def loadStemInst(self, stem_cb, group_cb, inst_cb):
         stem_name = str(stem_cb.currentText())
@@ -915,9 +994,14 @@ class Raw(QtGui.QDialog):
         if complete:
             self.recordResponses()
 
-        file_status = check_multitrack(
-            self.raw_paths, self.stem_paths, self.mix_path, self.raw_info
+        file_status = run_validation(
+            self, "Checking alignment and inclusion...",
+            partial(check_multitrack, stem_info=self.stem_info),
+            (self.raw_paths, self.stem_paths, self.mix_path, self.raw_info),
+            cache_dir=self.save_path
         )
+        if file_status is None:
+            return
         problems = create_problems(file_status)
 
         if len(problems) > 0:
@@ -1068,43 +1152,6 @@ def play_mix(file_path):
     tfm.preview(file_path)
 
 
-def process_data(save_path, metadata, mix_path, stem_info, raw_info, ranking):
-
-    NM = mu.NewMultitrack(save_path)
-
-    NM.setArtist(metadata["artist"])
-    NM.setTitle(metadata["title"])
-    NM.setAlbum(metadata["album"])
-    NM.setComposer(metadata["composer"])
-    NM.setProducer(metadata["producer"])
-    NM.setWebsite(metadata["website"])
-    NM.setInstrumental(metadata["instrumental"])
-    NM.setExcerpt(metadata["excerpt"])
-    NM.setHasBleed(metadata["has_bleed"])
-    NM.setGenre(metadata["genre"])
-    NM.setOrigin(metadata["origin"])
-
-    NM.fillMetadata()
-    NM.makeFileStructure()
-
-    NM.addMixFile(mix_path)
-
-    stem_name_map = dict.fromkeys(stem_info.keys())
-    for stem in stem_info:
-        idx = NM.addStemFile(stem_info[stem]['path'], stem_info[stem]['inst'],
-                             stem_info[stem]['component'])
-        stem_name_map[stem] = idx
-
-    NM.setRanking([[NM.stem_fchange_dict[r[0]], r[1]] for r in ranking])
-
-    for raw in raw_info:
-        stem_idx = stem_name_map[raw_info[raw]['stem']]
-        NM.addRawFile(raw_info[raw]['path'], stem_idx,
-                      raw_info[raw]['inst'])
-
-    NM.writeMetadataFile()
-    NM.writeRankingFile()
-
 def main():
 
     app = QtGui.QApplication(sys.argv)
@@ -1127,7 +1174,7 @@ def main():
 
     rw = Raw(
         file_prompt.raw_path, st.stem_info, 
-        file_prompt.stem_path, file_prompt.mix_path
+        file_prompt.stem_path, file_prompt.mix_path, file_prompt.save_path
     )
     if not rw.exec_():
         sys.exit(-1)
@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import sqlite3
+
+
+CACHE_FNAME = '.medleydebugger_cache.sqlite'
+
+# The fingerprint hashes the first block (which holds the header) and this
+# many more blocks spread evenly over the rest of the file.
+FINGERPRINT_BLOCK_SIZE = 2 ** 16
+FINGERPRINT_N_BLOCKS = 8
+
+
+def fingerprint(fpath):
+    """Cheaply identify the contents of a file from its size, modification
+    time, header and a handful of sampled blocks.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to a file.
+
+    Returns
+    -------
+    digest : str
+        Hex digest identifying the file contents.
+    """
+    stat = os.stat(fpath)
+    md5 = hashlib.md5()
+    md5.update("{}:{}".format(stat.st_size, stat.st_mtime).encode('utf-8'))
+
+    step = max(stat.st_size // (FINGERPRINT_N_BLOCKS + 1), FINGERPRINT_BLOCK_SIZE)
+    with open(fpath, 'rb') as fhandle:
+        for offset in range(0, stat.st_size, step):
+            fhandle.seek(offset)
+            md5.update(fhandle.read(FINGERPRINT_BLOCK_SIZE))
+        fhandle.seek(max(stat.st_size - FINGERPRINT_BLOCK_SIZE, 0))
+        md5.update(fhandle.read(FINGERPRINT_BLOCK_SIZE))
+
+    return md5.hexdigest()
+
+
+class ResultCache(object):
+    """ Persistent store of check results, keyed by check name and the
+    fingerprints of the files each result was computed from.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "check_name TEXT, key TEXT, value TEXT, "
+            "PRIMARY KEY (check_name, key))"
+        )
+        self.conn.commit()
+        self._fingerprints = {}
+
+    def fingerprint(self, fpath):
+        """Fingerprint a file, at most once per (path, mtime, size).
+        """
+        fpath = os.path.abspath(fpath)
+        stat = os.stat(fpath)
+        signature = (fpath, stat.st_mtime, stat.st_size)
+        if signature not in self._fingerprints:
+            self._fingerprints[signature] = fingerprint(fpath)
+        return self._fingerprints[signature]
+
+    def key(self, file_list, params=None):
+        """Build the key of a result computed from file_list with params.
+
+        Parameters
+        ----------
+        file_list : list
+            Paths to every file the result depends on.
+        params : object
+            JSON serialisable arguments the result depends on.
+
+        Returns
+        -------
+        key : str
+            Hex digest of the file fingerprints and params.
+        """
+        sha = hashlib.sha1()
+        for fpath in file_list:
+            sha.update(self.fingerprint(fpath).encode('utf-8'))
+        sha.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return sha.hexdigest()
+
+    def get(self, check_name, key):
+        """Look up a stored result.
+
+        Returns
+        -------
+        found : bool
+            True if a result is stored for check_name and key.
+        value : object
+            The stored result, or None if not found.
+        """
+        row = self.conn.execute(
+            "SELECT value FROM results WHERE check_name = ? AND key = ?",
+            (check_name, key)
+        ).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0])
+
+    def set(self, check_name, key, value):
+        """Store a JSON serialisable result. Call commit to persist it.
+        """
+        self.conn.execute(
+            "INSERT OR REPLACE INTO results (check_name, key, value) "
+            "VALUES (?, ?, ?)",
+            (check_name, key, json.dumps(value))
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def session_cache(session_dir):
+    """Open the result cache stored in a session directory.
+
+    Parameters
+    ----------
+    session_dir : str
+        Directory to keep the cache file in.
+
+    Returns
+    -------
+    cache : ResultCache
+        Cache backed by CACHE_FNAME inside session_dir.
+    """
+    return ResultCache(os.path.join(session_dir, CACHE_FNAME))
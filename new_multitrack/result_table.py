@@ -0,0 +1,269 @@
+""" Columnar store of check results for many files.
+
+Each check is a column of int8 codes (PASS, FAIL or UNKNOWN) and each
+measured value (e.g. a mixing coefficient or an offset) a column of
+floats (NaN where missing), with one row per file. Tables of whole
+libraries stay compact and can be filtered and aggregated with NumPy, while
+to_file_status gives the dict of dicts check_audio and check_multitrack
+return.
+"""
+import json
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+PASS = 1
+FAIL = 0
+UNKNOWN = -1
+
+_CODES = {True: PASS, False: FAIL, None: UNKNOWN}
+_STATUS = {PASS: True, FAIL: False, UNKNOWN: None}
+
+
+def is_status(value):
+    """Check if a file_status value is a check result (True, False or
+    None), rather than extra data such as tracing's 'Trace' lists.
+    """
+    return value is None or isinstance(value, (bool, np.bool_))
+
+
+class ResultTable(object):
+    """Check results and measured values per file, in columns.
+
+    Parameters
+    ----------
+    files : list or None
+        File names to start with.
+    """
+    def __init__(self, files=None):
+        self.files = []
+        self.rows = {}
+        self.capacity = 0
+        self.status = OrderedDict()
+        self.values = OrderedDict()
+        self.add_files(files or [])
+
+    def __len__(self):
+        return len(self.files)
+
+    def add_files(self, files):
+        """Add rows for the files not in the table yet.
+
+        Returns
+        -------
+        rows : np.array
+            Row of each file.
+        """
+        new = [f for f in files if f not in self.rows]
+        for f_name in new:
+            if f_name not in self.rows:
+                self.rows[f_name] = len(self.files)
+                self.files.append(f_name)
+
+        if len(self.files) > self.capacity:
+            capacity = max(len(self.files), 2 * self.capacity, 16)
+            for check, column in self.status.items():
+                self.status[check] = self._grow(column, capacity, UNKNOWN)
+            for name, column in self.values.items():
+                self.values[name] = self._grow(column, capacity, np.nan)
+            self.capacity = capacity
+        return np.array([self.rows[f] for f in files], dtype=int)
+
+    @staticmethod
+    def _grow(column, capacity, fill):
+        grown = np.full(capacity, fill, dtype=column.dtype)
+        grown[:len(column)] = column
+        return grown
+
+    def _column(self, columns, name, dtype, fill):
+        if name not in columns:
+            columns[name] = np.full(self.capacity, fill, dtype=dtype)
+        return columns[name]
+
+    def set_status(self, check, status_dict):
+        """Record a check's results, like fill_file_status.
+
+        Parameters
+        ----------
+        check : str
+            Check name, i.e. 'Silent'.
+        status_dict : dict
+            Keys = file names, values = True, False or None.
+        """
+        names = list(status_dict)
+        rows = self.add_files(names)
+        column = self._column(self.status, check, np.int8, UNKNOWN)
+        column[rows] = [_CODES[status_dict[f]] for f in names]
+
+    def set_values(self, name, value_dict):
+        """Record a measured value per file.
+
+        Parameters
+        ----------
+        name : str
+            Name of the measurement, i.e. 'Mixing_Coeff'.
+        value_dict : dict
+            Keys = file names, values = float or None.
+        """
+        names = list(value_dict)
+        rows = self.add_files(names)
+        column = self._column(self.values, name, np.float64, np.nan)
+        column[rows] = [
+            np.nan if value_dict[f] is None else value_dict[f] for f in names
+        ]
+
+    def column(self, name):
+        """The status codes of a check or values of a measurement, one per
+        file in self.files.
+        """
+        if name in self.status:
+            return self.status[name][:len(self.files)]
+        return self.values[name][:len(self.files)]
+
+    def failed(self, check=None):
+        """Names of the files failing a check, or any check if None.
+        """
+        n_files = len(self.files)
+        mask = np.zeros(n_files, dtype=bool)
+        checks = self.status if check is None else [check]
+        for name in checks:
+            if name in self.status:
+                mask |= self.status[name][:n_files] == FAIL
+        return [self.files[i] for i in np.flatnonzero(mask)]
+
+    def where(self, name, predicate):
+        """Names of the files whose measured value satisfies predicate, a
+        function mapping the value column to a bool array, e.g.
+        table.where('Offset_ms', lambda v: np.abs(v) > 5).
+        """
+        with np.errstate(invalid='ignore'):
+            mask = predicate(self.column(name))
+        return [self.files[i] for i in np.flatnonzero(mask)]
+
+    def counts(self):
+        """Number of files failing each check.
+        """
+        n_files = len(self.files)
+        return dict(
+            (check, int(np.count_nonzero(column[:n_files] == FAIL)))
+            for check, column in self.status.items()
+        )
+
+    def problems(self, messages):
+        """Error messages for every failed check, as create_problems,
+        i.e. file by file in row order, then by check in the order the
+        checks were added.
+
+        Parameters
+        ----------
+        messages : dict
+            Check name -> message, i.e. validation.PROBLEMS.
+        """
+        checks = list(self.status)
+        if not checks:
+            return []
+        n_files = len(self.files)
+        failed = np.array([self.status[check][:n_files] == FAIL
+                           for check in checks])
+        rows, cols = np.nonzero(failed.T)
+        return [
+            "{} : {}".format(self.files[i], messages[checks[j]])
+            for i, j in zip(rows, cols)
+        ]
+
+    def record(self, f_name):
+        """Status and values of one file.
+        """
+        i = self.rows[f_name]
+        record = dict(
+            (check, _STATUS[int(column[i])])
+            for check, column in self.status.items()
+        )
+        for name, column in self.values.items():
+            if not np.isnan(column[i]):
+                record[name] = float(column[i])
+        return record
+
+    def to_file_status(self):
+        """The status columns as a dict of dicts, as check_audio returns.
+        """
+        n_files = len(self.files)
+        columns = [(check, column[:n_files].tolist())
+                   for check, column in self.status.items()]
+        return dict(
+            (f_name, dict((check, _STATUS[codes[i]])
+                          for check, codes in columns))
+            for i, f_name in enumerate(self.files)
+        )
+
+    @classmethod
+    def from_file_status(cls, file_status, values=None):
+        """Build a table from a file_status dict and optional measured
+        values (name -> {file name: value}). Rows and checks keep the
+        order they first appear in file_status, and values that are not
+        check results, such as tracing's 'Trace' lists, are left out.
+        """
+        table = cls(list(file_status))
+        checks = []
+        for status_dict in file_status.values():
+            checks.extend(check for check, status in status_dict.items()
+                          if is_status(status) and check not in checks)
+        for check in checks:
+            table.set_status(check, dict(
+                (f_name, status_dict[check])
+                for f_name, status_dict in file_status.items()
+                if check in status_dict and is_status(status_dict[check])
+            ))
+        for name, value_dict in sorted((values or {}).items()):
+            table.set_values(name, value_dict)
+        return table
+
+    def extend(self, other, prefix=''):
+        """Append the rows of another table, with their file names prefixed
+        (e.g. by session) to keep them unique.
+        """
+        names = [prefix + f for f in other.files]
+        rows = self.add_files(names)
+        n_other = len(other.files)
+        for check, column in other.status.items():
+            self._column(self.status, check, np.int8, UNKNOWN)[rows] = \
+                column[:n_other]
+        for name, column in other.values.items():
+            self._column(self.values, name, np.float64, np.nan)[rows] = \
+                column[:n_other]
+        return self
+
+    def write_json_lines(self, fhandle):
+        """Write one JSON object per file, with its 'file' name, statuses
+        and values.
+        """
+        for f_name in self.files:
+            record = self.record(f_name)
+            record['file'] = f_name
+            fhandle.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def to_arrow(self):
+        """The table as a pyarrow.Table, with status columns as nullable
+        booleans. Requires pyarrow.
+        """
+        if pyarrow is None:
+            raise ImportError("to_arrow requires pyarrow.")
+        n_files = len(self.files)
+        arrays = [pyarrow.array(self.files)]
+        names = ['file']
+        for check in sorted(self.status):
+            codes = self.status[check][:n_files]
+            arrays.append(pyarrow.array(
+                codes == PASS, mask=codes == UNKNOWN, type=pyarrow.bool_()
+            ))
+            names.append(check)
+        for name in sorted(self.values):
+            column = self.values[name][:n_files]
+            arrays.append(pyarrow.array(column, mask=np.isnan(column)))
+            names.append(name)
+        return pyarrow.Table.from_arrays(arrays, names=names)
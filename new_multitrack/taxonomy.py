@@ -0,0 +1,206 @@
+""" Instrument taxonomy, loaded once per process.
+
+taxonomy.yaml nests instruments under groups (e.g. strings > bowed >
+violin). The index compiled from it maps each group to its sorted
+instruments, each instrument to its group, and alternative spellings of
+each instrument to its name.
+"""
+import os
+import json
+import hashlib
+from . import metadata_io
+
+
+TAXONOMY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'taxonomy.yaml')
+
+# Folder compiled indexes are cached in between runs.
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or
+    os.path.join(os.path.expanduser('~'), '.cache'),
+    'medleydebugger'
+)
+
+# Bumped whenever the layout of the index changes, so old cache files are
+# rebuilt instead of misread.
+INDEX_VERSION = 1
+
+# Common names for instruments that differ from their taxonomy name by more
+# than case, spacing or punctuation.
+ALIASES = {
+    'bass guitar': 'electric bass',
+    'drum kit': 'drum set',
+    'drums': 'drum set',
+    'hi hat': 'high hat',
+    'hihat': 'high hat',
+    'keyboard': 'synthesizer',
+    'synth': 'synthesizer',
+    'vocals': 'vocalists',
+}
+
+# Indexes keyed by absolute taxonomy path.
+_INDEXES = {}
+
+
+def normalize(name):
+    """Normalise an instrument name for lookups: lower case, with
+    underscores and dashes read as spaces and runs of spaces collapsed.
+    """
+    name = name.lower().replace('_', ' ').replace('-', ' ')
+    return ' '.join(name.split())
+
+
+def build_index(taxonomy):
+    """Compile a taxonomy as loaded from taxonomy.yaml into an index.
+
+    Parameters
+    ----------
+    taxonomy : dict
+        Group name -> nested dicts and lists of instrument names.
+
+    Returns
+    -------
+    index : dict
+        'groups' : dict, group -> sorted list of its instruments.
+        'inst_group' : dict, instrument -> group. An instrument listed in
+        several groups belongs to the first in sorted order.
+        'aliases' : dict, normalised spelling -> instrument.
+    """
+    groups = {}
+    inst_group = {}
+    for group in sorted(taxonomy):
+        leaves = set()
+        stack = [taxonomy[group]]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                stack.extend(node.values())
+            else:
+                leaves.update(node)
+        groups[group] = sorted(leaves)
+        for inst in groups[group]:
+            inst_group.setdefault(inst, group)
+
+    aliases = {}
+    for inst in inst_group:
+        aliases[normalize(inst)] = inst
+    for alias, inst in ALIASES.items():
+        if inst in inst_group:
+            aliases.setdefault(normalize(alias), inst)
+
+    return {'groups': groups, 'inst_group': inst_group, 'aliases': aliases}
+
+
+def _source_signature(taxonomy_path):
+    stat = os.stat(taxonomy_path)
+    return [INDEX_VERSION, stat.st_mtime, stat.st_size]
+
+
+def save_index(index, taxonomy_path, cache_path):
+    """Write an index to a JSON cache file, stamped with the taxonomy file
+    it was compiled from.
+    """
+    cached = dict(index)
+    cached['source'] = _source_signature(taxonomy_path)
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    temp = "{}.{}.tmp".format(cache_path, os.getpid())
+    with open(temp, 'w') as fhandle:
+        json.dump(cached, fhandle, sort_keys=True)
+    os.rename(temp, cache_path)
+
+
+def _read_cache(cache_path):
+    # a missing, truncated or otherwise unreadable cache is rebuilt
+    try:
+        with open(cache_path, 'r') as fhandle:
+            cached = json.load(fhandle)
+    except (ValueError, IOError, OSError):
+        return {}
+    return cached if isinstance(cached, dict) else {}
+
+
+def load_index(taxonomy_path=TAXONOMY_PATH, cache_path=None):
+    """Load the index of a taxonomy file. If cache_path holds an index of
+    the file's current contents it is read instead of the YAML; otherwise,
+    or if the cache cannot be read, the index is compiled and, if
+    cache_path is given, saved there.
+
+    Parameters
+    ----------
+    taxonomy_path : str
+        Path to a taxonomy YAML file.
+    cache_path : str or None
+        Path to a JSON cache of the index.
+
+    Returns
+    -------
+    index : dict
+        See build_index.
+    """
+    if cache_path is not None:
+        cached = _read_cache(cache_path)
+        if cached.pop('source', None) == _source_signature(taxonomy_path):
+            return cached
+
+    with open(taxonomy_path, 'r') as fhandle:
+        index = build_index(metadata_io.load_yaml(fhandle))
+
+    if cache_path is not None:
+        try:
+            save_index(index, taxonomy_path, cache_path)
+        except (IOError, OSError):
+            pass
+    return index
+
+
+def default_cache_path(taxonomy_path):
+    """Get the path in CACHE_DIR the index of a taxonomy file is cached at.
+    """
+    digest = hashlib.sha1(
+        os.path.abspath(taxonomy_path).encode('utf-8')
+    ).hexdigest()
+    return os.path.join(CACHE_DIR, 'taxonomy_{}.json'.format(digest[:16]))
+
+
+def get_index(taxonomy_path=TAXONOMY_PATH, cache_path=None):
+    """Get the index of a taxonomy file, loading it on first use in this
+    process from the cache file at cache_path (default_cache_path if None)
+    when it is current. See load_index.
+    """
+    key = os.path.abspath(taxonomy_path)
+    if key not in _INDEXES:
+        if cache_path is None:
+            cache_path = default_cache_path(taxonomy_path)
+        _INDEXES[key] = load_index(taxonomy_path, cache_path)
+    return _INDEXES[key]
+
+
+def canonical_name(name, index=None):
+    """Get the taxonomy name of an instrument from any known spelling.
+
+    Returns
+    -------
+    inst : str or None
+        Instrument name, or None if it is not in the taxonomy.
+    """
+    if index is None:
+        index = get_index()
+    return index['aliases'].get(normalize(name))
+
+
+def instrument_group(name, index=None):
+    """Get the group an instrument belongs to, from any known spelling.
+
+    Returns
+    -------
+    group : str or None
+        Group name, or None if the instrument is not in the taxonomy.
+    """
+    if index is None:
+        index = get_index()
+    inst = canonical_name(name, index)
+    if inst is None:
+        return None
+    return index['inst_group'][inst]
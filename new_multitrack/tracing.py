@@ -0,0 +1,259 @@
+""" Opt-in timing and tracing of the validation helpers.
+
+Functions decorated with traced cost one global lookup while tracing is
+off. While it is on, every call is recorded with its wall time, CPU time,
+bytes of audio read, peak allocation and the files it was given:
+
+    tracer = tracing.start_tracing()
+    file_status = validation.check_audio(raw_path, stem_path, mix_path)
+    tracing.stop_tracing()
+    tracer.export('trace.json')  # open in chrome://tracing or Perfetto
+    tracing.attach(file_status, tracer)
+
+Only calls in the process that started tracing are recorded; jobs that run
+in pool processes appear as the time their parent call spent waiting.
+"""
+import os
+import json
+import time
+import threading
+import functools
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+cpu_time = getattr(time, 'process_time', None) or time.clock
+
+# The active Tracer, or None while tracing is off.
+_TRACER = None
+
+
+class Span(object):
+    """A traced call in progress.
+    """
+    def __init__(self, name, files):
+        self.name = name
+        self.files = files
+        self.bytes_read = 0
+        self.base_memory = 0
+        self.peak_memory = 0
+        self.start = time.time()
+        self.cpu = cpu_time()
+
+
+class Tracer(object):
+    """Collects one record per traced call.
+
+    Parameters
+    ----------
+    memory : bool
+        Track peak allocation with tracemalloc (slows traced code down).
+    """
+    def __init__(self, memory=False):
+        self.memory = memory and tracemalloc is not None
+        self.started_tracemalloc = False
+        self.origin = time.time()
+        self.records = []
+        self.local = threading.local()
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def enter(self, name, files):
+        span = Span(name, files)
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self._propagate_peak(peak)
+            span.base_memory = current
+            span.peak_memory = current
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        self.stack().append(span)
+        return span
+
+    def _propagate_peak(self, peak):
+        for span in self.stack():
+            span.peak_memory = max(span.peak_memory, peak)
+
+    def exit(self, span):
+        wall = time.time() - span.start
+        cpu = cpu_time() - span.cpu
+        stack = self.stack()
+        stack.pop()
+
+        peak = None
+        if self.memory:
+            span.peak_memory = max(
+                span.peak_memory, tracemalloc.get_traced_memory()[1]
+            )
+            self._propagate_peak(span.peak_memory)
+            peak = span.peak_memory - span.base_memory
+        if stack:
+            stack[-1].bytes_read += span.bytes_read
+
+        self.records.append({
+            'check': span.name,
+            'files': span.files,
+            'start': span.start - self.origin,
+            'wall': wall,
+            'cpu': cpu,
+            'bytes_read': span.bytes_read,
+            'peak_bytes': peak,
+            'thread': threading.current_thread().ident,
+            'depth': len(stack),
+        })
+
+    def count_bytes(self, n_bytes):
+        stack = self.stack()
+        if stack:
+            stack[-1].bytes_read += n_bytes
+
+    def summary(self):
+        """Totals per check.
+
+        Returns
+        -------
+        summary : dict
+            check -> dict with 'calls', 'wall', 'cpu' and 'bytes_read'.
+        """
+        summary = {}
+        for record in self.records:
+            total = summary.setdefault(record['check'], {
+                'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes_read': 0
+            })
+            total['calls'] += 1
+            total['wall'] += record['wall']
+            total['cpu'] += record['cpu']
+            total['bytes_read'] += record['bytes_read']
+        return summary
+
+    def chrome_trace(self):
+        """The records in Chrome trace event format.
+        """
+        events = []
+        for record in self.records:
+            events.append({
+                'name': record['check'],
+                'cat': 'validation',
+                'ph': 'X',
+                'ts': int(record['start'] * 1e6),
+                'dur': int(record['wall'] * 1e6),
+                'pid': os.getpid(),
+                'tid': record['thread'],
+                'args': {
+                    'files': record['files'],
+                    'cpu': record['cpu'],
+                    'bytes_read': record['bytes_read'],
+                    'peak_bytes': record['peak_bytes'],
+                },
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, fpath):
+        """Write the records to fpath as a Chrome trace JSON file.
+        """
+        with open(fpath, 'w') as fhandle:
+            json.dump(self.chrome_trace(), fhandle)
+
+
+def start_tracing(memory=False):
+    """Start recording traced calls in this process.
+
+    Parameters
+    ----------
+    memory : bool
+        Also record peak allocation, using tracemalloc where available.
+
+    Returns
+    -------
+    tracer : Tracer
+        The tracer the calls are recorded to.
+    """
+    global _TRACER
+    tracer = Tracer(memory)
+    if tracer.memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        tracer.started_tracemalloc = True
+    _TRACER = tracer
+    return tracer
+
+
+def stop_tracing():
+    """Stop recording traced calls.
+
+    Returns
+    -------
+    tracer : Tracer or None
+        The tracer that was active.
+    """
+    global _TRACER
+    tracer = _TRACER
+    _TRACER = None
+    if tracer is not None and tracer.started_tracemalloc:
+        tracemalloc.stop()
+    return tracer
+
+
+def count_bytes(n_bytes):
+    """Add n_bytes of audio read to the innermost traced call.
+    """
+    if _TRACER is not None:
+        _TRACER.count_bytes(n_bytes)
+
+
+def _files(args, depth=0):
+    files = []
+    for arg in args:
+        if isinstance(arg, string_types) and arg.lower().endswith('.wav'):
+            files.append(os.path.basename(arg))
+        elif isinstance(arg, (list, tuple)) and depth < 2:
+            files.extend(_files(arg, depth + 1))
+    return files
+
+
+def traced(func):
+    """Record calls to func while tracing is on.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tracer = _TRACER
+        if tracer is None:
+            return func(*args, **kwargs)
+        span = tracer.enter(func.__name__, _files(args))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            tracer.exit(span)
+    return wrapper
+
+
+def attach(file_status, tracer):
+    """Add the records of every traced call involving a file to that file's
+    status dict under 'Trace'. create_problems ignores it.
+
+    Parameters
+    ----------
+    file_status : dict
+        As returned by check_audio or check_multitrack.
+    tracer : Tracer
+        Tracer active while file_status was computed.
+
+    Returns
+    -------
+    file_status : dict
+        The same dict, with 'Trace' lists added.
+    """
+    for record in tracer.records:
+        for f_name in set(record['files']):
+            if f_name in file_status:
+                file_status[f_name].setdefault('Trace', []).append(record)
+    return file_status
@@ -1,15 +1,16 @@
 import os
 import glob
-import struct
-import wave
-import sox
+import hashlib
 import numpy as np
-import tempfile
-import librosa
-import scipy.io.wavfile as wavfile
-import scipy.optimize.nnls as nnls
-import argparse
-import json
+import scipy.linalg
+from scipy.optimize import nnls
+import multiprocessing
+from functools import partial
+from . import alignment
+from . import audio_io
+from . import taxonomy
+from . import tracing
+from . import result_table
 
 
 # Dictionary that creates the invalid dialog error messages associated with error checks. #
@@ -31,6 +32,73 @@ PROBLEMS = {
     'Speech': 'File contains speech segments.',
 }
 
+# Status keys filled by check_multitrack, mapped to the analysis that computes
+# them and the position of their status dict in that analysis' return value. #
+MULTITRACK_CHECKS = [
+    ('Raw_Sum_Alignment', 'alignment', 0),
+    ('Stem_Sum_Alignment', 'alignment', 1),
+    ('Raw_to_Stem_Alignment', 'alignment', 2),
+    ('Raws_In_Stems', 'inclusion', 0),
+    ('Stems_In_Mix', 'inclusion', 1),
+    ('Instrument_Label', 'labels', 0),
+    ('Raws_Match_Stems', 'labels', 1),
+]
+
+# Group of the stem holding a whole submix rather than one instrument. Any
+# raw may be mapped to it. #
+MAIN_SYSTEM = 'Main System'
+
+# Pairs of different instrument groups whose raws may still make up one
+# stem, e.g. acoustic and electric guitars in a guitar stem. #
+COMPATIBLE_GROUPS = set([
+    ('strings', 'electric'),
+    ('electric', 'strings'),
+])
+
+# Number of frames streamed from disk at a time when computing mixing coefficients.
+COEFF_BLOCK_SIZE = 2 ** 16
+
+# Pyramid rate of the coarse mixing coefficient solve, the length (seconds)
+# of the windows its residual is measured in, and the fraction of windows
+# with the highest residual that are re-solved at the full sample rate.
+COEFF_COARSE_SR = 4000
+COEFF_WINDOW = 1.0
+COEFF_REFINE_FRACTION = 0.1
+
+# Approximate number of frames analysed at a time when detecting silence.
+SILENCE_BLOCK_SIZE = 2 ** 18
+
+# Silent regions at least this long (seconds) fail the Silent_Sections check. #
+SILENT_SECTION_MIN_DUR = 5.0
+
+# Number of points in the RMS envelope files are compared by when looking
+# for duplicates, and the cosine similarity above which two envelopes of
+# equally long files count as the same audio at different gains.
+DUPLICATE_ENVELOPE_LENGTH = 256
+DUPLICATE_SIMILARITY = 0.999
+
+# Sample rate alignment is measured at, and the largest offset (in samples
+# at that rate) still considered aligned.
+ALIGNMENT_SR = 1000
+ALIGNMENT_TOLERANCE = 5
+
+# Length in seconds and number of the windows alignment is measured in.
+ALIGNMENT_WINDOW = 5.0
+ALIGNMENT_N_WINDOWS = 4
+
+# Number of files whose spectra alignment_table transforms at a time.
+ALIGNMENT_BATCH_SIZE = 16
+
+# Version of the results stored in a ResultCache. Bump it whenever the shape
+# or meaning of a cached result changes, so older entries are not reused.
+CACHE_VERSION = 3
+
+
+class ValidationCancelled(Exception):
+    """Raised from a progress callback to abandon a validation run.
+    """
+    pass
+
 
 def fill_file_status(file_status, status_dict, secondary_key):
     """Map inner keys of file_status to status_dict keys. Use this to 
@@ -58,7 +126,41 @@ def fill_file_status(file_status, status_dict, secondary_key):
     return file_status
 
 
-def check_audio(raw_path, stem_path, mix_path):
+def run_check_plan(file_status, check_plan, analyses):
+    """Fill file_status from a check plan, running each analysis at most
+    once no matter how many status keys depend on it.
+
+    Parameters
+    ----------
+    file_status : dict
+        Outer dictionary containing status_dict.
+        Keys = list of files, values = status_dict contents (check : T/F).
+    check_plan : list
+        List of (secondary_key, analysis name, result index) tuples, i.e.
+        MULTITRACK_CHECKS.
+    analyses : dict
+        Keys = analysis name, values = callable taking no arguments and
+        returning a tuple of status dicts.
+
+    Returns
+    -------
+    file_status : dict
+        Outer dictionary containing status_dict.
+        Keys = list of files, values = status_dict contents (check : T/F).
+    """
+    results = {}
+    for secondary_key, analysis, index in check_plan:
+        if analysis not in results:
+            results[analysis] = analyses[analysis]()
+        file_status = fill_file_status(
+            file_status, results[analysis][index], secondary_key
+        )
+    return file_status
+
+
+@tracing.traced
+def check_audio(raw_path, stem_path, mix_path, n_workers=1, cache=None,
+                progress=None):
     """Populate file_status dict with correct error check results. Send
     this result to create_problems.
 
@@ -70,6 +172,14 @@ def check_audio(raw_path, stem_path, mix_path):
         Path to stem folder.
     mix_path : str
         Path to mix file.
+    n_workers : int
+        Number of processes to run the per-file checks in. Default=1 runs
+        them in this process.
+    cache : ResultCache or None
+        Store of results from previous runs. Files whose fingerprint is
+        unchanged are not re-checked.
+    progress : function or None
+        Called as progress('files', completed, total) as files are checked.
 
     Returns
     -------
@@ -80,11 +190,12 @@ def check_audio(raw_path, stem_path, mix_path):
 
     file_list = []
     file_status = {}
-    
+
+    audio_io.clear_cache()
 
     mix_file = [os.path.basename(mix_path)]
-    stem_files = glob.glob(os.path.join(stem_path, '*.wav'))
-    raw_files = glob.glob(os.path.join(raw_path, '*.wav'))
+    stem_files = sorted(glob.glob(os.path.join(stem_path, '*.wav')))
+    raw_files = sorted(glob.glob(os.path.join(raw_path, '*.wav')))
 
     new_stems = [os.path.basename(path) for path in stem_files]
     new_raws = [os.path.basename(path) for path in raw_files]
@@ -113,19 +224,39 @@ def check_audio(raw_path, stem_path, mix_path):
     if not np.all(empty_status.values()):
         return file_status
 
-    stats_status = stats_check(raw_files, stem_files, mix_path)
-    file_status = fill_file_status(file_status, stats_status, 'Wrong_Stats')
-
-    length_status = length_check(raw_files, stem_files, mix_path)
-    file_status = fill_file_status(file_status, length_status, 'Length_As_Mix')
-
-    silence_status = silence_check(raw_files, stem_files, mix_path)
-    file_status = fill_file_status(file_status, silence_status, 'Silent')
+    mix_length = get_length(mix_path)
+    jobs = [(stem, 'stem', mix_length) for stem in stem_files] + \
+        [(raw, 'raw', mix_length) for raw in raw_files] + \
+        [(mix_path, 'mix', None)]
+
+    files = [[job[0]] for job in jobs]
+    results = map_cached_jobs(
+        check_file, jobs, files, 'file_checks', cache, n_workers,
+        report_progress(progress, 'files')
+    )
+    signatures = {'stem': {}, 'raw': {}}
+    paths = {}
+    for (fpath, file_type, _), (f_name, status_dict, signature) in \
+            zip(jobs, results):
+        file_status[f_name].update(status_dict)
+        if signature is not None:
+            signatures[file_type][f_name] = signature
+            paths[f_name] = fpath
+
+    for file_type, secondary_key in [('stem', 'Stem_Duplicates'),
+                                     ('raw', 'Raw_Duplicates')]:
+        pairs = find_duplicates(signatures[file_type], paths)
+        duplicated = set(f for pair in pairs for f in pair)
+        file_status = fill_file_status(file_status, dict(
+            (f, f not in duplicated) for f in signatures[file_type]
+        ), secondary_key)
 
     return file_status
 
 
-def check_multitrack(raw_files, stem_files, mix_path, raw_info):
+@tracing.traced
+def check_multitrack(raw_files, stem_files, mix_path, raw_info, n_workers=1,
+                     progress=None, cache=None, stem_info=None, values=None):
     """Populate file_status dict with correct error check results. Send
     this result to create_problems. This is the second check, after the raw
     and stem information is collected.
@@ -133,13 +264,30 @@ def check_multitrack(raw_files, stem_files, mix_path, raw_info):
     Parameters
     ----------
     raw_files : str
-        List of paths to raw folder
+        List of paths to raw folder. If empty, only the checks that do not
+        involve raws are run.
     stem_files : str
         List of paths to stem folder
     mix_path : str
         Path to mix file.
     raw_info: dict
         Maps raw to stems.
+    n_workers : int
+        Number of processes to run the per-stem analyses in. Default=1.
+    progress : function or None
+        Called as progress(analysis, completed, total) as analysis jobs
+        finish, with analysis being 'alignment' or 'inclusion'.
+    cache : ResultCache or None
+        Store of results from previous runs. Only the group analyses
+        involving a file whose fingerprint changed are recomputed.
+    stem_info : dict or None
+        Stem labels, keys = stem basename, values = dict with 'inst' and
+        optionally 'group'. Without it only raw labels are checked.
+    values : dict or None
+        If given, filled with the measured values behind the checks, for
+        result_table.ResultTable.from_file_status: name -> {file: value}
+        for 'Mixing_Coeff', 'Inclusion_Residual', 'Offset_ms' and
+        'Offset_Confidence'.
 
     Returns
     -------
@@ -151,15 +299,21 @@ def check_multitrack(raw_files, stem_files, mix_path, raw_info):
     file_list = []
     file_status = {}
 
+    audio_io.clear_cache()
+
     mix_file = [os.path.basename(mix_path)]
 
     raw_names = [os.path.basename(f) for f in raw_files]
     stem_name = [os.path.basename(f) for f in stem_files]
 
     stem_path = os.path.dirname(stem_files[0]).split('/')[-1]
-    raw_path = os.path.dirname(raw_files[0]).split('/')[-1]
+    raw_path = None
+    folders = [stem_path]
+    if raw_files:
+        raw_path = os.path.dirname(raw_files[0]).split('/')[-1]
+        folders.append(raw_path)
 
-    file_list = mix_file + raw_names + stem_name + [stem_path] + [raw_path]
+    file_list = mix_file + raw_names + stem_name + folders
 
     for item in file_list:
         file_status[item] = {
@@ -174,36 +328,35 @@ def check_multitrack(raw_files, stem_files, mix_path, raw_info):
             'Raw_Duplicates': None,
         }
 
-    # Sum of raws not aligned with mix
-    raw_sum_alignment_status, stem_sum_alignment_status, raw_to_stem_alignment_status = is_aligned(raw_files, stem_files, raw_path, stem_path, mix_path, raw_info)
-    file_status = fill_file_status(file_status, raw_sum_alignment_status, 'Raw_Sum_Alignment')
-
-    # Sum of stems aligned with mix
-    raw_sum_alignment_status, stem_sum_alignment_status, raw_to_stem_alignment_status = is_aligned(raw_files, stem_files, raw_path, stem_path, mix_path, raw_info)
-    file_status = fill_file_status(file_status, stem_sum_alignment_status, 'Stem_Sum_Alignment')
-
-    # individual raws aligned with stems
-    raw_sum_alignment_status, stem_sum_alignment_status, raw_to_stem_alignment_status = is_aligned(raw_files, stem_files, raw_path, stem_path, mix_path, raw_info)
-    file_status = fill_file_status(file_status, raw_to_stem_alignment_status, 'Raw_to_Stem_Alignment')
-
-    raw_inclusion_status, stem_inclusion_status = is_included(stem_files, raw_files, stem_path, mix_path, raw_info)
-    file_status = fill_file_status(file_status, raw_inclusion_status, 'Raws_In_Stems')
-
-    raw_inclusion_status, stem_inclusion_status = is_included(stem_files, raw_files, stem_path, mix_path, raw_info)
-    file_status = fill_file_status(file_status, stem_inclusion_status, 'Stems_In_Mix')
+    analyses = {
+        'alignment': partial(
+            is_aligned, raw_files, stem_files, raw_path, stem_path,
+            mix_path, raw_info, n_workers=n_workers, progress=progress,
+            cache=cache, values=values
+        ),
+        'inclusion': partial(
+            is_included, stem_files, raw_files, stem_path, mix_path,
+            raw_info, n_workers=n_workers, progress=progress, cache=cache,
+            values=values
+        ),
+        'labels': partial(label_check, stem_info, raw_info),
+    }
+    file_status = run_check_plan(file_status, MULTITRACK_CHECKS, analyses)
 
     return file_status
 
 
+@tracing.traced
 def create_problems(file_status):
     """Search for errors (false results) in file_status dict then map
     to readable error messages from PROBLEMS dictionary.
 
     Parameters
     ----------
-    file_status : dict
+    file_status : dict or ResultTable
         Outer dictionary containing status_dict. 
         Keys = list of files, values = status_dict contents (check : T/F).
+        A ResultTable of the same results gives the same problems.
 
     Returns
     -------
@@ -211,6 +364,9 @@ def create_problems(file_status):
         Contains all error messages and associated file names that
         resulted from a false error check.
     """
+    if isinstance(file_status, result_table.ResultTable):
+        return file_status.problems(PROBLEMS)
+
     problems = []
 
     for f_name in file_status:
@@ -221,6 +377,7 @@ def create_problems(file_status):
     return problems
 
 
+@tracing.traced
 def stats_check(raw_files, stem_files, mix_path):
     """Use is_right_stats to check if each file is correctly formatted,
     then populate stats_dict with bool result associated with each file check.
@@ -264,6 +421,7 @@ def stats_check(raw_files, stem_files, mix_path):
     return stats_dict
 
 
+@tracing.traced
 def length_check(raw_files, stem_files, mix_path):
     """Use is_right_length to check if stem and raw files are the same length as mix,
     then populate length_dict with bool result associated with each file check.
@@ -303,6 +461,7 @@ def length_check(raw_files, stem_files, mix_path):
     return length_dict
 
 
+@tracing.traced
 def silence_check(raw_files, stem_files, mix_path):
     """Use is_silence to check for silent files, then populates
     silence_dict with bool associated with each file check.
@@ -346,6 +505,7 @@ def silence_check(raw_files, stem_files, mix_path):
     return silence_dict
 
 
+@tracing.traced
 def empty_check(raw_path, stem_path):
     """Use has_wavs to make sure selected raw and stem folders
     are not empty.
@@ -380,9 +540,388 @@ def empty_check(raw_path, stem_path):
     return empty_dict
 
 
+@tracing.traced
+def label_check(stem_info, raw_info, index=None):
+    """Check every stem and raw instrument label against the taxonomy, and
+    that each raw is mapped to an existing stem whose instrument group it
+    plausibly belongs to. Every file is a few dict and set lookups.
+
+    Parameters
+    ----------
+    stem_info : dict or None
+        Keys = stem basename, values = dict with 'inst' and optionally
+        'group' (otherwise taken from the taxonomy).
+    raw_info : dict
+        Keys = raw basename, values = dict with 'inst' and 'stem'. As in
+        the GUI, raws as well as stems may be labelled MAIN_SYSTEM; such
+        raws only match MAIN_SYSTEM stems.
+    index : dict or None
+        Taxonomy index, see taxonomy.build_index. Default=the packaged one.
+
+    Returns
+    -------
+    label_dict : dict
+        Keys = stem and raw basenames, values = bool (True if the label is
+        a known instrument, consistent with the stem's group).
+    match_dict : dict
+        Keys = raw basenames, values = bool (True if the raw's stem exists
+        and its group is compatible with the raw's), or None if the labels
+        are unknown.
+    """
+    if index is None:
+        index = taxonomy.get_index()
+
+    label_dict = {}
+    stem_groups = {}
+    for stem, info in (stem_info or {}).items():
+        inst = info.get('inst', '')
+        group = info.get('group') or None
+        if inst == MAIN_SYSTEM or group == MAIN_SYSTEM:
+            label_dict[stem] = inst == MAIN_SYSTEM and \
+                group in (None, MAIN_SYSTEM)
+            stem_groups[stem] = MAIN_SYSTEM
+            continue
+        inst_group = taxonomy.instrument_group(inst, index)
+        label_dict[stem] = inst_group is not None and \
+            group in (None, inst_group)
+        stem_groups[stem] = inst_group
+
+    match_dict = {}
+    for raw, info in raw_info.items():
+        if info.get('inst', '') == MAIN_SYSTEM:
+            raw_group = MAIN_SYSTEM
+        else:
+            raw_group = taxonomy.instrument_group(info.get('inst', ''), index)
+        label_dict[raw] = raw_group is not None
+        if stem_info is None:
+            continue
+
+        stem = info.get('stem', '')
+        if stem not in stem_groups:
+            match_dict[raw] = False
+        elif stem_groups[stem] is None or raw_group is None:
+            match_dict[raw] = None
+        else:
+            match_dict[raw] = stem_groups[stem] in (MAIN_SYSTEM, raw_group) \
+                or (stem_groups[stem], raw_group) in COMPATIBLE_GROUPS
+
+    return label_dict, match_dict
+
+
+@tracing.traced
+def check_file(job):
+    """Run the per-file checks of check_audio on a single file. Takes one
+    tuple so it can be mapped over a process pool.
+
+    Parameters
+    ----------
+    job : tuple
+        (fpath, type, ref_length): path to a file, type of file (i.e. stem,
+        raw, mix) and the mix length to compare it to, or None to skip the
+        length check. Only the mix is checked for silent sections, since
+        stems and raws legitimately rest for long stretches. The checks
+        that read samples are skipped (left None) for files of the wrong
+        format or one audio_io cannot decode.
+
+    Returns
+    -------
+    f_name : str
+        Basename of the file.
+    status_dict : dict
+        Keys = check name, i.e. 'Silent', values = bool (True if check passes).
+    signature : dict or None
+        duplicate_signature of stems and raws, None for the mix or if the
+        samples were not read.
+    """
+    fpath, file_type, ref_length = job
+
+    status_dict = {}
+    status_dict['Wrong_Stats'] = is_right_stats(fpath, file_type)
+    if ref_length is not None:
+        status_dict['Length_As_Mix'] = is_right_length(fpath, ref_length)
+    if not status_dict['Wrong_Stats'] or not audio_io.is_supported(fpath):
+        return os.path.basename(fpath), status_dict, None
+
+    silent, sections = find_silence(fpath)
+    status_dict['Silent'] = not silent
+    signature = None
+    if file_type == 'mix':
+        status_dict['Silent_Sections'] = not has_silent_sections(sections)
+    else:
+        signature = duplicate_signature(fpath)
+
+    return os.path.basename(fpath), status_dict, signature
+
+
 # Helper functions that perform the heavy-lifting for the error-checks:
 # The results of these checks are called above to create the nested dictionaries of errors.
 
+@tracing.traced
+def map_jobs(func, jobs, n_workers=1, progress=None):
+    """Apply func to every job, across a pool of processes if n_workers
+    is greater than one. Results are returned in the order of jobs.
+
+    Parameters
+    ----------
+    func : function
+        Module level function taking a single job.
+    jobs : list
+        Arguments to call func with.
+    n_workers : int
+        Number of processes to use.
+    progress : function or None
+        Called as progress(completed, total) after each job finishes. It
+        may raise (e.g. ValidationCancelled) to stop the remaining jobs.
+
+    Returns
+    -------
+    results : list
+        func(job) for each job.
+    """
+    n_jobs = len(jobs)
+    n_workers = min(n_workers, n_jobs)
+
+    pool = None
+    if n_workers > 1:
+        pool = multiprocessing.Pool(n_workers)
+        result_iter = pool.imap(func, jobs)
+    else:
+        result_iter = (func(job) for job in jobs)
+
+    results = []
+    try:
+        for result in result_iter:
+            results.append(result)
+            if progress is not None:
+                progress(len(results), n_jobs)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return results
+
+
+def cache_params():
+    """The results format version and the tuning constants cached results
+    depend on, which map_cached_jobs includes in every key.
+    """
+    return {
+        'version': CACHE_VERSION,
+        'pyramid_rates': list(audio_io.PYRAMID_RATES),
+        'envelope_rate': audio_io.ENVELOPE_RATE,
+        'coeff': [COEFF_COARSE_SR, COEFF_WINDOW, COEFF_REFINE_FRACTION],
+        'silence': [SILENCE_BLOCK_SIZE, SILENT_SECTION_MIN_DUR],
+        'duplicates': [DUPLICATE_ENVELOPE_LENGTH],
+        'alignment': [ALIGNMENT_SR, ALIGNMENT_TOLERANCE, ALIGNMENT_WINDOW,
+                      ALIGNMENT_N_WINDOWS],
+    }
+
+
+@tracing.traced
+def map_cached_jobs(func, jobs, files, check_name, cache=None, n_workers=1,
+                    progress=None):
+    """Like map_jobs, but look each job up in a result cache first and only
+    run the jobs that miss. A job's result is keyed by the job itself, the
+    fingerprints of every file it reads and cache_params, so editing any
+    one of them, or changing the results format or tuning, invalidates it.
+
+    Parameters
+    ----------
+    func : function
+        Module level function taking a single job. Its results must be
+        JSON serialisable.
+    jobs : list
+        Arguments to call func with.
+    files : list
+        For each job, the list of file paths its result depends on.
+    check_name : str
+        Name the results are stored under.
+    cache : ResultCache or None
+        Store of previous results. None runs every job.
+    n_workers : int
+        Number of processes to use.
+    progress : function or None
+        Called as progress(completed, total) after each job finishes,
+        counting cache hits as already completed.
+
+    Returns
+    -------
+    results : list
+        func(job) for each job.
+    """
+    if cache is None:
+        return map_jobs(func, jobs, n_workers, progress)
+
+    results = [None] * len(jobs)
+    params = cache_params()
+    keys = [cache.key(job_files, [params, job])
+            for job, job_files in zip(jobs, files)]
+    misses = []
+    for i, key in enumerate(keys):
+        found, value = cache.get(check_name, key)
+        if found:
+            results[i] = value
+        else:
+            misses.append(i)
+
+    n_hits = len(jobs) - len(misses)
+    if progress is not None and n_hits:
+        progress(n_hits, len(jobs))
+    miss_progress = None
+    if progress is not None:
+        def miss_progress(completed, total):
+            progress(n_hits + completed, len(jobs))
+
+    computed = map_jobs(
+        func, [jobs[i] for i in misses], n_workers, miss_progress
+    )
+    for i, value in zip(misses, computed):
+        results[i] = value
+        cache.set(check_name, keys[i], value)
+    cache.commit()
+
+    return results
+
+
+@tracing.traced
+def duplicate_signature(fpath):
+    """Summarise a wave file for find_duplicates: its RMS envelope (from
+    its pyramid) reduced to DUPLICATE_ENVELOPE_LENGTH points and scaled to
+    unit norm, so files that differ only in gain have the same envelope.
+    No samples are read beyond those the pyramid was built from.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to a wave file.
+
+    Returns
+    -------
+    signature : dict
+        'n_frames' : int, length of the file.
+        'channels' : int, number of channels.
+        'sample_rate' : int, sample rate of the file.
+        'envelope' : list, normalised envelope, all zeros if silent.
+    """
+    info = audio_io.probe(fpath)
+    power = audio_io.pyramid(fpath)['power']
+    edges = np.linspace(0, len(power), DUPLICATE_ENVELOPE_LENGTH + 1)
+    edges = edges.astype(int)
+    total = np.concatenate(([0.0], np.cumsum(power)))
+    envelope = np.sqrt(np.maximum(
+        (total[edges[1:]] - total[edges[:-1]]) /
+        np.maximum(np.diff(edges), 1), 0.0
+    ))
+    norm = np.sqrt(envelope.dot(envelope))
+    if norm > 0:
+        envelope = envelope / norm
+
+    return {
+        'n_frames': info['n_frames'],
+        'channels': info['channels'],
+        'sample_rate': info['sample_rate'],
+        'envelope': [float(v) for v in envelope],
+    }
+
+
+@tracing.traced
+def sample_hash(fpath):
+    """Get the hex md5 digest of the sample data of a wave file.
+    """
+    reader = audio_io.open_wav(fpath)
+    md5 = hashlib.md5()
+    for _, window in reader.blocks(SILENCE_BLOCK_SIZE):
+        md5.update(np.ascontiguousarray(window).tobytes())
+    return md5.hexdigest()
+
+
+def find_duplicates(signatures, paths=None, similarity=DUPLICATE_SIMILARITY):
+    """Find pairs of files holding the same audio, exactly or up to a gain
+    change. Only files of the same length, channel count and sample rate
+    are compared, so the work grows with the size of those groups rather
+    than with the square of the number of files. Identical files have
+    identical envelopes, so only files whose envelope equals another's
+    without settling the match (i.e. silent files) are hashed.
+
+    Parameters
+    ----------
+    signatures : dict
+        Keys = file names, values = duplicate_signature of the file, which
+        may also hold its sample_hash under 'md5'.
+    paths : dict or None
+        Keys = file names, values = paths, to compute missing hashes from.
+    similarity : float
+        Cosine similarity of envelopes above which files are near
+        duplicates. Silent files are only ever exact duplicates.
+
+    Returns
+    -------
+    pairs : list
+        Sorted (name, name) pairs of duplicate files.
+    """
+    groups = {}
+    for name in sorted(signatures):
+        signature = signatures[name]
+        groups.setdefault((
+            signature['n_frames'], signature['channels'],
+            signature.get('sample_rate')
+        ), []).append(name)
+
+    hashes = {}
+
+    def file_hash(name):
+        if name not in hashes:
+            hashes[name] = signatures[name].get('md5') or \
+                sample_hash(paths[name])
+        return hashes[name]
+
+    pairs = []
+    for names in groups.values():
+        if len(names) < 2:
+            continue
+        envelopes = np.array([signatures[n]['envelope'] for n in names])
+        cosine = envelopes.dot(envelopes.T)
+        for i in range(len(names)):
+            for j in range(i + 1, len(names)):
+                if cosine[i, j] > similarity or (
+                        np.array_equal(envelopes[i], envelopes[j]) and
+                        file_hash(names[i]) == file_hash(names[j])):
+                    pairs.append((names[i], names[j]))
+    return sorted(pairs)
+
+
+def group_raws(raw_info):
+    """Group raw file paths by the stem they are mapped to.
+
+    Parameters
+    ----------
+    raw_info: dict
+        Dictionary containing all information associated with each raw track.
+        Includes path, instrument, and stem that it is mapped to.
+
+    Returns
+    -------
+    stem_raws : dict
+        Keys = stem basename, values = sorted list of raw file paths.
+    """
+    stem_raws = {}
+    for raw in sorted(raw_info):
+        stem_raws.setdefault(raw_info[raw]['stem'], []).append(
+            raw_info[raw]['path']
+        )
+    return stem_raws
+
+
+def report_progress(progress, check_name):
+    """Adapt a progress(check_name, completed, total) callback to the
+    progress(completed, total) form map_jobs calls.
+    """
+    if progress is None:
+        return None
+    return partial(progress, check_name)
+
+
+@tracing.traced
 def has_wavs(folder_path):
     """Check if folders contain wavefiles, i.e. are not empty.
 
@@ -403,6 +942,7 @@ def has_wavs(folder_path):
         return True
 
 
+@tracing.traced
 def is_right_stats(fpath, type):
     """Check if files are correctly formatted.
 
@@ -418,11 +958,10 @@ def is_right_stats(fpath, type):
     status : bool
         True if file is formatted correctly.
     """
-    fp = wave.open(fpath, 'rb')
-    n_channels = sox.file_info.channels(fpath)
-    bytedepth = fp.getsampwidth()
-    float_s = sox.file_info.sample_rate(fpath)
-    fs = int(float_s)
+    info = audio_io.probe(fpath)
+    n_channels = info['channels']
+    bytedepth = info['sampwidth']
+    fs = info['sample_rate']
     if type == "stem":
         if n_channels == 2 and bytedepth == 2 and fs == 44100:
             return True
@@ -442,6 +981,7 @@ def is_right_stats(fpath, type):
         return False
 
 
+@tracing.traced
 def get_length(fpath):
     """Calculate number of samples i.e. length of the file.
 
@@ -455,11 +995,12 @@ def get_length(fpath):
     length : int
         Number of samples of file.
     """
-    length = sox.file_info.num_samples(fpath)
+    length = audio_io.probe(fpath)['n_frames']
 
     return length
 
 
+@tracing.traced
 def get_dur(fpath):
     """Get duration of a file in seconds.
 
@@ -473,10 +1014,11 @@ def get_dur(fpath):
     dur : float
         Length of file in seconds.
     """
-    dur = sox.file_info.duration(fpath)
+    dur = audio_io.probe(fpath)['duration']
     return dur
 
 
+@tracing.traced
 def is_right_length(fpath, ref_length):
     """Check if stem and raw files are the same length as the mix.
 
@@ -499,16 +1041,152 @@ def is_right_length(fpath, ref_length):
         return False
 
 
+class SilenceDetector(object):
+    """Classify consecutive frames of framesize samples as silent or not as
+    audio arrives in windows of any size. A frame is silent if its RMS
+    level over all channels is below threshold. Audio is given either as
+    samples, or as a power envelope whose values each sum hop frames (hop
+    must divide framesize).
+    """
+    def __init__(self, info, threshold=16, framesize=None, hop=1):
+        self.sr = info['sample_rate']
+        self.n_frames = info['n_frames']
+        self.framesize = framesize or self.sr
+        self.threshold = threshold
+        self.level = threshold / 32768.0
+        self.per_frame = self.framesize // hop
+        self.carry = np.zeros(0)
+        self.n_channels = info['channels']
+        self.n_classified = 0
+        self.silent = []
+
+    def _classify(self, frame_power, n_rows):
+        power = frame_power / (n_rows * self.n_channels)
+        self.silent.append(np.sqrt(power) < self.level)
+        self.n_classified += len(frame_power)
+
+    def feed(self, samples):
+        """Add the next window of samples, scaled to [-1, 1] with shape
+        (n, channels). Only valid with hop=1.
+        """
+        self.feed_power((samples ** 2).sum(axis=1))
+
+    def feed_power(self, power):
+        """Add the next values of the power envelope.
+        """
+        values = np.concatenate((self.carry, power))
+        n_full = len(values) // self.per_frame
+        if n_full:
+            self._classify(
+                values[:n_full * self.per_frame].reshape(n_full, -1).sum(axis=1),
+                self.framesize
+            )
+        self.carry = values[n_full * self.per_frame:]
+
+    def finish(self):
+        """Classify the last, partial frame and get the results.
+
+        Returns
+        -------
+        status : bool
+            True if every frame is silent (i.e. if the file is silent).
+        sections : list
+            (start, end) times in seconds of each run of silent frames.
+        """
+        if len(self.carry):
+            n_rows = self.n_frames - self.n_classified * self.framesize
+            self._classify(np.array([self.carry.sum()]), max(n_rows, 1))
+            self.carry = np.zeros(0)
+        if not self.silent:
+            return True, []
+        silent = np.concatenate(self.silent)
+
+        edges = np.diff(np.concatenate(([0], silent.astype(int), [0])))
+        starts = np.flatnonzero(edges == 1) * self.framesize
+        ends = np.minimum(
+            np.flatnonzero(edges == -1) * self.framesize, self.n_frames
+        )
+        sections = [
+            (start / float(self.sr), end / float(self.sr))
+            for start, end in zip(starts, ends)
+        ]
+        return bool(np.all(silent)), sections
+
+
+@tracing.traced
+def find_silence(fpath, threshold=16, framesize=None):
+    """Find the silent regions of a wave file, one frame of framesize
+    samples at a time. A frame is silent if its RMS level is below
+    threshold. When framesize is a whole number of hops of the file's power
+    envelope the frames are summed from its pyramid, computing the pyramid
+    (in one pass over the file) for the other checks to reuse if needed;
+    otherwise the file is streamed once.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to a wavefile.
+    threshold : int
+        RMS level, in 16 bit sample units, below which a frame is silent.
+    framesize : int, default=None
+        Number of datapoints to consider at a time, defaults to 1 second.
+
+    Returns
+    -------
+    status : bool
+        True if every frame is silent (i.e. if the file is silent).
+    sections : list
+        (start, end) times in seconds of each run of silent frames.
+    """
+    info = audio_io.probe(fpath)
+    if framesize is None:
+        framesize = info['sample_rate']
+
+    hop = max(info['sample_rate'] // audio_io.ENVELOPE_RATE, 1)
+    if framesize % hop == 0:
+        levels = audio_io.pyramid(fpath)
+        detector = SilenceDetector(info, threshold, framesize, hop)
+        detector.feed_power(levels['power'])
+        return detector.finish()
+
+    reader = audio_io.open_wav(fpath)
+    detector = SilenceDetector(reader.info, threshold, framesize)
+    block_size = max(1, SILENCE_BLOCK_SIZE // framesize) * framesize
+    for _, window in reader.blocks(block_size):
+        detector.feed(reader.to_float(window))
+
+    return detector.finish()
+
+
+def has_silent_sections(sections, min_dur=SILENT_SECTION_MIN_DUR):
+    """Check if any silent region is at least min_dur seconds long.
+
+    Parameters
+    ----------
+    sections : list
+        (start, end) times in seconds, as returned by find_silence.
+    min_dur : float
+        Shortest region that counts as a silent section.
+
+    Returns
+    -------
+    status : bool
+        True if a silent section of at least min_dur seconds exists.
+    """
+    return any(end - start >= min_dur for start, end in sections)
+
+
+@tracing.traced
 def is_silence(fpath, threshold=16, framesize=None): 
-    """Check if a wave file is 'silent', i.e. all values are smaller than a
-    given threshold.
+    """Check if a wave file is 'silent', i.e. the level of every frame is
+    smaller than a given threshold.
 
     Parameters
     ----------
     wavefile : str
         Path to a wavefile.
     threshold : int
-        Value for the upper bound in determining silence.
+        RMS level, in 16 bit sample units, below which a frame is silent.
     framesize : int, default=None
         Number of datapoints to consider at a time, defaults to 1 second.
 
@@ -517,12 +1195,68 @@ def is_silence(fpath, threshold=16, framesize=None):
     status : bool
         True if values are less than the given threshold (i.e. if the file is silent)
     """
-    return sox.file_info.silent(fpath)
+    status, _ = find_silence(fpath, threshold=threshold, framesize=framesize)
+    return status
 
 
-def alignment_helper(file_list, target_path):
-    """Downsample and perform cross-correlation on files relative
-    to a target file to test if they are correctly aligned.
+@tracing.traced
+def pick_windows(target_path, sr, window, n_windows, margin):
+    """Pick the highest energy, non-overlapping analysis windows of a
+    target file, leaving room for a margin on either side where possible.
+    The energy is estimated from a few short probes per window.
+
+    Parameters
+    ----------
+    target_path : str
+        Path to the target file.
+    sr : int
+        Analysis sample rate.
+    window : float
+        Window length in seconds.
+    n_windows : int
+        Largest number of windows to pick.
+    margin : int
+        Samples (at sr) wanted on either side of each window.
+
+    Returns
+    -------
+    starts : list
+        First sample (at sr) of each window, in increasing order. Every
+        start is a multiple of the upsampling factor from the file's rate
+        to sr, so windows begin on whole frames of the file.
+    length : int
+        Window length in samples at sr.
+    """
+    info = audio_io.probe(target_path)
+    up, down = audio_io.resample_factors(info['sample_rate'], sr)
+    length = max(int(window * sr) // up, 1) * up
+    margin = -(-margin // up) * up
+    n_total = info['n_frames'] * up // down
+
+    if n_total <= length:
+        return [0], length
+
+    first = margin if n_total >= length + 2 * margin else 0
+    last = n_total - length - first
+    starts = list(range(first, max(last, first) + 1, length))
+    if len(starts) <= n_windows:
+        return starts, length
+
+    energy = audio_io.window_energy(
+        target_path, [start * down // up for start in starts],
+        length * down // up
+    )
+    best = np.argsort(-energy, kind='mergesort')[:n_windows]
+    return sorted(starts[i] for i in best), length
+
+
+@tracing.traced
+def measure_alignment(file_list, target_path, max_lag=None, sr=ALIGNMENT_SR,
+                      window=ALIGNMENT_WINDOW, n_windows=ALIGNMENT_N_WINDOWS):
+    """Measure the offset of the sum of files relative to a target file.
+    The offset is measured by downsampled cross-correlation in each of a
+    few short, high energy windows of the target, and the windows vote on
+    the result. Only the windows (plus a margin) are read from disk.
 
     Parameters
     ----------
@@ -530,60 +1264,126 @@ def alignment_helper(file_list, target_path):
         List of files (i.e. stem_files, raw_files)
     target_path : str
         Filepath to compare files in file_list to.
+    max_lag : int or None
+        Largest offset (in samples at the analysis rate) to search for.
+        None searches up to half the window length.
+    sr : int
+        Analysis sample rate.
+    window : float
+        Length of each analysis window in seconds.
+    n_windows : int
+        Number of analysis windows.
 
     Returns
     -------
-    status : bool
-        True if the cross_correlation values are within a threshold, demonstrating
-        that the files are correctly aligned.
-    """
-    sr = 1000
-    output_handle = tempfile.NamedTemporaryFile(suffix='.wav')  
-    output_path = output_handle.name
-
-    if len(file_list) > 1: 
-        file_sum = sox.Combiner()
-        file_sum.build(
-            file_list, output_path, 'mix'
-        ) 
-    else:
-        file_sum = sox.Transformer()
-        file_sum.build(file_list[0], output_path)
-
-    file_sum.rate(sr,'m')
+    offset : dict
+        'offset' : int or None, voted offset of the summed files relative
+        to the target in samples at sr, None if it could not be measured
+        (e.g. silence).
+        'offset_ms' : float or None, the same offset in milliseconds.
+        'confidence' : float, mean normalised correlation of the windows
+        that agree with the offset.
+        'windows' : list, (start in seconds, offset, confidence) per window.
+    """
+    if max_lag is None:
+        max_lag = int(window * sr) // 2
+    starts, length = pick_windows(target_path, sr, window, n_windows, max_lag)
+    up, _ = audio_io.resample_factors(
+        audio_io.probe(target_path)['sample_rate'], sr
+    )
 
-    target_handle = tempfile.NamedTemporaryFile(suffix='.wav')
-    target_handle_path = target_handle.name
-    target_sum = sox.Transformer()
-    target_sum.build(target_path, target_handle_path)
-    target_sum.rate(sr, 'm')
+    windows = []
+    for start in starts:
+        y_target = audio_io.load_sum(
+            [target_path], sr, offset=start / float(sr),
+            duration=length / float(sr)
+        )
+        # the margin also starts on a whole frame, then is trimmed to max_lag
+        x_start = max(start - -(-max_lag // up) * up, 0)
+        y_files = audio_io.load_sum(
+            file_list, sr, offset=x_start / float(sr),
+            duration=(start + length + max_lag - x_start) / float(sr)
+        )
+        lead = start - x_start
+        cut = max(lead - max_lag, 0)
+        y_files = y_files[cut:lead + length + max_lag]
+
+        offset, confidence = alignment.window_offset(
+            y_files, y_target, lead - cut
+        )
+        windows.append((start / float(sr), offset, confidence))
+
+    offset, confidence = alignment.vote_offset(
+        [w[1] for w in windows], [w[2] for w in windows]
+    )
+    return {
+        'offset': offset,
+        'offset_ms': None if offset is None else 1000.0 * offset / sr,
+        'confidence': confidence,
+        'windows': windows,
+    }
 
-    dur = get_length(target_path)
-    offset = (dur/44100.0) / 2.0
-    y_files, sr = librosa.load(output_path, sr=sr, offset = offset, duration=30.0)
-    y_target, sr = librosa.load(target_handle_path, sr=sr, offset = offset, duration=30.0)
 
-    correlation = np.correlate(y_files, y_target, 'full')
+@tracing.traced
+def alignment_helper(file_list, target_path, max_lag=None,
+                     tolerance=ALIGNMENT_TOLERANCE,
+                     sr=ALIGNMENT_SR, window=ALIGNMENT_WINDOW,
+                     n_windows=ALIGNMENT_N_WINDOWS):
+    """Test if files are correctly aligned relative to a target file.
 
-    N = len(y_target)
-    a = np.arange(1, N+1)
-    a_rev = np.arange(1, N)
-    b = a_rev[ : :-1]  
-    c = np.concatenate((a, b))
-    c = c.astype(float)
+    Parameters
+    ----------
+    file_list : list
+        List of files (i.e. stem_files, raw_files)
+    target_path : str
+        Filepath to compare files in file_list to.
+    max_lag : int or None
+        Largest offset (in samples at the analysis rate) to search for.
+        None searches up to half the window length.
+    tolerance : int
+        Largest offset (in samples at the analysis rate) still considered
+        aligned.
+    sr : int
+        Analysis sample rate.
+    window : float
+        Length of each analysis window in seconds.
+    n_windows : int
+        Number of analysis windows.
 
-    correlation = np.abs(correlation) / c
-    center = N
-    corr_index = np.argmax(correlation)
+    Returns
+    -------
+    status : bool
+        True if the voted offset is within tolerance, demonstrating that
+        the files are correctly aligned.
+    """
+    offset = measure_alignment(
+        file_list, target_path, max_lag=max_lag, sr=sr, window=window,
+        n_windows=n_windows
+    )
 
-    if np.abs(corr_index - center) > 5:
+    if offset['offset'] is None or np.abs(offset['offset']) > tolerance:
         return False
     else:
         return True
 
 
-def is_aligned(raw_files, stem_files, raw_path, stem_path, mix_path, raw_info): 
-    """Populate alignment dicts with associated bools.
+def alignment_job(job):
+    """Run alignment_helper on a (file_list, target_path) tuple.
+    """
+    return alignment_helper(*job)
+
+
+@tracing.traced
+def is_aligned(raw_files, stem_files, raw_path, stem_path, mix_path, raw_info,
+               n_workers=1, progress=None, cache=None, values=None):
+    """Populate alignment dicts with associated bools. Every file is
+    first aligned to its reference by alignment_table, which transforms
+    each file once. A group of files (the stems, the raws, or a stem's
+    raws) whose members are all within ALIGNMENT_TOLERANCE of the mix or
+    their stem is aligned. The sums of the other groups, e.g. with a silent
+    or repetitive file whose own offset is ambiguous, are aligned to their
+    target by alignment_helper in independent jobs, run across n_workers
+    processes.
 
     Parameters
     ----------
@@ -591,8 +1391,8 @@ def is_aligned(raw_files, stem_files, raw_path, stem_path, mix_path, raw_info):
         Raw files contained within raw_path folder. 
     stem_files: list
         Stem files contained within stem_path folder.
-    raw_path: str
-        Path to raw file folder.
+    raw_path: str or None
+        Path to raw file folder, None if there are no raws.
     stem_path: str
         Path to stem file folder.
     mix_path : str
@@ -600,6 +1400,17 @@ def is_aligned(raw_files, stem_files, raw_path, stem_path, mix_path, raw_info):
     raw_info: dict
         Dictionary containing all information associated with each raw track.
         Includes path, instrument, and stem that it is mapped to.
+    n_workers : int
+        Number of processes to use. Default=1.
+    progress : function or None
+        Called as progress('alignment', completed, total) after each
+        alignment_helper job.
+    cache : ResultCache or None
+        Store of results from previous runs.
+    values : dict or None
+        If given, filled with 'Offset_ms' and 'Offset_Confidence' (file ->
+        value) of every stem against the mix and every raw against its
+        stem, from alignment_table.
 
     Returns
     -------
@@ -618,42 +1429,237 @@ def is_aligned(raw_files, stem_files, raw_path, stem_path, mix_path, raw_info):
     stem_sum_alignment_dict = {} # Stems aligned with mix
     raw_to_stems_dict = {} # Raws aligned with stems
 
-    stem_sum_alignment_dict[os.path.basename(stem_path)] = alignment_helper(stem_files, mix_path)
-    raw_sum_alignment_dict[os.path.basename(raw_path)] = alignment_helper(raw_files, mix_path)
+    stem_raws = group_raws(raw_info)
+    stems = [s for s in stem_files if os.path.basename(s) in stem_raws]
+
+    job = (stem_files, mix_path, raw_info)
+    lag_table = map_cached_jobs(
+        lag_table_job, [job], [stem_files + raw_files + [mix_path]],
+        'lag_table', cache
+    )[0]
+
+    def offset_to_mix(name):
+        # offsets add up along the raw -> stem -> mix chain
+        lag = lag_table.get(name)
+        if lag is None or lag['offset'] is None:
+            return None
+        if lag['reference'] == os.path.basename(mix_path):
+            return lag['offset']
+        reference = offset_to_mix(lag['reference'])
+        return None if reference is None else lag['offset'] + reference
+
+    def all_aligned(offsets):
+        return all(o is not None and abs(o) <= ALIGNMENT_TOLERANCE
+                   for o in offsets)
+
+    groups = [
+        (stem_sum_alignment_dict, os.path.basename(stem_path),
+         (stem_files, mix_path),
+         [offset_to_mix(os.path.basename(f)) for f in stem_files]),
+    ]
+    if raw_files:
+        groups.append((
+            raw_sum_alignment_dict, os.path.basename(raw_path),
+            (raw_files, mix_path),
+            [offset_to_mix(os.path.basename(f)) for f in raw_files]
+        ))
+    for stem in stems:
+        raws = stem_raws[os.path.basename(stem)]
+        groups.append((
+            raw_to_stems_dict, os.path.basename(stem), (raws, stem),
+            [lag_table[os.path.basename(f)]['offset'] for f in raws]
+        ))
+
+    jobs = []
+    unresolved = []
+    for status_dict, name, job, offsets in groups:
+        if all_aligned(offsets):
+            status_dict[name] = True
+        else:
+            jobs.append(job)
+            unresolved.append((status_dict, name))
 
-    raw_to_stems_dict = {}
-    for stem in stem_files:
-        stem_raws = [v['path'] for k, v in raw_info.items() if v['stem'] == os.path.basename(stem)]
-        raw_to_stems_dict[os.path.basename(stem)] = alignment_helper(stem_raws, stem)
+    files = [file_list + [target] for file_list, target in jobs]
+    results = map_cached_jobs(
+        alignment_job, jobs, files, 'alignment', cache, n_workers,
+        report_progress(progress, 'alignment')
+    )
+    for (status_dict, name), status in zip(unresolved, results):
+        status_dict[name] = status
+
+    if values is not None:
+        for name, key in [('Offset_ms', 'offset_ms'),
+                          ('Offset_Confidence', 'confidence')]:
+            values.setdefault(name, {}).update(
+                (f, lag[key]) for f, lag in lag_table.items()
+            )
 
     return raw_sum_alignment_dict, stem_sum_alignment_dict, raw_to_stems_dict
 
 
+def lag_table_job(job):
+    """Run alignment_table on a (stem_files, mix_path, raw_info) tuple.
+    """
+    return alignment_table(*job)
+
+
+@tracing.traced
+def alignment_table(stem_files, mix_path, raw_info=None, sr=ALIGNMENT_SR,
+                    max_lag=None):
+    """Measure the offset of every stem relative to the mix, and of every
+    raw relative to its stem. Each file is transformed once: the mix and
+    stem spectra are computed a single time and every file is correlated
+    against its reference in batched inverse FFTs, using the files'
+    pyramids at sr.
+
+    Parameters
+    ----------
+    stem_files : list
+        Stem files to align to the mix.
+    mix_path : str
+        Path to mix file.
+    raw_info : dict or None
+        Raw basename -> dict with 'path' and 'stem', to align raws to the
+        stem they are mapped to.
+    sr : int
+        Analysis sample rate, one of audio_io.PYRAMID_RATES.
+    max_lag : int or None
+        Largest offset (in samples at sr) to search for. None searches up
+        to half an ALIGNMENT_WINDOW.
+
+    Returns
+    -------
+    lag_table : dict
+        Keys = stem and raw basenames, values = dict with 'reference'
+        (basename of the file it was aligned to), 'offset' (samples at
+        sr, None if silent), 'offset_ms' and 'confidence'.
+    """
+    if max_lag is None:
+        max_lag = int(ALIGNMENT_WINDOW * sr) // 2
+
+    mix = audio_io.pyramid(mix_path)['mono'][sr]
+    length = len(mix)
+    n_fft = alignment.correlation_size(length, max_lag)
+
+    def load(paths):
+        signals = np.zeros((len(paths), length))
+        for i, fpath in enumerate(paths):
+            signal = audio_io.pyramid(fpath)['mono'][sr][:length]
+            signals[i, :len(signal)] = signal
+        return signals
+
+    def align(paths, reference, reference_energy, keep=()):
+        rows = []
+        kept = {}
+        for start in range(0, len(paths), ALIGNMENT_BATCH_SIZE):
+            batch = paths[start:start + ALIGNMENT_BATCH_SIZE]
+            signals = load(batch)
+            batch_spectra = alignment.spectra(signals, n_fft)
+            energies = (signals ** 2).sum(axis=1)
+            offsets, confidences = alignment.batch_offsets(
+                batch_spectra, energies, reference, reference_energy,
+                n_fft, max_lag
+            )
+            rows.extend(zip(batch, offsets, confidences))
+            for i, fpath in enumerate(batch):
+                if fpath in keep:
+                    kept[fpath] = (batch_spectra[i], energies[i])
+        return rows, kept
+
+    stem_raws = group_raws(raw_info or {})
+    stems_with_raws = set(
+        s for s in stem_files if os.path.basename(s) in stem_raws
+    )
+
+    rows, stem_spectra = align(
+        stem_files, alignment.spectra(mix[np.newaxis], n_fft)[0],
+        mix.dot(mix), stems_with_raws
+    )
+    lag_table = {}
+    for fpath, offset, confidence in rows:
+        lag_table[os.path.basename(fpath)] = (
+            os.path.basename(mix_path), offset, confidence
+        )
+
+    for stem in sorted(stems_with_raws):
+        spectrum, energy = stem_spectra[stem]
+        rows, _ = align(stem_raws[os.path.basename(stem)], spectrum, energy)
+        for fpath, offset, confidence in rows:
+            lag_table[os.path.basename(fpath)] = (
+                os.path.basename(stem), offset, confidence
+            )
+
+    return dict(
+        (name, {
+            'reference': reference,
+            'offset': offset,
+            'offset_ms': None if offset is None else 1000.0 * offset / sr,
+            'confidence': confidence,
+        })
+        for name, (reference, offset, confidence) in lag_table.items()
+    )
+
+
+@tracing.traced
 def loadmono(filename, is_mono=False):
-    """Check if stem and raw files are the same length as the mix.
+    """Load the rectified sum of a file's channels.
 
     Parameters
     ----------
     filename : str
         Path to a file.
     is_mono: bool
-        True if input file is mono. Default=False.
+        True if input file is mono. Default=False. Channels are summed
+        according to the file's header either way.
 
     Returns
     -------
     w : np.array
         Audio file converted to mono.
     """
-    _, w = wavfile.read(filename)
-    if not is_mono:
-        w = np.abs(w.sum(axis=1))
-    else:
-        w = np.abs(w)
+    w = np.abs(audio_io.open_wav(filename).mono_sum())
     return w
 
 
-def get_coeffs(file_list, target_path, is_mono):
-    """Calculate weighted mixing coefficients.
+def nnls_gram(gram, cross):
+    """Solve a non-negative least squares problem min ||Ax - b|| given
+    only its normal equations, gram = A^T A and cross = A^T b.
+
+    Parameters
+    ----------
+    gram : np.array
+        Gram matrix A^T A, shape = (k, k).
+    cross : np.array
+        Cross products A^T b, shape = (k,).
+
+    Returns
+    -------
+    coeffs : np.array
+        Non-negative solution x, shape = (k,).
+    """
+    # ||Ax - b||^2 = ||L^T x - L^-1 A^T b||^2 + const, with gram = L L^T.
+    # Silent or identical files make gram singular, so regularise slightly.
+    ridge = 1e-12 * max(np.trace(gram), 1.0) / len(gram)
+    while True:
+        try:
+            lower = scipy.linalg.cholesky(gram, lower=True)
+            break
+        except np.linalg.LinAlgError:
+            gram = gram + ridge * np.eye(len(gram))
+            ridge *= 10.0
+    rhs = scipy.linalg.solve_triangular(lower, cross, lower=True)
+    coeffs, _ = nnls(lower.T, rhs)
+    return coeffs
+
+
+@tracing.traced
+def get_coeffs(file_list, target_path, is_mono, sr=None):
+    """Calculate weighted mixing coefficients. The files are streamed from
+    disk in blocks of COEFF_BLOCK_SIZE frames, accumulating the small
+    normal equations of the least squares problem instead of holding every
+    file in memory at once. If sr is one of audio_io.PYRAMID_RATES the
+    coefficients are instead estimated from the files' pyramids at that
+    rate, which are shared with the other checks.
 
     Parameters
     ----------
@@ -662,7 +1668,11 @@ def get_coeffs(file_list, target_path, is_mono):
     target_path: str
         Path to file that the list will be tested against.
     is_mono: bool
-        True if input file is mono. Default=False.
+        True if input file is mono. Channels are summed according to each
+        file's header either way.
+    sr : int or None
+        Pyramid rate to estimate the coefficients at, or None to use every
+        sample.
 
     Returns
     -------
@@ -670,14 +1680,15 @@ def get_coeffs(file_list, target_path, is_mono):
         Dictionary of each file and its associated mixing coefficient
         relative to target path.
     """
+    n_files = len(file_list)
+    if n_files == 0:
+        return {}
 
-    target_audio = loadmono(target_path)
-
-    full_audio = np.vstack(
-        [loadmono(f, is_mono=is_mono) for f in file_list]
-    )
-
-    coeffs, _ = nnls(full_audio.T, target_audio.T)
+    if sr is None:
+        gram, cross, _ = coeff_equations(file_list, target_path)
+    else:
+        gram, cross, _ = pyramid_equations(file_list, target_path, sr)
+    coeffs = nnls_gram(gram, cross)
 
     base_keys = [os.path.basename(s) for s in file_list]
 
@@ -688,10 +1699,184 @@ def get_coeffs(file_list, target_path, is_mono):
     return mixing_coeffs
 
 
-def is_included(stem_files, raw_files, stem_path, mix_path, raw_info):
+@tracing.traced
+def coeff_equations(file_list, target_path, start=0, stop=None):
+    """Accumulate the normal equations of get_coeffs over every sample of
+    frames [start, stop), in blocks of COEFF_BLOCK_SIZE frames.
+
+    Returns
+    -------
+    gram : np.array
+        Gram matrix of the files' absolute channel sums.
+    cross : np.array
+        Their inner products with the target's absolute channel sum.
+    energy : float
+        Energy of the target's absolute channel sum.
+    """
+    n_files = len(file_list)
+    target_reader = audio_io.open_wav(target_path)
+    readers = [audio_io.open_wav(f) for f in file_list]
+
+    gram = np.zeros((n_files, n_files))
+    cross = np.zeros(n_files)
+    energy = 0.0
+    block = np.zeros((COEFF_BLOCK_SIZE, n_files))
+
+    for block_start, _ in target_reader.blocks(COEFF_BLOCK_SIZE, start, stop):
+        block_stop = block_start + COEFF_BLOCK_SIZE
+        if stop is not None:
+            block_stop = min(block_stop, stop)
+        target = np.abs(target_reader.mono_sum(block_start, block_stop))
+        n_block = len(target)
+        for i, reader in enumerate(readers):
+            chunk = reader.mono_sum(block_start, block_start + n_block)
+            block[:len(chunk), i] = np.abs(chunk)
+            block[len(chunk):n_block, i] = 0.0
+
+        audio = block[:n_block]
+        gram += audio.T.dot(audio)
+        cross += audio.T.dot(target)
+        energy += target.dot(target)
+
+    return gram, cross, energy
+
+
+def pyramid_signal(fpath, sr):
+    """The absolute channel sum of a file at a pyramid rate, in raw sample
+    units as WavReader.mono_sum gives them.
+    """
+    reader = audio_io.open_wav(fpath)
+    mono = audio_io.pyramid(fpath)['mono'][sr]
+    return np.abs(mono * (reader.scale * reader.n_channels))
+
+
+def pyramid_matrix(file_list, target_path, sr):
+    """The files' and target's absolute channel sums at a pyramid rate,
+    with the files cut or zero padded to the target's length.
+
+    Returns
+    -------
+    audio : np.array
+        One column per file, shape = (n, len(file_list)).
+    target : np.array
+        Target signal, shape = (n,).
+    """
+    target = pyramid_signal(target_path, sr)
+    audio = np.zeros((len(target), len(file_list)))
+    for i, fpath in enumerate(file_list):
+        signal = pyramid_signal(fpath, sr)[:len(target)]
+        audio[:len(signal), i] = signal
+    return audio, target
+
+
+@tracing.traced
+def pyramid_equations(file_list, target_path, sr):
+    """The normal equations of get_coeffs from the files' pyramids at sr,
+    with the same return values as coeff_equations.
+    """
+    audio, target = pyramid_matrix(file_list, target_path, sr)
+    return audio.T.dot(audio), audio.T.dot(target), target.dot(target)
+
+
+@tracing.traced
+def refine_coeffs(file_list, target_path, coarse_sr=COEFF_COARSE_SR,
+                  window=COEFF_WINDOW, refine_fraction=COEFF_REFINE_FRACTION):
+    """Calculate mixing coefficients coarse to fine. The least squares
+    problem of get_coeffs is first solved on the files' pyramids at
+    coarse_sr, only to find the windows where that solution leaves the most
+    residual energy. Those windows are then read at the full sample rate
+    and the coefficients solved from them alone, so the result never mixes
+    equations from the low passed pyramids with full rate ones. A file that
+    is silent in every refined window keeps its coarse coefficient. With
+    refine_fraction=1 the result is the same as get_coeffs.
+
+    Parameters
+    ----------
+    file_list : list
+        List of files to calculate coefficients of.
+    target_path: str
+        Path to file that the list will be tested against.
+    coarse_sr : int
+        Pyramid rate of the coarse solve, one of audio_io.PYRAMID_RATES.
+    window : float
+        Length in seconds of the windows residuals are compared in.
+    refine_fraction : float
+        Fraction of windows, those with the highest coarse residual, that
+        are solved at the full sample rate.
+
+    Returns
+    -------
+    result : dict
+        'coeffs' : dict, file basename -> mixing coefficient.
+        'residual' : float, energy of the target left unexplained by the
+        files in the refined windows, relative to the target's energy there.
+        'confidence' : float, 1 - residual, clipped to [0, 1].
+        'refined' : list, start time in seconds of each refined window.
+    """
+    base_keys = [os.path.basename(f) for f in file_list]
+    if not file_list:
+        return {'coeffs': {}, 'residual': 0.0, 'confidence': 1.0,
+                'refined': []}
+
+    sr = audio_io.probe(target_path)['sample_rate']
+    audio, target = pyramid_matrix(file_list, target_path, coarse_sr)
+    coarse_coeffs = nnls_gram(audio.T.dot(audio), audio.T.dot(target))
+
+    coarse_len = max(int(round(window * coarse_sr)), 1)
+    n_windows = -(-len(target) // coarse_len)
+    residual = audio.dot(coarse_coeffs) - target
+    window_residual = np.zeros(n_windows * coarse_len)
+    window_residual[:len(residual)] = residual ** 2
+    window_residual = window_residual.reshape(n_windows, -1).sum(axis=1)
+
+    n_refine = int(np.ceil(refine_fraction * n_windows))
+    refined = sorted(
+        np.argsort(-window_residual, kind='mergesort')[:n_refine]
+    )
+
+    n_files = len(file_list)
+    gram = np.zeros((n_files, n_files))
+    cross = np.zeros(n_files)
+    energy = 0.0
+    fine_len = int(round(window * sr))
+    for i in refined:
+        fine = coeff_equations(
+            file_list, target_path, i * fine_len, (i + 1) * fine_len
+        )
+        gram += fine[0]
+        cross += fine[1]
+        energy += fine[2]
+
+    # only the files heard in the refined windows are solved for there
+    heard = np.flatnonzero(np.diag(gram) > 0)
+    coeffs = np.array(coarse_coeffs, dtype=float)
+    if len(heard):
+        coeffs[heard] = nnls_gram(gram[np.ix_(heard, heard)], cross[heard])
+    residual = max(coeffs.dot(gram).dot(coeffs) - 2 * coeffs.dot(cross) +
+                   energy, 0.0)
+    residual = residual / energy if energy > 0 else 0.0
+    return {
+        'coeffs': dict((k, float(c)) for k, c in zip(base_keys, coeffs)),
+        'residual': float(residual),
+        'confidence': float(min(max(1.0 - residual, 0.0), 1.0)),
+        'refined': [i * window for i in refined],
+    }
+
+
+def refine_job(job):
+    """Run refine_coeffs on a (file_list, target_path) tuple.
+    """
+    return refine_coeffs(*job)
+
+
+@tracing.traced
+def is_included(stem_files, raw_files, stem_path, mix_path, raw_info,
+                n_workers=1, progress=None, cache=None, values=None):
     """Test to see if each file is actually included in its overhead file, i.e.
     stems are present in mix, raws are present in stems. Also populates inclusion
-    dicts with associated bools.
+    dicts with associated bools. Mixing coefficients are found coarse to
+    fine by refine_coeffs. The mix and every stem's raw group are
+    independent jobs, run across n_workers processes.
 
     Parameters
     ----------
@@ -706,6 +1891,15 @@ def is_included(stem_files, raw_files, stem_path, mix_path, raw_info):
     raw_info: dict
         Dictionary containing all information associated with each raw track.
         Includes path, instrument, and stem that it is mapped to.
+    n_workers : int
+        Number of processes to use. Default=1.
+    progress : function or None
+        Called as progress('inclusion', completed, total) after each job.
+    cache : ResultCache or None
+        Store of results from previous runs.
+    values : dict or None
+        If given, filled with 'Mixing_Coeff' (file -> coefficient) and
+        'Inclusion_Residual' (mix or stem -> relative residual).
 
     Returns
     -------
@@ -721,18 +1915,33 @@ def is_included(stem_files, raw_files, stem_path, mix_path, raw_info):
     raw_inclusion_dict = {}
     stem_inclusion_dict = {}
 
+    stem_raws = group_raws(raw_info)
+    stems = [s for s in stem_files if os.path.basename(s) in stem_raws]
+
+    jobs = [(stem_files, mix_path)] + \
+        [(stem_raws[os.path.basename(stem)], stem) for stem in stems]
+    files = [file_list + [target] for file_list, target in jobs]
+    results = map_cached_jobs(
+        refine_job, jobs, files, 'inclusion', cache, n_workers,
+        report_progress(progress, 'inclusion')
+    )
+
     # Stems in mix
-    stem_coeffs = get_coeffs(stem_files, mix_path, False)
-    for k, v in stem_coeffs.items():
+    for k, v in results[0]['coeffs'].items():
         stem_inclusion_dict[k] = check_weight(v)
 
     # Raws in stems
-    for stem in stem_files:
-        stem_inclusion = [v['path'] for k, v in raw_info.items() if v['stem'] == os.path.basename(stem)]
-        raw_coeffs = get_coeffs(stem_inclusion, stem, True)
-        for k, v in raw_coeffs.items():
+    for result in results[1:]:
+        for k, v in result['coeffs'].items():
             raw_inclusion_dict[k] = check_weight(v)
 
+    if values is not None:
+        for (_, target), result in zip(jobs, results):
+            values.setdefault('Mixing_Coeff', {}).update(result['coeffs'])
+            values.setdefault('Inclusion_Residual', {})[
+                os.path.basename(target)
+            ] = result['residual']
+
     return raw_inclusion_dict, stem_inclusion_dict
 
 
@@ -753,10 +1962,3 @@ def check_weight(val):
         return False
     else:
         return True
-
-
-
-
-
-
-
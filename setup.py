@@ -24,5 +24,8 @@ setup(
     data_files=DATA_FILES,
     options={'py2app': OPTIONS},
     setup_requires=['py2app'],
-    install_requires=['pyyaml', 'sox', 'numpy']
+    install_requires=['pyyaml', 'sox', 'numpy', 'scipy'],
+    entry_points={
+        'console_scripts': ['new_multitrack_batch=new_multitrack.batch:main']
+    }
 )
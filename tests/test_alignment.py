@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+from new_multitrack import alignment
+
+
+def shifted_noise(shift, n=3000, seed=0):
+    y = np.random.RandomState(seed).randn(n)
+    x = np.roll(y, shift)
+    return x, y
+
+
+class TestCrossCorrelation(unittest.TestCase):
+
+    def test_matches_full_correlation(self):
+        x = np.random.RandomState(1).randn(200)
+        y = np.random.RandomState(2).randn(150)
+        # lag -149 is the first value of the full correlation
+        expected = np.correlate(x, y, 'full')[149 - 120:149 + 121]
+
+        lags, actual = alignment.cross_correlation(x, y, max_lag=120)
+        self.assertEqual(lags[0], -120)
+        self.assertEqual(lags[-1], 120)
+        self.assertTrue(np.allclose(actual, expected))
+
+    def test_lags_without_overlap(self):
+        lags, _ = alignment.cross_correlation(np.ones(10), np.ones(5), 50)
+        self.assertEqual(lags[0], -4)
+        self.assertEqual(lags[-1], 9)
+
+    def test_direct_matches_fft(self):
+        x, y = shifted_noise(3)
+        direct_lags, direct = alignment.cross_correlation(x, y, max_lag=10)
+        fft_lags, fft = alignment.cross_correlation(x, y, max_lag=100)
+        self.assertTrue(np.allclose(direct, fft[90:111]))
+        self.assertTrue(np.array_equal(direct_lags, fft_lags[90:111]))
+
+
+class TestWindowOffset(unittest.TestCase):
+
+    def test_offset(self):
+        x, y = shifted_noise(7)
+        offset, confidence = alignment.window_offset(x[400:1600], y[500:1500], 100)
+        self.assertEqual(offset, 7)
+        self.assertAlmostEqual(confidence, 1.0)
+
+    def test_silent(self):
+        x, _ = shifted_noise(0)
+        self.assertEqual(
+            alignment.window_offset(x[400:1600], np.zeros(1000), 100),
+            (None, 0.0)
+        )
+
+
+class TestVoteOffset(unittest.TestCase):
+
+    def test_majority(self):
+        offset, confidence = alignment.vote_offset(
+            [7, 8, -300, None], [0.9, 0.7, 0.95, 0.0]
+        )
+        self.assertEqual(offset, 7)
+        self.assertAlmostEqual(confidence, 0.8)
+
+    def test_no_votes(self):
+        self.assertEqual(alignment.vote_offset([None], [0.0]), (None, 0.0))
+
+
+class TestBatchOffsets(unittest.TestCase):
+
+    def test_offsets(self):
+        y = np.random.RandomState(0).randn(3000)
+        signals = np.array([np.roll(y, s) for s in [0, 40, -25]] +
+                           [np.zeros(3000)])
+        n_fft = alignment.correlation_size(3000, 50)
+        offsets, confidences = alignment.batch_offsets(
+            alignment.spectra(signals, n_fft), (signals ** 2).sum(axis=1),
+            alignment.spectra(y[np.newaxis], n_fft)[0], y.dot(y), n_fft, 50
+        )
+        self.assertEqual(offsets, [0, 40, -25, None])
+        self.assertAlmostEqual(confidences[0], 1.0)
+        self.assertEqual(confidences[3], 0.0)
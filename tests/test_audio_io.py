@@ -0,0 +1,179 @@
+import unittest
+import os
+import shutil
+import tempfile
+import wave
+import numpy as np
+from scipy.io import wavfile
+from new_multitrack import audio_io
+
+
+def relpath(f):
+    return os.path.join(os.path.dirname(__file__), f)
+
+VALID_MIX = relpath('data/Short_Files/Mix.wav')
+RAW_INPUT1 = relpath('data/Short_Files/Raw/Raw1.wav')
+
+
+class TestReadHeader(unittest.TestCase):
+
+    def test_stereo_header(self):
+        actual = audio_io.read_header(VALID_MIX)
+        self.assertEqual(actual['channels'], 2)
+        self.assertEqual(actual['sampwidth'], 2)
+        self.assertEqual(actual['sample_rate'], 44100)
+        self.assertEqual(actual['n_frames'], 441000)
+        self.assertEqual(actual['duration'], 10.0)
+
+    def test_mono_header(self):
+        actual = audio_io.read_header(RAW_INPUT1)
+        self.assertEqual(actual['channels'], 1)
+        self.assertEqual(actual['n_frames'], 441000)
+
+    def test_not_a_wave(self):
+        with self.assertRaises(IOError):
+            audio_io.read_header(__file__)
+
+
+class TestProbe(unittest.TestCase):
+
+    def setUp(self):
+        audio_io.clear_cache()
+        self.tmpdir = tempfile.mkdtemp()
+        self.fpath = os.path.join(self.tmpdir, 'probe.wav')
+        shutil.copyfile(RAW_INPUT1, self.fpath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_probe_cached(self):
+        first = audio_io.probe(self.fpath)
+        second = audio_io.probe(self.fpath)
+        self.assertIs(first, second)
+
+    def test_probe_modified(self):
+        first = audio_io.probe(self.fpath)
+        shutil.copyfile(VALID_MIX, self.fpath)
+        os.utime(self.fpath, (0, 0))
+        second = audio_io.probe(self.fpath)
+        self.assertEqual(first['channels'], 1)
+        self.assertEqual(second['channels'], 2)
+
+
+class TestWavReader(unittest.TestCase):
+
+    def setUp(self):
+        audio_io.clear_cache()
+
+    def test_shared_reader(self):
+        first = audio_io.open_wav(VALID_MIX)
+        second = audio_io.open_wav(VALID_MIX)
+        self.assertIs(first, second)
+
+    def test_views(self):
+        reader = audio_io.open_wav(VALID_MIX)
+        window = reader.window(100, 200)
+        channel = reader.channel(1, 100, 200)
+        self.assertEqual(window.shape, (100, 2))
+        self.assertTrue(np.shares_memory(window, reader.frames))
+        self.assertTrue(np.shares_memory(channel, reader.frames))
+        self.assertTrue(np.array_equal(channel, window[:, 1]))
+
+    def test_mono(self):
+        reader = audio_io.open_wav(VALID_MIX)
+        window = reader.window(1000, 2000).astype(float)
+        self.assertTrue(np.allclose(
+            reader.mono_sum(1000, 2000), window.sum(axis=1)
+        ))
+        self.assertTrue(np.allclose(
+            reader.mono(1000, 2000), window.mean(axis=1) / 32768.0
+        ))
+
+    def test_24_bit(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fpath = os.path.join(tmpdir, 'Mix_24.wav')
+            sr, audio = wavfile.read(VALID_MIX)
+            samples = audio.astype(np.int32) * 256 + 17
+            packed = samples.astype('<i4').view(np.uint8).reshape(
+                samples.shape + (4,)
+            )[..., :3]
+            out = wave.open(fpath, 'wb')
+            out.setnchannels(2)
+            out.setsampwidth(3)
+            out.setframerate(sr)
+            out.writeframes(packed.tobytes())
+            out.close()
+
+            reader = audio_io.open_wav(fpath)
+            self.assertTrue(np.array_equal(reader.window(), samples))
+            self.assertTrue(np.array_equal(
+                reader.channel(1, 100, 200), samples[100:200, 1]
+            ))
+            self.assertTrue(np.allclose(
+                reader.mono(), audio_io.open_wav(VALID_MIX).mono(), atol=1e-5
+            ))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_blocks(self):
+        reader = audio_io.open_wav(RAW_INPUT1)
+        starts = [start for start, _ in reader.blocks(100000)]
+        sizes = [len(block) for _, block in reader.blocks(100000)]
+        self.assertEqual(starts, [0, 100000, 200000, 300000, 400000])
+        self.assertEqual(sum(sizes), reader.n_frames)
+
+
+class TestPyramid(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        audio_io.clear_cache()
+        audio_io.clear_pyramids()
+
+    def tearDown(self):
+        audio_io.set_pyramid_dir(None)
+        audio_io.clear_pyramids()
+        shutil.rmtree(self.tmpdir)
+
+    def test_levels(self):
+        levels = audio_io.pyramid(RAW_INPUT1)
+        reader = audio_io.open_wav(RAW_INPUT1)
+        self.assertEqual(levels['hop'], reader.info['sample_rate'] // 100)
+        self.assertEqual(
+            len(levels['power']), -(-reader.n_frames // levels['hop'])
+        )
+        self.assertTrue(np.isclose(
+            levels['power'].sum(),
+            (reader.to_float(reader.window()) ** 2).sum()
+        ))
+        self.assertIs(audio_io.cached_pyramid(RAW_INPUT1), levels)
+
+    def test_load_sum_from_pyramid(self):
+        expected = audio_io.load_sum([RAW_INPUT1], 1000, 1.0, 2.0)
+        audio_io.pyramid(RAW_INPUT1)
+        actual = audio_io.load_sum([RAW_INPUT1], 1000, 1.0, 2.0)
+        self.assertTrue(np.allclose(actual, expected))
+
+    def test_sidecar(self):
+        audio_io.set_pyramid_dir(self.tmpdir)
+        levels = audio_io.pyramid(VALID_MIX)
+        self.assertEqual(len(os.listdir(self.tmpdir)), 1)
+
+        audio_io.clear_pyramids()
+        loaded = audio_io.cached_pyramid(VALID_MIX)
+        self.assertTrue(np.array_equal(loaded['power'], levels['power']))
+        self.assertTrue(np.array_equal(
+            loaded['mono'][4000], levels['mono'][4000]
+        ))
+
+    def test_eviction(self):
+        levels = audio_io.pyramid(VALID_MIX)
+        limit = audio_io.PYRAMID_CACHE_BYTES
+        audio_io.PYRAMID_CACHE_BYTES = 1
+        try:
+            audio_io.pyramid(RAW_INPUT1)
+        finally:
+            audio_io.PYRAMID_CACHE_BYTES = limit
+        self.assertIsNone(audio_io.cached_pyramid(VALID_MIX))
+        self.assertIsNotNone(audio_io.cached_pyramid(RAW_INPUT1))
@@ -0,0 +1,149 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from new_multitrack import batch
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+def relpath(f):
+    return os.path.join(os.path.dirname(__file__), f)
+
+SHORT_FILES = relpath('data/Short_Files')
+
+VALID_MANIFEST = {
+    'mix': os.path.join(SHORT_FILES, 'Mix.wav'),
+    'stem_dir': os.path.join(SHORT_FILES, 'Stems'),
+    'raw_dir': os.path.join(SHORT_FILES, 'Raw'),
+    'metadata': {'artist': 'Test Artist', 'title': 'Test Song'},
+    'stems': {
+        'Stem1.wav': {'inst': 'piano', 'component': 'melody'},
+        'Stem2.wav': {'inst': 'drum set', 'component': ''},
+        'Stem3.wav': {'inst': 'darbuka', 'component': ''},
+        'Stem4.wav': {'inst': 'electric bass', 'component': 'bass'},
+    },
+    'raws': {
+        'Raw1.wav': {'inst': 'piano', 'stem': 'Stem1.wav'},
+        'Raw3.wav': {'inst': 'piano', 'stem': 'Stem1.wav'},
+    },
+    'ranking': [['Stem1.wav', 1]],
+}
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.session_dir = os.path.join(self.tmpdir, 'session1')
+        os.mkdir(self.session_dir)
+        self.manifest = os.path.join(self.session_dir, 'manifest.json')
+        with open(self.manifest, 'w') as fhandle:
+            json.dump(VALID_MANIFEST, fhandle)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_manifests(self):
+        self.assertEqual(batch.find_manifests([self.tmpdir]), [self.manifest])
+        self.assertEqual(
+            batch.find_manifests([self.session_dir]), [self.manifest]
+        )
+
+    def test_load_manifest(self):
+        actual = batch.load_manifest(self.manifest)
+        self.assertEqual(
+            actual['raw_info']['Raw3.wav']['path'],
+            os.path.join(SHORT_FILES, 'Raw', 'Raw3.wav')
+        )
+        self.assertEqual(actual['metadata']['album'], '')
+
+    def test_load_manifest_aliases(self):
+        manifest = json.loads(json.dumps(VALID_MANIFEST))
+        manifest['stems']['Stem2.wav']['inst'] = 'Drums'
+        manifest['stems']['Stem3.wav']['inst'] = 'kazoo'
+        with open(self.manifest, 'w') as fhandle:
+            json.dump(manifest, fhandle)
+        actual = batch.load_manifest(self.manifest)
+        self.assertEqual(actual['stem_info']['Stem2.wav']['inst'], 'drum set')
+        self.assertEqual(actual['stem_info']['Stem3.wav']['inst'], 'kazoo')
+
+    def test_run_session(self):
+        save_path = os.path.join(self.tmpdir, 'out')
+        os.mkdir(save_path)
+        actual = batch.run_session(self.manifest, save_path)
+        self.assertEqual(actual['status'], 'ok')
+        self.assertTrue(actual['packaged'])
+        self.assertTrue(os.path.exists(os.path.join(
+            save_path, 'TestArtist_TestSong',
+            'TestArtist_TestSong_METADATA.yaml'
+        )))
+
+    def test_run_session_fused(self):
+        save_path = os.path.join(self.tmpdir, 'out')
+        os.mkdir(save_path)
+        actual = batch.run_session(self.manifest, save_path, fused=True)
+        self.assertEqual(actual['status'], 'ok')
+        self.assertTrue(actual['packaged'])
+        self.assertEqual(os.listdir(save_path), ['TestArtist_TestSong'])
+
+    def test_run_session_fused_invalid(self):
+        manifest = dict(VALID_MANIFEST)
+        manifest['raw_dir'] = os.path.join(SHORT_FILES, 'StemInRawChannels')
+        with open(self.manifest, 'w') as fhandle:
+            json.dump(manifest, fhandle)
+        save_path = os.path.join(self.tmpdir, 'out')
+        os.mkdir(save_path)
+
+        actual = batch.run_session(self.manifest, save_path, fused=True)
+        self.assertEqual(actual['status'], 'invalid')
+        self.assertFalse(actual['packaged'])
+        self.assertEqual(os.listdir(save_path), [])
+
+        actual = batch.run_session(
+            self.manifest, save_path, force=True, fused=True
+        )
+        self.assertTrue(actual['packaged'])
+        self.assertEqual(os.listdir(save_path), ['TestArtist_TestSong'])
+
+    def test_validate_session_without_raws(self):
+        session = batch.load_manifest(self.manifest)
+        session['raw_info'] = {}
+        session['stem_path'] = os.path.join(SHORT_FILES, 'MisalignedStems')
+        session['stem_info'] = {
+            'Stem1Misaligned.wav': {
+                'path': os.path.join(session['stem_path'],
+                                     'Stem1Misaligned.wav'),
+                'inst': 'piano', 'component': 'melody',
+            },
+            'Stem3Misaligned.wav': {
+                'path': os.path.join(session['stem_path'],
+                                     'Stem3Misaligned.wav'),
+                'inst': 'darbuka', 'component': '',
+            },
+        }
+        with mock.patch.object(batch.validation, 'check_audio',
+                               return_value={}):
+            problems = batch.validate_session(session)
+        self.assertEqual(problems, [
+            'MisalignedStems : Stem files are not aligned with the mix.'
+        ])
+
+    def test_run_session_verify(self):
+        save_path = os.path.join(self.tmpdir, 'out')
+        os.mkdir(save_path)
+        with mock.patch.object(batch, 'process_data',
+                               wraps=batch.process_data) as process_data:
+            batch.main([self.manifest, '--save-path', save_path,
+                        '--verify', '--output', os.devnull])
+        self.assertTrue(process_data.call_args[1]['verify'])
+
+    def test_run_session_error(self):
+        with open(self.manifest, 'w') as fhandle:
+            json.dump({'mix': 'Mix.wav'}, fhandle)
+        actual = batch.run_session(self.manifest)
+        self.assertEqual(actual['status'], 'error')
+        self.assertFalse(actual['packaged'])
@@ -0,0 +1,133 @@
+import unittest
+import os
+import shutil
+import tempfile
+import yaml
+from new_multitrack import metadata_io
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+METADATA = {
+    'album': None, 'artist': 'TestArtist', 'composer': 'Someone',
+    'excerpt': 'no', 'genre': 'Singer/Songwriter', 'has_bleed': 'yes',
+    'instrumental': 'no', 'mix_filename': 'TestArtist_TestSong_MIX.wav',
+    'origin': 'Dolan Studio', 'producer': None, 'release date': None,
+    'raw_dir': 'TestArtist_TestSong_RAW',
+    'stem_dir': 'TestArtist_TestSong_STEMS',
+    'title': 'TestSong', 'website': None,
+    'stems': {
+        'S01': {
+            'component': 'melody',
+            'filename': 'TestArtist_TestSong_STEM_01.wav',
+            'instrument': 'male singer',
+            'raw': {'R01': {'filename': 'TestArtist_TestSong_RAW_01_01.wav',
+                            'instrument': 'male singer'}},
+        },
+        'S02': {
+            'component': '',
+            'filename': 'TestArtist_TestSong_STEM_02.wav',
+            'instrument': 'acoustic guitar',
+            'raw': {'R01': {'filename': 'TestArtist_TestSong_RAW_02_01.wav',
+                            'instrument': 'acoustic guitar'},
+                    'R02': {'filename': 'TestArtist_TestSong_RAW_02_02.wav',
+                            'instrument': 'acoustic guitar'}},
+        },
+    },
+}
+
+
+class TestMetadataFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_bytes_as_pure_python(self):
+        expected = yaml.dump(METADATA, Dumper=yaml.Dumper,
+                             indent=2, default_flow_style=False)
+        self.assertEqual(metadata_io.dumps_metadata(METADATA), expected)
+
+    def test_round_trip(self):
+        path = os.path.join(self.tmpdir, 'Test_METADATA.yaml')
+        metadata_io.write_metadata(METADATA, path)
+        self.assertEqual(metadata_io.read_metadata(path), METADATA)
+        with open(path) as fhandle:
+            self.assertEqual(fhandle.read(),
+                             metadata_io.dumps_metadata(METADATA))
+
+
+class TestLoadLibrary(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.library_dir = os.path.join(self.tmpdir, 'library')
+        self.cache_path = os.path.join(self.tmpdir, 'library.json')
+        for track_id in ['A_One', 'B_Two', 'C_Three']:
+            track_dir = os.path.join(self.library_dir, track_id)
+            os.makedirs(track_dir)
+            metadata = dict(METADATA, title=track_id)
+            metadata_io.write_metadata(metadata, os.path.join(
+                track_dir, track_id + metadata_io.METADATA_SUFFIX
+            ))
+        with open(os.path.join(self.library_dir, 'notes.yaml'), 'w') as fh:
+            fh.write('title: not metadata\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load(self):
+        library = metadata_io.load_library(self.library_dir)
+        self.assertEqual(sorted(library), [
+            os.path.join('A_One', 'A_One_METADATA.yaml'),
+            os.path.join('B_Two', 'B_Two_METADATA.yaml'),
+            os.path.join('C_Three', 'C_Three_METADATA.yaml'),
+        ])
+        self.assertEqual(
+            library[os.path.join('B_Two', 'B_Two_METADATA.yaml')],
+            dict(METADATA, title='B_Two')
+        )
+
+    def test_parallel(self):
+        self.assertEqual(
+            metadata_io.load_library(self.library_dir, n_workers=2),
+            metadata_io.load_library(self.library_dir)
+        )
+
+    def test_cache(self):
+        expected = metadata_io.load_library(
+            self.library_dir, cache_path=self.cache_path
+        )
+        self.assertTrue(os.path.exists(self.cache_path))
+
+        with mock.patch.object(metadata_io, 'load_yaml') as load_yaml:
+            actual = metadata_io.load_library(
+                self.library_dir, cache_path=self.cache_path
+            )
+        self.assertFalse(load_yaml.called)
+        self.assertEqual(actual, expected)
+
+    def test_stale_cache(self):
+        metadata_io.load_library(self.library_dir, cache_path=self.cache_path)
+        path = os.path.join(self.library_dir, 'A_One', 'A_One_METADATA.yaml')
+        metadata_io.write_metadata(dict(METADATA, title='Renamed'), path)
+        os.utime(path, (0, 0))
+        os.remove(os.path.join(self.library_dir, 'C_Three',
+                               'C_Three_METADATA.yaml'))
+
+        library = metadata_io.load_library(
+            self.library_dir, cache_path=self.cache_path
+        )
+        self.assertEqual(len(library), 2)
+        self.assertEqual(
+            library[os.path.join('A_One', 'A_One_METADATA.yaml')]['title'],
+            'Renamed'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
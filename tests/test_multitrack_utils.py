@@ -0,0 +1,207 @@
+import unittest
+import os
+import shutil
+import tempfile
+import wave
+import numpy as np
+from scipy.io import wavfile
+from new_multitrack import multitrack_utils, audio_io, validation
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+def relpath(f):
+    return os.path.join(os.path.dirname(__file__), f)
+
+VALID_MIX = relpath('data/Short_Files/Mix.wav')
+STEM_INPUT1 = relpath('data/Short_Files/Stems/Stem1.wav')
+STEM_INPUT3 = relpath('data/Short_Files/Stems/Stem3.wav')
+RAW_INPUT1 = relpath('data/Short_Files/Raw/Raw1.wav')
+RAW_INPUT3 = relpath('data/Short_Files/Raw/Raw3.wav')
+
+
+def read(fpath):
+    with open(fpath, 'rb') as fhandle:
+        return fhandle.read()
+
+
+class TestCopyFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dst = os.path.join(self.tmpdir, 'copy.wav')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_verified_copy(self):
+        checksum = multitrack_utils.copy_file(VALID_MIX, self.dst, verify=True)
+        self.assertEqual(read(self.dst), read(VALID_MIX))
+        if checksum is not None:
+            self.assertEqual(checksum, multitrack_utils.file_checksum(VALID_MIX))
+
+    def test_unverified_copy(self):
+        checksum = multitrack_utils.copy_file(VALID_MIX, self.dst, verify=False)
+        self.assertIsNone(checksum)
+        self.assertEqual(read(self.dst), read(VALID_MIX))
+
+    def test_analyzed_copy(self):
+        analyzer = mock.Mock()
+        with mock.patch.object(multitrack_utils.hashlib, 'md5') as md5:
+            checksum = multitrack_utils.copy_file(
+                VALID_MIX, self.dst, analyzer=analyzer
+            )
+        self.assertIsNone(checksum)
+        self.assertFalse(md5.called)
+        self.assertTrue(analyzer.feed.called)
+        self.assertEqual(read(self.dst), read(VALID_MIX))
+
+    def test_kernel_copy(self):
+        if multitrack_utils.kernel_copy(RAW_INPUT1, self.dst):
+            self.assertEqual(read(self.dst), read(RAW_INPUT1))
+        else:
+            self.assertFalse(os.path.exists(self.dst))
+
+
+class TestProcessData(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.metadata = dict.fromkeys([
+            'artist', 'title', 'album', 'composer', 'producer', 'website',
+            'instrumental', 'excerpt', 'has_bleed', 'genre', 'origin'
+        ], '')
+        self.metadata['artist'] = 'Test Artist'
+        self.metadata['title'] = 'Test Song'
+        self.stem_info = {
+            'Stem1.wav': {'path': STEM_INPUT1, 'inst': 'piano', 'component': 'melody'},
+        }
+        self.raw_info = {
+            'Raw1.wav': {'path': RAW_INPUT1, 'inst': 'piano', 'stem': 'Stem1.wav'},
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_copies(self):
+        multitrack_utils.process_data(
+            self.tmpdir, self.metadata, VALID_MIX, self.stem_info,
+            self.raw_info, [['Stem1.wav', 1]]
+        )
+        track_path = os.path.join(self.tmpdir, 'TestArtist_TestSong')
+        mix = os.path.join(track_path, 'TestArtist_TestSong_MIX.wav')
+        stem = os.path.join(
+            track_path, 'TestArtist_TestSong_STEMS',
+            'TestArtist_TestSong_STEM_01.wav'
+        )
+        raw = os.path.join(
+            track_path, 'TestArtist_TestSong_RAW',
+            'TestArtist_TestSong_RAW_01_01.wav'
+        )
+        self.assertEqual(read(mix), read(VALID_MIX))
+        self.assertEqual(read(stem), read(STEM_INPUT1))
+        self.assertEqual(read(raw), read(RAW_INPUT1))
+
+    def test_copy_files_eager(self):
+        nm = multitrack_utils.NewMultitrack(self.tmpdir)
+        nm.setArtist('Test Artist')
+        nm.setTitle('Test Song')
+        nm.makeFileStructure()
+        nm.addMixFile(VALID_MIX)
+        self.assertEqual(read(nm.mix_path), read(VALID_MIX))
+        self.assertEqual(nm.pending_copies, [])
+
+    def test_copy_files_queued(self):
+        nm = multitrack_utils.NewMultitrack(
+            self.tmpdir, n_workers=3, defer_copies=True
+        )
+        nm.setArtist('Test Artist')
+        nm.setTitle('Test Song')
+        nm.makeFileStructure()
+        nm.addMixFile(VALID_MIX)
+        stem_idx = nm.addStemFile(STEM_INPUT1, 'piano', 'melody')
+        nm.addRawFile(RAW_INPUT1, stem_idx, 'piano')
+        nm.addRawFile(RAW_INPUT3, stem_idx, 'piano')
+        self.assertFalse(os.path.exists(nm.mix_path))
+        self.assertEqual(len(nm.pending_copies), 4)
+
+        nm.copyFiles()
+        self.assertEqual(nm.pending_copies, [])
+        for src, dst in [(VALID_MIX, nm.mix_path),
+                         (RAW_INPUT3, os.path.join(nm.raw_path, nm.raw_fmt % ('01', '02')))]:
+            self.assertEqual(read(dst), read(src))
+        self.assertEqual(
+            sorted(nm.metadata_dict['stems']['S01']['raw'].keys()),
+            ['R01', 'R02']
+        )
+
+
+class TestFusedAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        audio_io.clear_cache()
+        audio_io.clear_pyramids()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        audio_io.clear_pyramids()
+
+    def test_analysis_matches_validation(self):
+        files = [STEM_INPUT1, STEM_INPUT3]
+        expected_silence = [validation.find_silence(f) for f in files]
+        expected_offset = validation.measure_alignment(files, VALID_MIX)
+
+        nm = multitrack_utils.NewMultitrack(
+            self.tmpdir, analyze=True, defer_copies=True
+        )
+        nm.setArtist('Test Artist')
+        nm.setTitle('Test Song')
+        nm.makeFileStructure()
+        nm.addMixFile(VALID_MIX)
+        for stem in files:
+            nm.addStemFile(stem, 'piano', '')
+        nm.copyFiles()
+
+        reader = mock.Mock(wraps=audio_io.WavReader)
+        with mock.patch.object(audio_io, 'WavReader', reader):
+            audio_io.clear_cache()
+            actual_silence = [validation.find_silence(f) for f in files]
+            actual_offset = validation.measure_alignment(files, VALID_MIX)
+            copy_silence = validation.find_silence(nm.mix_path)
+
+        self.assertEqual(reader.call_count, 0)
+        self.assertEqual(actual_silence, expected_silence)
+        self.assertEqual(actual_offset['offset'], expected_offset['offset'])
+        self.assertTrue(np.isclose(
+            actual_offset['confidence'], expected_offset['confidence']
+        ))
+        self.assertEqual(copy_silence, validation.find_silence(VALID_MIX))
+
+    def test_24_bit(self):
+        src = os.path.join(self.tmpdir, 'Mix_24.wav')
+        sr, audio = wavfile.read(VALID_MIX)
+        packed = (audio.astype('<i4') * 256).view(np.uint8).reshape(
+            audio.shape + (4,)
+        )[..., :3]
+        out = wave.open(src, 'wb')
+        out.setnchannels(2)
+        out.setsampwidth(3)
+        out.setframerate(sr)
+        out.writeframes(packed.tobytes())
+        out.close()
+        expected = audio_io.compute_pyramid(src)
+
+        dst = os.path.join(self.tmpdir, 'copy.wav')
+        analyzer = audio_io.StreamAnalyzer(src)
+        multitrack_utils.copy_file(src, dst, analyzer=analyzer)
+        analyzer.finish([dst])
+
+        actual = audio_io.pyramid(dst)
+        self.assertTrue(np.allclose(actual['power'], expected['power']))
+        for rate in expected['mono']:
+            self.assertTrue(np.allclose(
+                actual['mono'][rate], expected['mono'][rate]
+            ))
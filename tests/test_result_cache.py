@@ -0,0 +1,132 @@
+import unittest
+import os
+import shutil
+import tempfile
+from new_multitrack import result_cache, validation
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+def relpath(f):
+    return os.path.join(os.path.dirname(__file__), f)
+
+VALID_MIX = relpath('data/Short_Files/Mix.wav')
+RAW_INPUT1 = relpath('data/Short_Files/Raw/Raw1.wav')
+RAW_INPUT3 = relpath('data/Short_Files/Raw/Raw3.wav')
+STEM_INPUT1 = relpath('data/Short_Files/Stems/Stem1.wav')
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fpath = os.path.join(self.tmpdir, 'Raw1.wav')
+        shutil.copyfile(RAW_INPUT1, self.fpath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_stable(self):
+        self.assertEqual(
+            result_cache.fingerprint(self.fpath),
+            result_cache.fingerprint(self.fpath)
+        )
+
+    def test_content_changed(self):
+        first = result_cache.fingerprint(self.fpath)
+        stat = os.stat(self.fpath)
+        with open(self.fpath, 'r+b') as fhandle:
+            fhandle.seek(100)
+            fhandle.write(b'\x7f\x7f')
+        os.utime(self.fpath, (stat.st_atime, stat.st_mtime))
+        self.assertNotEqual(first, result_cache.fingerprint(self.fpath))
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_persistent(self):
+        cache = result_cache.session_cache(self.tmpdir)
+        key = cache.key([RAW_INPUT1], ['raw', 441000])
+        self.assertEqual(cache.get('check_file', key), (False, None))
+        cache.set('check_file', key, {'Silent': True})
+        cache.close()
+
+        cache = result_cache.session_cache(self.tmpdir)
+        self.assertEqual(
+            cache.get('check_file', key), (True, {'Silent': True})
+        )
+        self.assertEqual(cache.get('alignment', key), (False, None))
+        cache.close()
+
+    def test_key_params(self):
+        cache = result_cache.session_cache(self.tmpdir)
+        self.assertNotEqual(
+            cache.key([RAW_INPUT1], ['raw', 441000]),
+            cache.key([RAW_INPUT1], ['raw', 441001])
+        )
+        cache.close()
+
+
+class TestIncrementalRevalidation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.raw_files = []
+        for fpath in [RAW_INPUT1, RAW_INPUT3]:
+            dest = os.path.join(self.tmpdir, os.path.basename(fpath))
+            shutil.copyfile(fpath, dest)
+            self.raw_files.append(dest)
+        self.raw_info = dict(
+            (os.path.basename(f), {'path': f, 'inst': 'piano', 'stem': 'Stem1.wav'})
+            for f in self.raw_files
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_check(self):
+        cache = result_cache.session_cache(self.tmpdir)
+        reader = mock.Mock(wraps=validation.audio_io.WavReader)
+        with mock.patch.object(validation.audio_io, 'WavReader', reader):
+            file_status = validation.check_multitrack(
+                self.raw_files, [STEM_INPUT1], VALID_MIX, self.raw_info,
+                cache=cache
+            )
+        cache.close()
+        opened = set(call[0][0] for call in reader.call_args_list)
+        return file_status, opened
+
+    def test_unchanged_not_rechecked(self):
+        expected, _ = self.run_check()
+        actual, opened = self.run_check()
+        self.assertEqual(actual, expected)
+        self.assertEqual(opened, set())
+
+    def test_changed_file_rechecked(self):
+        self.run_check()
+        shutil.copyfile(RAW_INPUT1, self.raw_files[1])
+        _, opened = self.run_check()
+        # every group analysis involves both raws, so all of them rerun
+        self.assertIn(os.path.abspath(self.raw_files[1]), opened)
+
+    def test_new_version_rechecked(self):
+        self.run_check()
+        with mock.patch.object(validation, 'CACHE_VERSION',
+                               validation.CACHE_VERSION + 1):
+            _, opened = self.run_check()
+        self.assertIn(os.path.abspath(self.raw_files[0]), opened)
+
+    def test_new_constants_rechecked(self):
+        self.run_check()
+        with mock.patch.object(validation, 'SILENCE_BLOCK_SIZE',
+                               validation.SILENCE_BLOCK_SIZE // 2):
+            _, opened = self.run_check()
+        self.assertIn(os.path.abspath(self.raw_files[0]), opened)
@@ -0,0 +1,97 @@
+import unittest
+import io
+import json
+from collections import OrderedDict
+import numpy as np
+from new_multitrack import result_table, validation
+
+
+FILE_STATUS = {
+    'Mix.wav': {'Silent': True, 'Wrong_Stats': True, 'Length_As_Mix': None},
+    'Stem1.wav': {'Silent': False, 'Wrong_Stats': True, 'Length_As_Mix': True},
+    'Raw1.wav': {'Silent': True, 'Wrong_Stats': False, 'Length_As_Mix': False},
+}
+
+VALUES = {
+    'Mixing_Coeff': {'Stem1.wav': 0.5, 'Raw1.wav': 0.002},
+    'Offset_ms': {'Stem1.wav': 0.0, 'Raw1.wav': 12.0},
+}
+
+
+class TestResultTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = result_table.ResultTable.from_file_status(
+            FILE_STATUS, VALUES
+        )
+
+    def test_round_trip(self):
+        self.assertEqual(self.table.to_file_status(), FILE_STATUS)
+        self.assertEqual(len(self.table), 3)
+
+    def test_filtering(self):
+        self.assertEqual(sorted(self.table.failed()), ['Raw1.wav', 'Stem1.wav'])
+        self.assertEqual(self.table.failed('Silent'), ['Stem1.wav'])
+        self.assertEqual(
+            self.table.where('Offset_ms', lambda v: np.abs(v) > 5),
+            ['Raw1.wav']
+        )
+        self.assertEqual(
+            self.table.counts(),
+            {'Silent': 1, 'Wrong_Stats': 1, 'Length_As_Mix': 1}
+        )
+
+    def test_problems(self):
+        self.assertEqual(
+            sorted(validation.create_problems(self.table)),
+            sorted(validation.create_problems(FILE_STATUS))
+        )
+
+    def test_problems_order(self):
+        file_status = OrderedDict([
+            ('Stem1.wav', OrderedDict([
+                ('Wrong_Stats', False), ('Silent', False),
+                ('Trace', [{'check': 'stats_check', 'seconds': 0.1}]),
+            ])),
+            ('Mix.wav', OrderedDict([
+                ('Wrong_Stats', False), ('Silent', True),
+            ])),
+        ])
+        table = result_table.ResultTable.from_file_status(file_status)
+        self.assertNotIn('Trace', table.status)
+        self.assertEqual(table.files, ['Stem1.wav', 'Mix.wav'])
+        self.assertEqual(
+            validation.create_problems(table),
+            validation.create_problems(file_status)
+        )
+
+    def test_grow_and_extend(self):
+        table = result_table.ResultTable()
+        for i in range(40):
+            table.set_status('Silent', {'f{}.wav'.format(i): i % 2 == 0})
+        table.set_values('Mixing_Coeff', {'f39.wav': 1.0})
+        self.assertEqual(len(table.failed('Silent')), 20)
+        self.assertTrue(np.isnan(table.column('Mixing_Coeff')[0]))
+
+        table.extend(self.table, prefix='s1/')
+        self.assertEqual(len(table), 43)
+        self.assertEqual(table.record('s1/Raw1.wav')['Mixing_Coeff'], 0.002)
+        self.assertIsNone(table.record('s1/Mix.wav')['Length_As_Mix'])
+        self.assertIsNone(table.record('f0.wav')['Wrong_Stats'])
+
+    def test_json_lines(self):
+        out = io.StringIO() if str is not bytes else io.BytesIO()
+        self.table.write_json_lines(out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(records), 3)
+        raw = [r for r in records if r['file'] == 'Raw1.wav'][0]
+        self.assertEqual(raw['Offset_ms'], 12.0)
+        self.assertFalse(raw['Wrong_Stats'])
+
+    def test_arrow(self):
+        if result_table.pyarrow is None:
+            with self.assertRaises(ImportError):
+                self.table.to_arrow()
+            return
+        arrow = self.table.to_arrow()
+        self.assertEqual(arrow.num_rows, 3)
@@ -0,0 +1,102 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from new_multitrack import taxonomy, multitrack_utils
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+TAXONOMY = {
+    'strings': {'bowed': ['violin', 'cello'], 'plucked': ['harp']},
+    'voices': ['male singer', 'female singer'],
+    'electric': {'amplified': ['electric bass']},
+}
+
+
+class TestBuildIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = taxonomy.build_index(TAXONOMY)
+
+    def test_groups(self):
+        self.assertEqual(
+            self.index['groups']['strings'], ['cello', 'harp', 'violin']
+        )
+        self.assertEqual(self.index['inst_group']['female singer'], 'voices')
+
+    def test_aliases(self):
+        self.assertEqual(
+            taxonomy.canonical_name('Male_Singer', self.index), 'male singer'
+        )
+        self.assertEqual(
+            taxonomy.instrument_group('Bass Guitar', self.index), 'electric'
+        )
+        self.assertIsNone(taxonomy.canonical_name('kazoo', self.index))
+        self.assertNotIn('drums', self.index['aliases'])
+
+    def test_matches_dict_leaves(self):
+        with open(taxonomy.TAXONOMY_PATH) as fhandle:
+            raw = taxonomy.metadata_io.load_yaml(fhandle)
+        index = taxonomy.get_index()
+        for group in raw:
+            self.assertEqual(
+                index['groups'][group],
+                sorted(multitrack_utils.get_dict_leaves(raw[group]))
+            )
+
+
+class TestLoadIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmpdir, 'index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache_file(self):
+        expected = taxonomy.load_index(cache_path=self.cache_path)
+        self.assertTrue(os.path.exists(self.cache_path))
+
+        with mock.patch.object(taxonomy.metadata_io, 'load_yaml') as load_yaml:
+            actual = taxonomy.load_index(cache_path=self.cache_path)
+        self.assertFalse(load_yaml.called)
+        self.assertEqual(actual, expected)
+
+    def test_stale_cache_file(self):
+        path = os.path.join(self.tmpdir, 'taxonomy.yaml')
+        with open(path, 'w') as fhandle:
+            fhandle.write('voices: [male singer]\n')
+        taxonomy.load_index(path, self.cache_path)
+
+        with open(path, 'w') as fhandle:
+            fhandle.write('voices: [male singer, female singer]\n')
+        os.utime(path, (0, 0))
+        index = taxonomy.load_index(path, self.cache_path)
+        self.assertEqual(index['groups']['voices'],
+                         ['female singer', 'male singer'])
+
+    def test_corrupt_cache_file(self):
+        expected = taxonomy.load_index(cache_path=self.cache_path)
+        with open(self.cache_path, 'w') as fhandle:
+            fhandle.write('{"groups": {"voi')
+        self.assertEqual(
+            taxonomy.load_index(cache_path=self.cache_path), expected
+        )
+        with open(self.cache_path, 'r') as fhandle:
+            self.assertEqual(json.load(fhandle)['groups'], expected['groups'])
+
+    def test_loaded_once(self):
+        path = os.path.join(self.tmpdir, 'taxonomy.yaml')
+        with open(path, 'w') as fhandle:
+            fhandle.write('voices: [male singer]\n')
+        with mock.patch.object(taxonomy, 'CACHE_DIR', self.tmpdir):
+            index = taxonomy.get_index(path)
+            self.assertIs(taxonomy.get_index(path), index)
+            self.assertTrue(
+                os.path.exists(taxonomy.default_cache_path(path))
+            )
@@ -0,0 +1,67 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from new_multitrack import tracing, validation, audio_io
+
+
+def relpath(f):
+    return os.path.join(os.path.dirname(__file__), f)
+
+VALID_MIX = relpath('data/Short_Files/Mix.wav')
+VALID_RAW = relpath('data/Short_Files/Raw')
+VALID_STEMS = relpath('data/Short_Files/Stems')
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        audio_io.clear_pyramids()
+
+    def tearDown(self):
+        tracing.stop_tracing()
+        shutil.rmtree(self.tmpdir)
+
+    def test_off_by_default(self):
+        tracer = tracing.Tracer()
+        validation.get_length(VALID_MIX)
+        self.assertEqual(tracer.records, [])
+
+    def test_records(self):
+        tracer = tracing.start_tracing(memory=True)
+        validation.find_silence(VALID_MIX)
+        tracing.stop_tracing()
+
+        names = [r['check'] for r in tracer.records]
+        self.assertEqual(names[-1], 'find_silence')
+        outer = tracer.records[-1]
+        self.assertEqual(outer['files'], ['Mix.wav'])
+        self.assertEqual(outer['depth'], 0)
+        self.assertGreater(outer['bytes_read'], 0)
+        self.assertGreaterEqual(outer['wall'], 0.0)
+        self.assertIsNotNone(outer['peak_bytes'])
+
+        validation.find_silence(VALID_MIX)
+        self.assertEqual(len(tracer.records), len(names))
+
+    def test_export_and_attach(self):
+        tracer = tracing.start_tracing()
+        file_status = validation.check_audio(VALID_RAW, VALID_STEMS, VALID_MIX)
+        tracing.stop_tracing()
+
+        trace_path = os.path.join(self.tmpdir, 'trace.json')
+        tracer.export(trace_path)
+        with open(trace_path) as fhandle:
+            events = json.load(fhandle)['traceEvents']
+        self.assertEqual(len(events), len(tracer.records))
+        self.assertEqual(events[0]['ph'], 'X')
+
+        expected = validation.create_problems(file_status)
+        tracing.attach(file_status, tracer)
+        checks = set(r['check'] for r in file_status['Raw1.wav']['Trace'])
+        self.assertIn('is_right_stats', checks)
+        self.assertIn('check_file', checks)
+        self.assertEqual(validation.create_problems(file_status), expected)
+        self.assertEqual(tracer.summary()['check_audio']['calls'], 1)
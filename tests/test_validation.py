@@ -1,9 +1,21 @@
 import unittest
 import os
-from new_multitrack import new_multitrack, validation
+import shutil
+import struct
+import tempfile
+import wave
+from new_multitrack import new_multitrack, validation, audio_io, tracing, \
+    result_cache
 import glob
 import math
+import numpy as np
+from scipy.optimize import nnls
+from scipy.io import wavfile
 from unittest import TestCase
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
 
 TestCase.maxDiff = None
@@ -43,7 +55,21 @@ STEM_INPUT4 = relpath('data/Short_Files/Stems/Stem4.wav')
 RAW_FILES_LIST = [RAW_INPUT1, RAW_INPUT2, RAW_INPUT3, RAW_INPUT4_1, RAW_INPUT4_2]
 STEM_FILES_LIST = [STEM_INPUT1, STEM_INPUT2, STEM_INPUT3, STEM_INPUT4]
 
+VALID_RAW_INFO = {
+    'Raw1.wav': {'path': RAW_INPUT1, 'inst': 'distorted electric guitar', 'stem': 'Stem1.wav'},
+    'Raw3.wav': {'path': RAW_INPUT3, 'inst': 'distorted electric guitar', 'stem': 'Stem1.wav'},
+    'Raw2.wav': {'path': RAW_INPUT2, 'inst': 'darbuka', 'stem': 'Stem3.wav'},
+    'Raw4.wav': {'path': RAW_INPUT4_1, 'inst': 'darbuka', 'stem': 'Stem3.wav'},
+    'Raw4_2.wav': {'path': RAW_INPUT4_2, 'inst': 'darbuka', 'stem': 'Stem3.wav'},
+}
+
+VALID_STEM_INFO = {
+    'Stem1.wav': {'path': STEM_INPUT1, 'inst': 'distorted electric guitar', 'group': 'electric'},
+    'Stem3.wav': {'path': STEM_INPUT3, 'inst': 'darbuka'},
+}
+
 SILENT_FILE = relpath('data/Short_Files/Error_Throwers/Piano_L.R.wav')
+SILENCE_FILE = relpath('data/Short_Files/Error_Throwers/silence.wav')
 
 WRONG_LENGTH = relpath('data/Short_Files/Error_Throwers/wrong_length.wav')
 
@@ -220,6 +246,33 @@ class TestIsSilence(unittest.TestCase):
         self.assertEqual(actual, expected)
 
 
+class TestFindSilence(unittest.TestCase):
+
+    def test_silent_file(self):
+        actual = validation.find_silence(SILENCE_FILE)
+        expected = (True, [(0.0, 14.228027210884354)])
+        self.assertEqual(actual, expected)
+
+    def test_silent_sections(self):
+        actual = validation.find_silence(MISALIGNED_STEM1)
+        expected = (False, [(0.0, 5.0)])
+        self.assertEqual(actual, expected)
+
+    def test_framesize(self):
+        silent, sections = validation.find_silence(MISALIGNED_STEM1, framesize=10000)
+        self.assertFalse(silent)
+        self.assertEqual(sections, [(0.0, 260000 / 44100.0)])
+
+    def test_threshold(self):
+        silent, sections = validation.find_silence(SILENCE_FILE, threshold=1)
+        self.assertFalse(silent)
+        self.assertEqual(sections, [])
+
+    def test_has_silent_sections(self):
+        self.assertTrue(validation.has_silent_sections([(0.0, 5.0)]))
+        self.assertFalse(validation.has_silent_sections([(0.0, 1.0), (3.0, 7.5)], min_dur=5.0))
+
+
 class TestStatsCheck(unittest.TestCase):
 
     def test_valid_stats(self):
@@ -339,6 +392,106 @@ class TestAnalyzeMix(unittest.TestCase):
         self.assertEqual(actual, expected) #0.6847636702791934
 
 
+class TestNnlsGram(unittest.TestCase):
+
+    def test_matches_nnls(self):
+        rng = np.random.RandomState(0)
+        audio = np.abs(rng.randn(1000, 4))
+        target = audio.dot([0.5, 0.0, 1.2, 0.3]) + 0.01 * rng.randn(1000)
+
+        expected, _ = nnls(audio, target)
+        actual = validation.nnls_gram(audio.T.dot(audio), audio.T.dot(target))
+        self.assertTrue(np.allclose(actual, expected))
+
+    def test_singular(self):
+        audio = np.ones((100, 2))
+        target = 2.0 * np.ones(100)
+
+        actual = validation.nnls_gram(audio.T.dot(audio), audio.T.dot(target))
+        self.assertAlmostEqual(actual.sum(), 2.0)
+
+
+class TestAlignmentTable(unittest.TestCase):
+
+    def test_lag_table(self):
+        stem_files = STEM_FILES_LIST + [MISALIGNED_STEM1]
+        spectra = mock.Mock(wraps=validation.alignment.spectra)
+        with mock.patch.object(validation.alignment, 'spectra', spectra):
+            actual = validation.alignment_table(
+                stem_files, VALID_MIX, VALID_RAW_INFO
+            )
+
+        n_transformed = sum(len(c[0][0]) for c in spectra.call_args_list)
+        self.assertEqual(n_transformed, len(stem_files) + len(VALID_RAW_INFO) + 1)
+        self.assertEqual(actual['Stem1.wav']['offset'], 0)
+        self.assertEqual(actual['Stem1Misaligned.wav']['offset'], 2334)
+        self.assertEqual(actual['Raw1.wav']['reference'], 'Stem1.wav')
+        self.assertEqual(actual['Raw1.wav']['offset'], -1)
+        self.assertEqual(actual['Stem1.wav']['reference'], 'Mix.wav')
+
+
+class TestRefineCoeffs(unittest.TestCase):
+
+    def test_same_decisions(self):
+        full = validation.get_coeffs(STEM_FILES_LIST, VALID_MIX, False)
+        actual = validation.refine_coeffs(STEM_FILES_LIST, VALID_MIX)
+        self.assertEqual(sorted(actual['coeffs']), sorted(full))
+        for k, v in full.items():
+            self.assertEqual(
+                validation.check_weight(actual['coeffs'][k]),
+                validation.check_weight(v)
+            )
+        self.assertTrue(0.0 <= actual['residual'] <= 1.0)
+        self.assertAlmostEqual(actual['confidence'], 1.0 - actual['residual'])
+        self.assertEqual(len(actual['refined']), 1)
+
+    def test_refine_everything(self):
+        full = validation.get_coeffs(RAW_FILES_LIST, STEM_INPUT4, True)
+        actual = validation.refine_coeffs(
+            RAW_FILES_LIST, STEM_INPUT4, refine_fraction=1.0
+        )
+        for k, v in full.items():
+            self.assertAlmostEqual(actual['coeffs'][k], v)
+
+    def test_clean_mix(self):
+        # stems sharing one noise source under different positive
+        # envelopes, so the mix's absolute value is exactly the weighted
+        # sum of theirs; Stem2's 1500 Hz modulation is lost in the coarse
+        # pyramid, where that no longer holds
+        tmpdir = tempfile.mkdtemp()
+        try:
+            sr = 8000
+            t = np.arange(10 * sr) / float(sr)
+            noise = np.random.RandomState(0).randn(len(t))
+            stems = [
+                0.05 * noise,
+                0.05 * noise * (0.5 + 0.5 * np.sin(2 * np.pi * 3.7 * t)) *
+                (0.5 + 0.5 * np.sin(2 * np.pi * 1500 * t)),
+            ]
+            file_list = []
+            for i, stem in enumerate(stems):
+                fpath = os.path.join(tmpdir, 'Stem{}.wav'.format(i + 1))
+                wavfile.write(fpath, sr, (stem * 2 ** 15).astype(np.int16))
+                file_list.append(fpath)
+            mix_path = os.path.join(tmpdir, 'Mix.wav')
+            mix = 0.8 * stems[0] + 0.5 * stems[1]
+            wavfile.write(mix_path, sr, (mix * 2 ** 15).astype(np.int16))
+
+            for refine_fraction in [0.1, 0.5, 1.0]:
+                actual = validation.refine_coeffs(
+                    file_list, mix_path, coarse_sr=1000,
+                    refine_fraction=refine_fraction
+                )
+                self.assertAlmostEqual(
+                    actual['coeffs']['Stem1.wav'], 0.8, places=3
+                )
+                self.assertAlmostEqual(
+                    actual['coeffs']['Stem2.wav'], 0.5, places=3
+                )
+        finally:
+            shutil.rmtree(tmpdir)
+
+
 class TestAlignmentHelper(unittest.TestCase):
 
     def test_alignment_helper(self):
@@ -365,6 +518,26 @@ class TestAlignmentHelper(unittest.TestCase):
         expected = True
         self.assertEqual(actual, expected)
 
+    def test_helper_misaligned(self):
+        actual = validation.alignment_helper(MISALIGNED_STEMS_LIST, VALID_MIX)
+        self.assertFalse(actual)
+
+    def test_windows_vote(self):
+        actual = validation.measure_alignment(
+            STEM_FILES_LIST, VALID_MIX, window=2.0, n_windows=3
+        )
+        self.assertEqual(len(actual['windows']), 3)
+        self.assertEqual(actual['offset'], 0)
+
+    def test_pick_windows(self):
+        starts, length = validation.pick_windows(VALID_MIX, 1000, 2.0, 2, 500)
+        self.assertEqual(length, 2000)
+        self.assertEqual(len(starts), 2)
+        self.assertEqual(starts, sorted(starts))
+        for start in starts:
+            self.assertEqual(start % 10, 0)
+            self.assertTrue(500 <= start <= 10000 - 2500)
+
 
 class TestCreateProblems(unittest.TestCase):
 
@@ -393,4 +566,336 @@ class TestCreateProblems(unittest.TestCase):
         self.assertEqual(actual, expected)
 
 
+class TestCheckAudio(unittest.TestCase):
+
+    def test_workers_match_serial(self):
+        raw_path = WRONG_CHANNELS_RAW
+        stem_path = VALID_STEMS
+        mix_path = VALID_MIX
+
+        expected = validation.check_audio(raw_path, stem_path, mix_path)
+        actual = validation.check_audio(raw_path, stem_path, mix_path, n_workers=2)
+        self.assertEqual(actual, expected)
+        self.assertFalse(actual['stem_wrong.wav']['Wrong_Stats'])
+
+    def test_24_bit_stem(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            stem_path = os.path.join(tmpdir, 'Stems')
+            shutil.copytree(VALID_STEMS, stem_path)
+            sr, audio = wavfile.read(STEM_INPUT1)
+            packed = (audio.astype('<i4') * 256).view(np.uint8).reshape(
+                audio.shape + (4,)
+            )[..., :3]
+            out = wave.open(os.path.join(stem_path, 'Stem1.wav'), 'wb')
+            out.setnchannels(2)
+            out.setsampwidth(3)
+            out.setframerate(sr)
+            out.writeframes(packed.tobytes())
+            out.close()
+
+            actual = validation.check_audio(VALID_RAW, stem_path, VALID_MIX)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertFalse(actual['Stem1.wav']['Wrong_Stats'])
+        self.assertTrue(actual['Stem1.wav']['Length_As_Mix'])
+        self.assertIsNone(actual['Stem1.wav']['Silent'])
+        self.assertIsNone(actual['Stem1.wav']['Stem_Duplicates'])
+        self.assertTrue(actual['Stem2.wav']['Wrong_Stats'])
+
+    def test_unsupported_format_stem(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            stem_path = os.path.join(tmpdir, 'Stems')
+            shutil.copytree(VALID_STEMS, stem_path)
+            # A-law (format 6), stereo, 8 bit: not PCM and not decodable
+            data = b'\xd5' * (2 * 44100)
+            fmt = struct.pack('<HHIIHH', 6, 2, 44100, 88200, 2, 8)
+            with open(os.path.join(stem_path, 'Stem1.wav'), 'wb') as fhandle:
+                fhandle.write(b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) +
+                                                    8 + len(data)))
+                fhandle.write(b'WAVEfmt ' + struct.pack('<I', len(fmt)) + fmt)
+                fhandle.write(b'data' + struct.pack('<I', len(data)) + data)
+
+            actual = validation.check_audio(VALID_RAW, stem_path, VALID_MIX)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertFalse(actual['Stem1.wav']['Wrong_Stats'])
+        self.assertIsNone(actual['Stem1.wav']['Silent'])
+        self.assertTrue(actual['Stem2.wav']['Silent'])
+
+    def test_progress(self):
+        calls = []
+        progress = lambda check, completed, total: calls.append((check, completed, total))
+        validation.check_audio(VALID_RAW, VALID_STEMS, VALID_MIX, progress=progress)
+        n_files = len(RAW_FILES_LIST) + len(STEM_FILES_LIST) + 1
+        expected = [('files', i, n_files) for i in range(1, n_files + 1)]
+        self.assertEqual(calls, expected)
+
+    def test_cancel(self):
+        def progress(check, completed, total):
+            raise validation.ValidationCancelled()
+        with self.assertRaises(validation.ValidationCancelled):
+            validation.check_audio(
+                VALID_RAW, VALID_STEMS, VALID_MIX, n_workers=2, progress=progress
+            )
+
+
+class TestDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.stem_path = os.path.join(self.tmpdir, 'Stems')
+        shutil.copytree(VALID_STEMS, self.stem_path)
+        audio_io.clear_pyramids()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        audio_io.clear_pyramids()
+
+    def test_find_duplicates(self):
+        signatures = {
+            'a.wav': {'n_frames': 10, 'channels': 1, 'md5': 'x', 'envelope': [0.6, 0.8]},
+            'b.wav': {'n_frames': 10, 'channels': 1, 'md5': 'y', 'envelope': [0.6, 0.8]},
+            'c.wav': {'n_frames': 10, 'channels': 1, 'md5': 'z', 'envelope': [0.8, 0.6]},
+            'd.wav': {'n_frames': 11, 'channels': 1, 'md5': 'x', 'envelope': [0.6, 0.8]},
+            'e.wav': {'n_frames': 10, 'channels': 1, 'md5': 's', 'envelope': [0.0, 0.0]},
+            'f.wav': {'n_frames': 10, 'channels': 1, 'md5': 's', 'envelope': [0.0, 0.0]},
+        }
+        actual = validation.find_duplicates(signatures)
+        self.assertEqual(actual, [('a.wav', 'b.wav'), ('e.wav', 'f.wav')])
+
+    def test_check_audio(self):
+        shutil.copy(STEM_INPUT1, os.path.join(self.stem_path, 'Stem1_copy.wav'))
+        sr, audio = wavfile.read(STEM_INPUT3)
+        wavfile.write(
+            os.path.join(self.stem_path, 'Stem3_quiet.wav'), sr,
+            (audio // 2).astype(audio.dtype)
+        )
+
+        actual = validation.check_audio(VALID_RAW, self.stem_path, VALID_MIX)
+        duplicates = sorted(
+            f for f in actual if actual[f]['Stem_Duplicates'] is False
+        )
+        self.assertEqual(duplicates, [
+            'Stem1.wav', 'Stem1_copy.wav', 'Stem3.wav', 'Stem3_quiet.wav'
+        ])
+        self.assertTrue(actual['Stem2.wav']['Stem_Duplicates'])
+        self.assertTrue(actual['Raw1.wav']['Raw_Duplicates'])
+
+    def test_hash_only_silent_candidates(self):
+        sr, audio = wavfile.read(STEM_INPUT1)
+        for name in ['Silent1.wav', 'Silent2.wav']:
+            wavfile.write(os.path.join(self.stem_path, name), sr,
+                          np.zeros_like(audio))
+
+        with mock.patch.object(validation, 'sample_hash',
+                               wraps=validation.sample_hash) as sample_hash:
+            actual = validation.check_audio(
+                VALID_RAW, self.stem_path, VALID_MIX
+            )
+        hashed = sorted(os.path.basename(c[0][0])
+                        for c in sample_hash.call_args_list)
+        self.assertEqual(hashed, ['Silent1.wav', 'Silent2.wav'])
+        self.assertFalse(actual['Silent1.wav']['Stem_Duplicates'])
+        self.assertTrue(actual['Stem1.wav']['Stem_Duplicates'])
+
+
+class TestCheckMultitrack(unittest.TestCase):
+
+    def test_workers_match_serial(self):
+        raw_files = RAW_FILES_LIST
+        stem_files = [STEM_INPUT1, STEM_INPUT3]
+        mix_path = VALID_MIX
+        raw_info = VALID_RAW_INFO
+
+        expected = validation.check_multitrack(raw_files, stem_files, mix_path, raw_info)
+        actual = validation.check_multitrack(
+            raw_files, stem_files, mix_path, raw_info, n_workers=2
+        )
+        self.assertEqual(actual, expected)
+
+    def test_progress(self):
+        raw_files = RAW_FILES_LIST
+        stem_files = [STEM_INPUT1, STEM_INPUT3]
+        mix_path = VALID_MIX
+        raw_info = VALID_RAW_INFO
+
+        calls = []
+        progress = lambda check, completed, total: calls.append((check, completed, total))
+        validation.check_multitrack(
+            raw_files, stem_files, mix_path, raw_info, progress=progress
+        )
+        expected = [
+            ('alignment', 1, 2), ('alignment', 2, 2), ('inclusion', 1, 3),
+            ('inclusion', 2, 3), ('inclusion', 3, 3)
+        ]
+        self.assertEqual(calls, expected)
+
+    def test_misaligned_raws(self):
+        raw_info = dict(
+            (name, dict(info, stem=info['stem'].replace('.wav', 'Misaligned.wav')))
+            for name, info in VALID_RAW_INFO.items()
+            if info['stem'] in ['Stem1.wav', 'Stem3.wav']
+        )
+        raw_files = sorted(info['path'] for info in raw_info.values())
+        _, _, actual = validation.is_aligned(
+            raw_files, MISALIGNED_STEMS_LIST, VALID_RAW, MISALIGNED_STEMS,
+            VALID_MIX, raw_info
+        )
+        self.assertEqual(
+            actual, {'Stem1Misaligned.wav': False, 'Stem3Misaligned.wav': False}
+        )
+
+        # groups the lag table resolves get the same result as their sums
+        _, _, actual = validation.is_aligned(
+            RAW_FILES_LIST, [STEM_INPUT1, STEM_INPUT3], VALID_RAW, VALID_STEMS,
+            VALID_MIX, VALID_RAW_INFO
+        )
+        self.assertEqual(actual, {
+            'Stem1.wav': validation.alignment_helper(
+                [RAW_INPUT1, RAW_INPUT3], STEM_INPUT1
+            ),
+            'Stem3.wav': validation.alignment_helper(
+                [RAW_INPUT2, RAW_INPUT4_1, RAW_INPUT4_2], STEM_INPUT3
+            ),
+        })
+
+    def test_values(self):
+        values = {}
+        file_status = validation.check_multitrack(
+            RAW_FILES_LIST, [STEM_INPUT1, STEM_INPUT3], VALID_MIX,
+            VALID_RAW_INFO, values=values
+        )
+        self.assertEqual(
+            sorted(values),
+            ['Inclusion_Residual', 'Mixing_Coeff', 'Offset_Confidence', 'Offset_ms']
+        )
+        self.assertEqual(sorted(values['Inclusion_Residual']),
+                         ['Mix.wav', 'Stem1.wav', 'Stem3.wav'])
+        self.assertEqual(values['Offset_ms']['Stem1.wav'], 0.0)
+        table = validation.result_table.ResultTable.from_file_status(
+            file_status, values
+        )
+        self.assertEqual(table.to_file_status(), file_status)
+
+    def test_values_cached(self):
+        tmpdir = tempfile.mkdtemp()
+        cache = result_cache.ResultCache(os.path.join(tmpdir, 'cache.db'))
+        try:
+            expected = {}
+            validation.check_multitrack(
+                RAW_FILES_LIST, [STEM_INPUT1, STEM_INPUT3], VALID_MIX,
+                VALID_RAW_INFO, cache=cache, values=expected
+            )
+            actual = {}
+            with mock.patch.object(validation, 'alignment_table') as table:
+                validation.check_multitrack(
+                    RAW_FILES_LIST, [STEM_INPUT1, STEM_INPUT3], VALID_MIX,
+                    VALID_RAW_INFO, cache=cache, values=actual
+                )
+        finally:
+            cache.close()
+            shutil.rmtree(tmpdir)
+        self.assertFalse(table.called)
+        self.assertEqual(actual['Offset_ms'], expected['Offset_ms'])
+
+    def test_group_raws(self):
+        actual = validation.group_raws(VALID_RAW_INFO)
+        expected = {
+            'Stem1.wav': [RAW_INPUT1, RAW_INPUT3],
+            'Stem3.wav': [RAW_INPUT2, RAW_INPUT4_1, RAW_INPUT4_2],
+        }
+        self.assertEqual(actual, expected)
+
+
+class TestLabelCheck(unittest.TestCase):
+
+    def test_valid_labels(self):
+        label_dict, match_dict = validation.label_check(
+            VALID_STEM_INFO, VALID_RAW_INFO
+        )
+        self.assertTrue(all(label_dict.values()))
+        self.assertEqual(len(label_dict), 7)
+        self.assertTrue(all(match_dict.values()))
+
+    def test_invalid_labels(self):
+        stem_info = {
+            'Stem1.wav': {'inst': 'violin', 'group': 'electric'},
+            'Stem3.wav': {'inst': 'Main System', 'group': 'Main System'},
+        }
+        raw_info = {
+            'Raw1.wav': {'inst': 'kazoo', 'stem': 'Stem1.wav'},
+            'Raw2.wav': {'inst': 'darbuka', 'stem': 'Stem1.wav'},
+            'Raw3.wav': {'inst': 'darbuka', 'stem': 'Stem3.wav'},
+            'Raw4.wav': {'inst': 'darbuka', 'stem': 'Stem9.wav'},
+            'Raw5.wav': {'inst': 'Main System', 'stem': 'Stem3.wav'},
+            'Raw6.wav': {'inst': 'Main System', 'stem': 'Stem1.wav'},
+        }
+        label_dict, match_dict = validation.label_check(stem_info, raw_info)
+        self.assertEqual(label_dict, {
+            'Stem1.wav': False, 'Stem3.wav': True, 'Raw1.wav': False,
+            'Raw2.wav': True, 'Raw3.wav': True, 'Raw4.wav': True,
+            'Raw5.wav': True, 'Raw6.wav': True,
+        })
+        self.assertEqual(match_dict, {
+            'Raw1.wav': None, 'Raw2.wav': False, 'Raw3.wav': True,
+            'Raw4.wav': False, 'Raw5.wav': True, 'Raw6.wav': False,
+        })
+
+    def test_check_multitrack(self):
+        stem_info = dict(VALID_STEM_INFO)
+        stem_info['Stem3.wav'] = {'inst': 'violin'}
+        actual = validation.check_multitrack(
+            RAW_FILES_LIST, [STEM_INPUT1, STEM_INPUT3], VALID_MIX,
+            VALID_RAW_INFO, stem_info=stem_info
+        )
+        self.assertTrue(actual['Stem3.wav']['Instrument_Label'])
+        self.assertFalse(actual['Raw2.wav']['Raws_Match_Stems'])
+        self.assertTrue(actual['Raw1.wav']['Raws_Match_Stems'])
+
+
+class TestDecodeCount(unittest.TestCase):
+
+    def setUp(self):
+        audio_io.clear_cache()
+        audio_io.clear_pyramids()
+
+    def tearDown(self):
+        tracing.stop_tracing()
+        audio_io.clear_pyramids()
+
+    def test_check_multitrack_decodes(self):
+        raw_files = RAW_FILES_LIST
+        stem_files = [STEM_INPUT1, STEM_INPUT3]
+        mix_path = VALID_MIX
+        raw_info = VALID_RAW_INFO
+        all_files = raw_files + stem_files + [mix_path]
+
+        tracer = tracing.start_tracing()
+        validation.check_multitrack(raw_files, stem_files, mix_path, raw_info)
+        tracing.stop_tracing()
+        summary = tracer.summary()
+
+        # each file is decoded in full once, for its pyramid; alignment and
+        # inclusion run once per target and otherwise read short windows
+        self.assertEqual(summary['compute_pyramid']['calls'], len(all_files))
+        self.assertEqual(
+            summary['compute_pyramid']['bytes_read'],
+            sum(audio_io.probe(f)['data_size'] for f in all_files)
+        )
+        # every file against its reference in one batch, then the sums of
+        # the groups holding a file whose own offset is ambiguous: the raws
+        # against the mix and Stem3's raws against Stem3
+        self.assertEqual(summary['measure_alignment']['calls'], 2)
+        self.assertEqual(summary['alignment_table']['calls'], 1)
+        self.assertEqual(summary['refine_coeffs']['calls'], len(stem_files) + 1)
+        # nothing else reads samples
+        total = tracer.records[-1]['bytes_read']
+        self.assertEqual(total, sum(
+            summary[check]['bytes_read'] for check in
+            ['compute_pyramid', 'measure_alignment', 'coeff_equations']
+        ))
+
+
 # We also need a check audio/check multitrack test...TBD it will be slow.ste
\ No newline at end of file